@@ -4,19 +4,26 @@ Provides a user-friendly web interface for disaster reporting, aid requests,
 and mental health support.
 """
 
+import atexit
 import os
 import sys
 import json
 import subprocess
 import importlib
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+import threading
+import uuid
+from flask import Flask, Response, render_template, request, jsonify, session, redirect, stream_with_context, url_for
 from datetime import datetime, timedelta
 
 sys.path.append('src')
-from storage import Storage
+from storage import create_storage
 from trucks import Truck
+from dispatch import DispatchEngine
 from help_stations import HelpStation
-from report_utils import geocode
+from geocode_queue import GeocodeQueue
+from report_import import guess_format, parse_report_rows
+from triage import scan as triage_scan
+from utils import env_flag
 
 # Import mental health AI
 try:
@@ -24,14 +31,44 @@ try:
 except Exception:
     mental_health_ai = None
 
+# Each browser session gets its own bounded chat memory; CHAT_MEMORY_DIR keeps idle ones on disk
+chat_memory = None
+if mental_health_ai is not None:
+    chat_memory = mental_health_ai.MemoryStore(spill_dir=os.environ.get('CHAT_MEMORY_DIR') or None)
+    # live sessions are spilled too when the server stops
+    atexit.register(chat_memory.flush)
+
 # Initialize Flask app
 app = Flask(__name__)
 app.secret_key = 'aid-dispatch-secret-key-2025'
 
-# Initialize persistent storage
-storage = Storage('data/storage.json')
-trucks = Truck()
-help_stations = HelpStation()
+# Initialize persistent storage. The engine is chosen by STORAGE_BACKEND (json or sqlite);
+# STORAGE_JOURNAL=1 makes the JSON backend append changes to a log instead of rewriting the file.
+# STORAGE_SHARED=1 coordinates the JSON files between several worker processes.
+storage = create_storage()
+# coordinates in the web app are geocoded (lat, lon), so distances are great-circle km;
+# fleet state survives restarts and every dispatch is kept in data/fleet.json.log.
+# The console app (main.py) uses the same fleet file, so it is always opened shared.
+trucks = Truck(metric='haversine', persistence_file='data/fleet.json', shared=True)
+help_stations = HelpStation(shared=env_flag('STORAGE_SHARED'), metric='haversine')
+dispatcher = DispatchEngine(storage, trucks, help_stations)
+# Reports are stored right away and geocoded in the background (pending ones resume on restart).
+# The workers start with the first request, so the debug reloader's watcher process
+# (which imports this module but never serves) does not run a second queue.
+geocode_queue = GeocodeQueue(storage)
+geocode_queue_started = False
+geocode_queue_lock = threading.Lock()
+
+
+@app.before_request
+def start_geocode_queue():
+    global geocode_queue_started
+    if geocode_queue_started:
+        return
+    with geocode_queue_lock:
+        if not geocode_queue_started:
+            geocode_queue.start()
+            geocode_queue_started = True
 
 # Seed trucks if needed
 if not trucks.trucks:
@@ -68,6 +105,8 @@ def login():
 @app.route('/logout')
 def logout():
     """Log out the user."""
+    if chat_memory is not None and 'chat_id' in session:
+        chat_memory.discard(session['chat_id'])
     session.clear()
     return redirect(url_for('index'))
 
@@ -97,50 +136,59 @@ def file_report():
     city = data.get('city', '')
     country = data.get('country', '')
     
-    # Attempt geocoding
-    coords = geocode(None, address, city, country)
-    
-    if coords:
-        lat, lon, display = coords
-        details_with_location = f"{details} | location_resolved: {display} | lat:{lat} lon:{lon}"
-    else:
-        details_with_location = details
-    
-    storage.add_report(user_name, disaster_type, details_with_location)
+    # Geocoding happens in the background; the report starts out as 'pending location'
+    location_query = {'street': address, 'city': city, 'country': country}
+    report_id = storage.add_report(user_name, disaster_type, details, location_query=location_query)
+    report = storage.get_report(report_id)
+    if report['location_status'] == 'pending':
+        geocode_queue.submit(report_id, location_query)
     
-    return jsonify({'success': True, 'message': 'Report filed successfully.'})
+    # one-pass triage of the free text, so crisis language or other hazards get noticed
+    signals = triage_scan(details)
+    return jsonify({'success': True, 'message': 'Report filed successfully.', 'id': report_id,
+                    'location_status': report['location_status'],
+                    'triage': {'crisis': signals.crisis, 'disasters': signals.disasters,
+                               'losses': len(signals.losses)}})
 
 @app.route('/api/request-aid', methods=['POST'])
 def request_aid():
-    """Request aid supplies."""
+    """Request aid supplies; the closest free truck is sent when lat/lon are given."""
     data = request.json
-    user_name = session.get('user_name', 'User')
     supply = data.get('supply', '').lower()
-    quantity = int(data.get('quantity', 1))
-    
-    # Check inventory
-    available = storage.check_inventory(supply)
-    if quantity > available:
-        return jsonify({'success': False, 'message': f'Only {available} available.'}), 400
-    
-    # Find available truck
-    available_truck = None
-    for name, avail in trucks.trucks.items():
-        if avail:
-            available_truck = name
-            break
-    
-    if not available_truck:
-        return jsonify({'success': False, 'message': 'No trucks available.'}), 400
+    try:
+        quantity = int(data.get('quantity', 1))
+        location = None
+        if data.get('lat') is not None and data.get('lon') is not None:
+            location = (float(data['lat']), float(data['lon']))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'Invalid quantity or location.'}), 400
     
-    # Dispatch truck and remove supplies
-    trucks.dispatch_truck(available_truck)
-    storage.remove_supplies(supply, quantity)
+    # Reserve the supplies and claim the nearest available truck in one step
+    result = dispatcher.request_aid(supply, quantity, location, requester=session.get('user_name'))
+    if not result['success']:
+        return jsonify(result), 400
     
     unit = SUPPLY_CATEGORIES.get(supply, '')
-    message = f"{available_truck} dispatched with {quantity} {unit} of {supply}."
+    if not result['queued']:
+        result['message'] = f"{result['truck']} dispatched with {quantity} {unit} of {supply}."
     
-    return jsonify({'success': True, 'message': message})
+    return jsonify(result)
+
+@app.route('/api/dispatch/<int:request_id>', methods=['GET'])
+def dispatch_status(request_id):
+    """Status of an aid request (queued requests are assigned as trucks return)."""
+    result = dispatcher.request_status(request_id)
+    if result is None:
+        return jsonify({'success': False, 'message': 'Unknown request.'}), 404
+    return jsonify(result)
+
+@app.route('/api/dispatch/<int:request_id>', methods=['DELETE'])
+def cancel_dispatch(request_id):
+    """Withdraw a queued aid request; its reserved supplies go back into stock."""
+    result = dispatcher.cancel_request(request_id)
+    if result is None:
+        return jsonify({'success': False, 'message': 'Request is not waiting for a truck.'}), 404
+    return jsonify(result)
 
 @app.route('/api/available-supplies', methods=['GET'])
 def available_supplies():
@@ -199,9 +247,62 @@ def inventory():
 
 @app.route('/api/reports', methods=['GET'])
 def get_reports():
-    """Get all disaster reports."""
-    reports = storage.get_reports()
-    return jsonify(reports)
+    """Get one page of disaster reports.
+
+    Query parameters: disaster_type, reporter, since/until (ISO-8601, until exclusive),
+    bbox=min_lat,min_lon,max_lat,max_lon, order=asc|desc, limit (1-500, default 50)
+    and cursor (the next_cursor returned with the previous page).
+    """
+    args = request.args
+    try:
+        limit = min(max(int(args.get('limit', 50)), 1), 500)
+        bbox = None
+        if args.get('bbox'):
+            bbox = tuple(float(v) for v in args['bbox'].split(','))
+            if len(bbox) != 4:
+                raise ValueError('bbox needs four numbers: min_lat,min_lon,max_lat,max_lon')
+        reports, next_cursor = storage.query_reports(
+            disaster_type=args.get('disaster_type') or None,
+            reporter=args.get('reporter') or None,
+            since=args.get('since') or None,
+            until=args.get('until') or None,
+            bbox=bbox,
+            cursor=args.get('cursor') or None,
+            limit=limit,
+            newest_first=args.get('order') == 'desc',
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify({'reports': reports, 'next_cursor': next_cursor})
+
+@app.route('/api/import-reports', methods=['POST'])
+def import_reports():
+    """Bulk-import reports from an uploaded CSV or JSONL file (or the raw request body).
+
+    All rows are stored in one transaction; addresses are geocoded in the background.
+    """
+    upload = request.files.get('file')
+    if upload is not None:
+        raw = upload.read()
+        fmt = request.args.get('format') or guess_format(upload.filename, upload.mimetype)
+    else:
+        raw = request.get_data()
+        fmt = request.args.get('format') or guess_format(None, request.content_type)
+    try:
+        # uploads and raw bodies alike must be UTF-8 (a BOM is allowed)
+        text = raw.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        return jsonify({'success': False, 'message': 'File must be UTF-8 encoded text.'}), 400
+    try:
+        rows = parse_report_rows(text, fmt)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    ids = storage.add_reports(rows)
+    jobs = [(report_id, row['location_query']) for report_id, row in zip(ids, rows)
+            if storage.get_report(report_id).get('location_status') == 'pending']
+    if jobs:
+        geocode_queue.submit_batch(jobs)
+    return jsonify({'success': True, 'imported': len(ids), 'ids': ids, 'pending_locations': len(jobs)})
 
 @app.route('/api/delete-report/<int:report_id>', methods=['POST'])
 def delete_report(report_id):
@@ -210,6 +311,20 @@ def delete_report(report_id):
         return jsonify({'success': True})
     return jsonify({'success': False}), 404
 
+@app.route('/api/fleet-status', methods=['GET'])
+def fleet_status():
+    """Truck availability, utilization and the number of requests waiting for a truck."""
+    return jsonify(dispatcher.stats())
+
+@app.route('/api/return-truck/<name>', methods=['POST'])
+def return_truck(name):
+    """Mark a truck as back before its scheduled return."""
+    if name not in trucks.trucks:
+        return jsonify({'success': False}), 404
+    trucks.return_truck(name)
+    dispatcher.poll()
+    return jsonify({'success': True})
+
 @app.route('/api/add-station', methods=['POST'])
 def add_station():
     """Add a help station."""
@@ -240,12 +355,13 @@ def get_stations():
 
 @app.route('/api/mental-health/check', methods=['GET'])
 def check_mental_health():
-    """Check if mental health AI is configured."""
+    """Check if mental health support is available and whether the OpenAI key is configured."""
     if mental_health_ai is None:
         return jsonify({'configured': False, 'available': False})
     
+    # without a key the offline responder still answers
     configured = mental_health_ai.is_configured()
-    return jsonify({'configured': configured, 'available': True})
+    return jsonify({'configured': configured, 'available': mental_health_ai.is_available()})
 
 @app.route('/api/mental-health/configure', methods=['POST'])
 def configure_mental_health():
@@ -286,8 +402,8 @@ def configure_mental_health():
 @app.route('/api/mental-health/message', methods=['POST'])
 def mental_health_message():
     """Send a message to the mental health AI."""
-    if mental_health_ai is None or not mental_health_ai.is_configured():
-        return jsonify({'success': False, 'message': 'AI not configured.'}), 400
+    if mental_health_ai is None or not mental_health_ai.is_available():
+        return jsonify({'success': False, 'message': 'Mental health support is not available.'}), 400
     
     data = request.json
     user_message = data.get('message', '').strip()
@@ -295,14 +411,39 @@ def mental_health_message():
     if not user_message:
         return jsonify({'success': False, 'message': 'Message required.'}), 400
     
+    if 'chat_id' not in session:
+        session['chat_id'] = uuid.uuid4().hex
+    memory = chat_memory.get(session['chat_id'])
+    user_name = session.get('user_name', 'User')
+    if data.get('stream'):
+        return Response(stream_with_context(_stream_mental_health(user_message, memory, user_name)),
+                        mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
     try:
-        reply = mental_health_ai.update_memory_with_gpt(user_message)
-        user_name = session.get('user_name', 'User')
+        reply = mental_health_ai.update_memory_with_gpt(user_message, memory)
         storage.add_report(user_name, 'mental_support', f"user: {user_message} | response: {reply}")
         return jsonify({'success': True, 'message': reply})
     except Exception as e:
         return jsonify({'success': False, 'message': f'Error: {str(e)}'}), 400
 
+def _sse(event: str, payload: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+def _stream_mental_health(user_message, memory, user_name):
+    """Server-Sent Events: a 'delta' event per piece of the reply, then 'done' with the whole reply."""
+    # an initial comment line gets the response headers to the browser right away
+    yield ": stream open\n\n"
+    pieces = []
+    try:
+        for piece in mental_health_ai.stream_memory_reply(user_message, memory):
+            pieces.append(piece)
+            yield _sse('delta', {'text': piece})
+        reply = ''.join(pieces).strip()
+        storage.add_report(user_name, 'mental_support', f"user: {user_message} | response: {reply}")
+        yield _sse('done', {'success': True, 'message': reply})
+    except Exception as e:
+        yield _sse('done', {'success': False, 'message': f'Error: {str(e)}'})
+
 # ============ ERROR HANDLERS ============
 
 @app.errorhandler(404)
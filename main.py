@@ -9,8 +9,9 @@ def main():
     import json
     import sys
     sys.path.append('src')  # Add src directory to Python path
-    from storage import Storage
+    from storage import create_storage
     from trucks import Truck
+    from dispatch import DispatchEngine
     from help_stations import HelpStation
     from report_utils import geocode
     # mental health module (optional)
@@ -18,8 +19,7 @@ def main():
         import mental_health_ai
     except Exception:
         mental_health_ai = None
-    from typing import List, Dict, Tuple, Optional
-    import re
+    from typing import List, Dict, Tuple
     import subprocess
     import importlib
 
@@ -43,14 +43,16 @@ def main():
         """Return list of (name, unit) tuples for supplies."""
         return [(name, unit or '') for name, unit in SUPPLY_CATEGORIES.items()]
 
-    # Use persistent storage so supplies survive program restarts
-    storage = Storage('data/storage.json')
-    trucks = Truck()
+    # Use persistent storage so supplies survive program restarts (backend set by STORAGE_BACKEND)
+    storage = create_storage()
+    trucks = Truck(persistence_file='data/fleet.json', shared=True)
     help_stations = HelpStation()
+    dispatcher = DispatchEngine(storage, trucks, help_stations)
 
-    # Seed some trucks
-    for i in range(1, 6):
-        trucks.add_truck(f"Truck {i}")
+    # Seed some trucks (busy ones stay out across restarts)
+    if not trucks.trucks:
+        for i in range(1, 6):
+            trucks.add_truck(f"Truck {i}")
 
 
     # Authentication flow: ask for gov password; blank or incorrect => non-gov
@@ -144,54 +146,17 @@ def main():
                             print("No reports available.")
                         else:
                             print("\nSaved disaster reports:")
-                            for i, r in enumerate(reports, start=1):
-                                # Show reporter, type, parsed details, resolved address and coordinates if available
+                            for r in reports:
+                                # Show reporter, type, details, resolved address and coordinates if available
                                 name = r.get('name', 'Unknown')
                                 dtype = r.get('disaster_type', 'Unknown')
-                                details_raw = r.get('details', '') or ''
-
-                                def _extract_location_from_details(details: str) -> Tuple[Optional[str], Optional[float], Optional[float]]:
-                                    if not details:
-                                        return None, None, None
-                                    addr = None
-                                    lat = None
-                                    lon = None
-                                    if "location_resolved:" in details:
-                                        try:
-                                            addr_part = details.split("location_resolved:", 1)[1]
-                                            addr = addr_part.split("|", 1)[0].strip()
-                                            if addr == "":
-                                                addr = None
-                                        except Exception:
-                                            addr = None
-                                    mlat = re.search(r"lat:\s*([\-\d\.]+)", details)
-                                    mlon = re.search(r"lon:\s*([\-\d\.]+)", details)
-                                    try:
-                                        if mlat:
-                                            lat = float(mlat.group(1))
-                                    except Exception:
-                                        lat = None
-                                    try:
-                                        if mlon:
-                                            lon = float(mlon.group(1))
-                                    except Exception:
-                                        lon = None
-                                    return addr, lat, lon
-
-                                def _extract_description_from_details(details: str) -> str:
-                                    if not details:
-                                        return ""
-                                    if "location_resolved:" in details:
-                                        return details.split("location_resolved:", 1)[0].rstrip(" |").strip()
-                                    return details.strip()
-
-                                description = _extract_description_from_details(details_raw)
-                                addr, lat, lon = _extract_location_from_details(details_raw)
+                                description = r.get('details', '') or ''
+                                addr, lat, lon = r.get('resolved_address'), r.get('lat'), r.get('lon')
                                 addr_display = addr or 'Address unknown'
                                 lat_display = lat if lat is not None else 'N/A'
                                 lon_display = lon if lon is not None else 'N/A'
 
-                                print(f"{i}. Reporter: {name}")
+                                print(f"#{r.get('id')} Reporter: {name}")
                                 print(f"   Type   : {dtype}")
                                 print(f"   Details: {description}")
                                 print(f"   Address: {addr_display}")
@@ -205,17 +170,17 @@ def main():
                             continue
                             
                         print("\nCurrent reports:")
-                        for i, r in enumerate(reports, start=1):
-                            print(f"{i}. {r.get('timestamp')} - {r.get('name')} - {r.get('disaster_type')}")
+                        for r in reports:
+                            print(f"#{r.get('id')} {r.get('timestamp')} - {r.get('name')} - {r.get('disaster_type')}")
                         
                         try:
-                            index = int(input("\nEnter report number to delete (0 to cancel): ").strip())
-                            if index == 0:
+                            report_id = int(input("\nEnter report ID to delete (0 to cancel): ").strip())
+                            if report_id == 0:
                                 continue
-                            if storage.delete_report(index):
+                            if storage.delete_report(report_id):
                                 print("Report deleted successfully.")
                             else:
-                                print("Invalid report number.")
+                                print("No report with that ID.")
                         except ValueError:
                             print("Invalid input. Please enter a number.")
                     
@@ -283,8 +248,7 @@ def main():
                 print("Thank you — your report has been saved and will be visible to government users.")
             else:
                 lat, lon, display = coords
-                details_with_location = f"{details} | location_resolved: {display} | lat:{lat} lon:{lon}"
-                storage.add_report(user_name, disaster_type, details_with_location)
+                storage.add_report(user_name, disaster_type, details, lat=lat, lon=lon, resolved_address=display)
                 print("Thank you — your report has been saved (address resolved) and will be visible to government users.")
 
         # For non-government users: do not ask for latitude/longitude.
@@ -339,32 +303,20 @@ def main():
                             print("Invalid input. Please enter a number.")
                             continue
                     
-                    # Find available truck
-                    available_truck = None
-                    for name, available in trucks.trucks.items():
-                        if available:
-                            available_truck = name
-                            break
-
-                    if available_truck:
-                        trucks.dispatch_truck(available_truck)
-                        try:
-                            # Double check the current inventory before removing
-                            current_quantity = storage.check_inventory(supply)
-                            if quantity > current_quantity:
-                                print(f"Sorry, only {current_quantity} {unit} of {supply} available now.")
-                                continue
-                                
-                            storage.remove_supplies(supply, quantity)
-                            if supply == 'medical':
-                                print(f"{available_truck} has been dispatched with medical supplies to {user_name}'s location.")
-                            else:
-                                print(f"{available_truck} has been dispatched with {quantity} {unit} of {supply} to {user_name}'s location.")
-                        except ValueError as e:
-                            print(f"Error: {str(e)}")
-                            continue
-                    else:
+                    # Reserve the supplies and send the first available truck
+                    result = dispatcher.request_aid(supply, quantity, requester=user_name)
+                    if result['success'] and result['queued']:
+                        print(f"All trucks are out; your request is queued (position {result['queue_position']}).")
+                    elif result['success']:
+                        if supply == 'medical':
+                            print(f"{result['truck']} has been dispatched with medical supplies to {user_name}'s location.")
+                        else:
+                            print(f"{result['truck']} has been dispatched with {quantity} {unit} of {supply} to {user_name}'s location.")
+                    elif result['reason'] == 'no_truck':
                         print("No trucks available to dispatch at the moment.")
+                    else:
+                        print(f"Sorry, {result['message'].lower()}")
+                        continue
                     
                     # Ask if they want to request more
                     more = input("\nWould you like to request more supplies? (y/n): ").strip().lower()
@@ -401,10 +353,10 @@ def main():
 
                 if not configured:
                     # Prompt user for API key once, then automatically persist to local .env
-                    key = input("Mental health AI is not configured. Enter your OpenAI API key (or leave blank to cancel): ").strip()
+                    key = input("Mental health AI is not configured. Enter your OpenAI API key (or leave blank for offline replies): ").strip()
                     if not key:
-                        print("No key entered — returning to menu.")
-                        continue
+                        print("No key entered — replies will come from the offline responder.")
+                if not configured and key:
                     try:
                         # Automatically set session env var and write a local .env (gitignored)
                         # Set API key for this session only (do NOT write to disk)
@@ -2,7 +2,20 @@ import os
 import sys
 import json
 import re
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timezone
+from typing import Callable, Dict, Iterator, List, Optional
+
+try:
+    from src.triage import DISASTER_ADVICE, Signals, scan
+    from src.utils import atomic_write_json
+except ImportError:
+    from triage import DISASTER_ADVICE, Signals, scan
+    from utils import atomic_write_json
 
 # Load optional .env for local keys (python-dotenv optional)
 try:
@@ -31,6 +44,10 @@ except Exception:
 
 # Read API key from environment if present
 api_key = os.environ.get("OPENAI_API_KEY")
+# OpenAI-compatible endpoint to talk to instead of api.openai.com (e.g. a proxy or a local test server)
+base_url = os.environ.get("OPENAI_BASE_URL") or None
+# seconds to wait for the API before answering from the offline responder instead
+CHAT_TIMEOUT = float(os.environ.get("MENTAL_HEALTH_TIMEOUT", "15"))
 
 # OpenAI client placeholder
 client = None
@@ -85,7 +102,7 @@ def _init_client_from_key(key: str):
     # New SDK (OpenAI class)
     if NEW_SDK:
         try:
-            client = OpenAI(api_key=key)
+            client = OpenAI(api_key=key, base_url=base_url, timeout=CHAT_TIMEOUT, max_retries=1)
             return True
         except Exception:
             client = None
@@ -96,6 +113,8 @@ def _init_client_from_key(key: str):
         try:
             # set api key on module and treat module as client placeholder
             _legacy_openai.api_key = key
+            if base_url:
+                _legacy_openai.api_base = base_url
             client = _legacy_openai
             return True
         except Exception:
@@ -114,7 +133,7 @@ CRISIS_RESPONSE = (
 )
 
 # --- MEMORY STORAGE ---
-memory = {
+MEMORY_TEMPLATE = {
     "user_name": None,
     "pronouns": None,
     "age": None,
@@ -131,9 +150,135 @@ memory = {
     "conversation_history": [],
     "preferences": {"tone": None, "topics_to_avoid": [], "favorites": []},
     "crisis_info": {},
-    "disasters": []
+    "disasters": [],
+    "summary": ""
 }
 
+# hard caps so a session's memory (and the prompt built from it) stays small;
+# lists keep their newest entries, dicts their most recently added keys
+MAX_LIST_ITEMS = 20
+MAX_DICT_ITEMS = 20
+MAX_HISTORY_ITEMS = 12
+
+
+def new_memory() -> Dict:
+    """A fresh, empty memory for one conversation."""
+    return copy.deepcopy(MEMORY_TEMPLATE)
+
+
+def _cap(value, template):
+    if isinstance(template, list):
+        return list(value)[-MAX_LIST_ITEMS:] if isinstance(value, list) else []
+    if isinstance(template, dict):
+        if not isinstance(value, dict):
+            return copy.deepcopy(template)
+        if template:
+            # fixed-shape section such as preferences
+            return {k: _cap(value.get(k, v), v) for k, v in template.items()}
+        return dict(list(value.items())[-MAX_DICT_ITEMS:])
+    return value if value is None or isinstance(value, (str, int, float, bool)) else str(value)
+
+
+def cap_memory(memory: Dict) -> Dict:
+    """Trim memory in place to the template's keys and the size caps."""
+    for key in list(memory):
+        if key not in MEMORY_TEMPLATE:
+            del memory[key]
+    for key, template in MEMORY_TEMPLATE.items():
+        memory[key] = _cap(memory.get(key, copy.deepcopy(template)), template)
+    memory["conversation_history"] = memory["conversation_history"][-MAX_HISTORY_ITEMS:]
+    return memory
+
+
+class MemoryStore:
+    """Conversation memories keyed by session id, bounded in count and size.
+
+    At most max_sessions memories are kept, least recently used first out, and
+    sessions idle for more than idle_timeout seconds are dropped. With spill_dir,
+    evicted memories are written there as JSON and read back (and removed) when
+    the session returns, so only live sessions take up process memory.
+    """
+
+    def __init__(self, max_sessions: int = 1000, idle_timeout: Optional[float] = 3600.0,
+                 spill_dir: Optional[str] = None, clock: Callable[[], float] = time.monotonic):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.spill_dir = spill_dir
+        self._clock = clock
+        # session id -> (last used, memory), least recently used first
+        self._sessions: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _spill_path(self, session_id: str) -> str:
+        # session ids come from clients; hash them into safe file names
+        return os.path.join(self.spill_dir, hashlib.sha256(session_id.encode('utf-8')).hexdigest() + '.json')
+
+    def _spill(self, session_id: str, memory: Dict):
+        if not self.spill_dir:
+            return
+        try:
+            atomic_write_json(self._spill_path(session_id), memory, indent=None)
+        except Exception:
+            pass
+
+    def _unspill(self, session_id: str) -> Optional[Dict]:
+        if not self.spill_dir:
+            return None
+        path = self._spill_path(session_id)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                memory = json.load(f)
+            os.remove(path)
+        except Exception:
+            return None
+        return cap_memory(memory) if isinstance(memory, dict) else None
+
+    def _evict(self, now: float):
+        while self._sessions:
+            session_id, (last_used, memory) = next(iter(self._sessions.items()))
+            idle = self.idle_timeout is not None and now - last_used > self.idle_timeout
+            if len(self._sessions) <= self.max_sessions and not idle:
+                break
+            del self._sessions[session_id]
+            self._spill(session_id, memory)
+
+    def get(self, session_id: str) -> Dict:
+        """The session's memory, created (or read back from spill_dir) if needed."""
+        with self._lock:
+            now = self._clock()
+            entry = self._sessions.pop(session_id, None)
+            memory = entry[1] if entry else self._unspill(session_id)
+            if memory is None:
+                memory = new_memory()
+            self._sessions[session_id] = (now, memory)
+            self._evict(now)
+            return memory
+
+    def discard(self, session_id: str):
+        """Forget a session, including any spilled copy."""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            if self.spill_dir:
+                try:
+                    os.remove(self._spill_path(session_id))
+                except OSError:
+                    pass
+
+    def flush(self):
+        """Spill every live session (e.g. at shutdown)."""
+        with self._lock:
+            for session_id, (_, memory) in self._sessions.items():
+                self._spill(session_id, memory)
+
+
+# memory of the single-user command-line companion (main()); the web app uses a MemoryStore
+memory = new_memory()
+
 # --- HELPERS ---
 def extract_time_from_text(text: str):
     try:
@@ -142,51 +287,42 @@ def extract_time_from_text(text: str):
     except Exception:
         return None
 
-def update_disasters(user_input: str):
-    disasters_keywords = {
-        "earthquake": "Drop, cover, and hold on. Stay away from windows and heavy objects.",
-        "fire": "Stay low to avoid smoke, exit immediately if safe, and call emergency services.",
-        "tornado": "Go to a safe room or basement. Avoid windows and stay sheltered.",
-        "flood": "Move to higher ground immediately and avoid walking or driving in floodwaters.",
-        "hurricane": "Follow evacuation orders and stay indoors away from windows.",
-        "storm": "Stay indoors and away from tall objects, trees, and metal structures.",
-        "tsunami": "Move to higher ground and follow evacuation routes."
-    }
-    text = user_input.lower()
-    for disaster, advice in disasters_keywords.items():
-        if disaster in text and not any(d.get("type") == disaster for d in memory["disasters"]):
-            memory["disasters"].append({
+def update_disasters(user_input: str, mem: Optional[Dict] = None, signals: Optional[Signals] = None):
+    mem = memory if mem is None else mem
+    signals = scan(user_input) if signals is None else signals
+    for disaster in signals.disasters:
+        if not any(d.get("type") == disaster for d in mem["disasters"]):
+            mem["disasters"].append({
                 "type": disaster,
                 "timestamp": datetime.now(timezone.utc).isoformat(),
-                "advice": advice
+                "advice": DISASTER_ADVICE[disaster]
             })
 
-def update_losses_with_time(user_input: str):
-    loss_pattern = r"(my|our)\s+(dad|mom|father|mother|brother|sister|friend|pet)\s*(\w*)\s*(died|passed|lost|killed|gone)"
-    cause_pattern = r"(?:due to|in a|from a|because of|in a)\s+([\w\s]+)"
-    matches = re.findall(loss_pattern, user_input.lower())
-    cause_match = re.search(cause_pattern, user_input.lower())
-    cause = cause_match.group(1) if cause_match else "unknown cause"
-    for match in matches:
-        person_type = match[1]
-        person_name = match[2].capitalize() if match[2] else person_type.capitalize()
-        timestamp = extract_time_from_text(user_input) or datetime.now(timezone.utc).isoformat()
-        exists = any(l.get("person") == person_name and l.get("timestamp") == timestamp for l in memory["losses"])
+def update_losses_with_time(user_input: str, mem: Optional[Dict] = None, signals: Optional[Signals] = None):
+    mem = memory if mem is None else mem
+    signals = scan(user_input) if signals is None else signals
+    if not signals.losses:
+        return
+    cause = signals.cause or "unknown cause"
+    timestamp = extract_time_from_text(user_input) or datetime.now(timezone.utc).isoformat()
+    for person_type, name in signals.losses:
+        person_name = name.capitalize() if name else person_type.capitalize()
+        exists = any(l.get("person") == person_name and l.get("timestamp") == timestamp for l in mem["losses"])
         if not exists:
-            memory["losses"].append({
+            mem["losses"].append({
                 "person": person_name,
                 "cause": cause,
                 "timestamp": timestamp
             })
 
-def check_for_time_question(user_input: str):
-    text = user_input.lower()
-    if "what time" in text or "when" in text:
-        person_match = re.search(r"(my|our)?\s*(mom|dad|father|mother|brother|sister|friend|pet|\w+)", text)
-        person_query = person_match.group(2).capitalize() if person_match else None
-        if memory["losses"]:
+def check_for_time_question(user_input: str, mem: Optional[Dict] = None, signals: Optional[Signals] = None):
+    mem = memory if mem is None else mem
+    signals = scan(user_input) if signals is None else signals
+    if signals.time_question:
+        person_query = signals.time_subject.capitalize() if signals.time_subject else None
+        if mem["losses"]:
             if person_query:
-                for loss in reversed(memory["losses"]):
+                for loss in reversed(mem["losses"]):
                     if loss["person"].lower() == person_query.lower():
                         person = loss["person"]
                         timestamp = loss["timestamp"]
@@ -199,7 +335,7 @@ def check_for_time_question(user_input: str):
                         return f"Your loved one {person} died at {timestamp_str} due to {cause}."
                 return f"I don’t have a recorded time for {person_query}."
             else:
-                latest_loss = memory["losses"][-1]
+                latest_loss = mem["losses"][-1]
                 person = latest_loss.get("person", "they")
                 timestamp = latest_loss.get("timestamp", "an unknown time")
                 cause = latest_loss.get("cause", "unknown cause")
@@ -209,8 +345,8 @@ def check_for_time_question(user_input: str):
                 except Exception:
                     timestamp_str = timestamp
                 return f"Your loved one {person} died at {timestamp_str} due to {cause}."
-        if memory["disasters"]:
-            latest_disaster = memory["disasters"][-1]
+        if mem["disasters"]:
+            latest_disaster = mem["disasters"][-1]
             disaster = latest_disaster.get("type", "the disaster")
             timestamp = latest_disaster.get("timestamp", "an unknown time")
             advice = latest_disaster.get("advice", "")
@@ -244,54 +380,493 @@ def get_chat_completion(system_prompt: str, user_input: str):
                 {"role": "user", "content": user_input}
             ],
             max_tokens=400,
-            temperature=0.7
+            temperature=0.7,
+            request_timeout=CHAT_TIMEOUT
         )
         return resp.choices[0].message.content.strip()
 
+def stream_chat_completion(system_prompt: str, user_input: str) -> Iterator[str]:
+    """get_chat_completion() that yields the reply text piece by piece as it is generated."""
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_input}
+    ]
+    if NEW_SDK:
+        stream = client.chat.completions.create(
+            model="gpt-4o-mini", messages=messages, max_tokens=400, temperature=0.7, stream=True
+        )
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    else:
+        stream = _legacy_openai.ChatCompletion.create(
+            model="gpt-4o-mini", messages=messages, max_tokens=400, temperature=0.7, stream=True,
+            request_timeout=CHAT_TIMEOUT
+        )
+        for chunk in stream:
+            content = chunk["choices"][0]["delta"].get("content")
+            if content:
+                yield content
+
+# --- CHAT BACKENDS ---
+class ChatBackendUnavailable(Exception):
+    """A backend could not answer right now (not configured, network down, timed out, ...)."""
+
+
+class OpenAIBackend:
+    # model replies to generic openers are worth reusing (see ReplyCache)
+    cacheable = True
+
+    def __init__(self, retry_after: float = 60.0, clock: Callable[[], float] = time.monotonic):
+        """The configured OpenAI client (get_chat_completion / stream_chat_completion).
+
+        After a failure the backend reports itself unavailable for retry_after
+        seconds, so later messages go straight to the next backend instead of
+        each waiting out another timeout.
+        """
+        self._retry_after = retry_after
+        self._clock = clock
+        self._down_until = 0.0
+
+    def _check(self):
+        if client is None:
+            raise ChatBackendUnavailable("OpenAI client is not configured")
+        if self._clock() < self._down_until:
+            raise ChatBackendUnavailable("OpenAI recently failed; retrying later")
+
+    def _failed(self, e: Exception) -> ChatBackendUnavailable:
+        self._down_until = self._clock() + self._retry_after
+        print(f"⚠️ Mental health AI error ({type(e).__name__}): {e}")
+        return ChatBackendUnavailable(str(e))
+
+    def complete(self, system_prompt: str, user_input: str, signals: Optional[Signals] = None) -> str:
+        self._check()
+        try:
+            return get_chat_completion(system_prompt, user_input)
+        except Exception as e:
+            raise self._failed(e) from e
+
+    def stream(self, system_prompt: str, user_input: str, signals: Optional[Signals] = None) -> Iterator[str]:
+        self._check()
+        try:
+            yield from stream_chat_completion(system_prompt, user_input)
+        except Exception as e:
+            raise self._failed(e) from e
+
+
+# words that suggest how someone is feeling, for the offline responder
+EMOTION_WORDS = ("sad", "scared", "afraid", "anxious", "angry", "lonely", "tired", "overwhelmed",
+                 "hopeless", "numb", "worried", "stressed")
+
+
+class RuleBasedBackend:
+    """Offline stand-in: a template reply built from the message's triage signals.
+
+    It needs no network, so the chat keeps answering while the API is unreachable.
+    It reports no memory changes; the local disaster and loss tracking still runs.
+    Like the other backends it is handed the turn's signals rather than rescanning.
+    """
+    # a stand-in answer must not outlive the outage that caused it
+    cacheable = False
+
+    def reply(self, user_input: str, signals: Optional[Signals] = None) -> str:
+        signals = scan(user_input) if signals is None else signals
+        parts = []
+        if signals.losses:
+            relation, name = signals.losses[0]
+            who = name.capitalize() if name else f"your {relation}"
+            parts.append(f"I'm so sorry about {who}. Losing someone you love is one of the hardest things there is.")
+        if signals.disasters:
+            disaster = signals.disasters[0]
+            parts.append(f"Going through a {disaster} is frightening. {DISASTER_ADVICE[disaster]}")
+        words = set(re.findall(r"[a-z]+", user_input.lower()))
+        emotion = next((w for w in EMOTION_WORDS if w in words), None)
+        if emotion:
+            parts.append(f"It makes sense to feel {emotion} after what you've been through. "
+                         "Try to take a few slow breaths, and reach out to someone you trust if you can.")
+        if not parts:
+            return FALLBACK_REPLY
+        parts.append("I'm here to listen whenever you want to tell me more.")
+        return " ".join(parts)
+
+    def complete(self, system_prompt: str, user_input: str, signals: Optional[Signals] = None) -> str:
+        return json.dumps({"response": self.reply(user_input, signals)})
+
+    def stream(self, system_prompt: str, user_input: str, signals: Optional[Signals] = None) -> Iterator[str]:
+        yield self.reply(user_input, signals)
+
+
+def default_backends() -> List:
+    """The OpenAI client first, then the offline responder, which always answers."""
+    return [OpenAIBackend(), RuleBasedBackend()]
+
+
+backends = default_backends()
+
+
+def set_backends(chain: List):
+    """Replace the chat backends, tried in order for every message."""
+    global backends
+    backends = list(chain)
+
+
+def is_available() -> bool:
+    """True if some backend can answer; unlike is_configured() this needs no API key."""
+    return bool(backends)
+
+
+# greetings and general questions about the service, answered without any backend
+CANNED_REPLIES = {
+    "hi": "Hi, I'm glad you reached out. How are you feeling right now?",
+    "hello": "Hello, I'm glad you reached out. How are you feeling right now?",
+    "hey": "Hey, I'm glad you reached out. How are you feeling right now?",
+    "who are you": "I'm a support companion for people going through disasters and loss. "
+                   "I can listen, remember what you share with me, and suggest ways to cope. I'm not a therapist.",
+    "what can you do": "I can listen, help you make sense of what you're feeling, share safety advice for "
+                       "disasters, and suggest ways to cope. What's on your mind?",
+    "are you a therapist": "No, I'm not a therapist, but I'm here to listen and support you. "
+                           "If you need professional help, a local crisis line or doctor is a good place to start.",
+    "are you a real person": "I'm an AI support companion, not a person, but I'm here to listen.",
+    "thank you": "You're welcome. I'm here whenever you want to talk.",
+    "thanks": "You're welcome. I'm here whenever you want to talk.",
+}
+# a message with any of these words is about the user, so its reply is never shared
+PERSONAL_WORDS = {"i", "im", "me", "my", "mine", "myself", "we", "our", "us", "ive", "id"}
+
+
+class ReplyCache:
+    def __init__(self, max_entries: int = 256, canned: Optional[Dict[str, str]] = None):
+        """Replies to openers and FAQ-style questions, keyed by normalized message.
+
+        Only short messages with nothing personal in them (no first-person words,
+        no triage signals) are looked up or stored, and only replies produced
+        without any memory in the prompt are stored, so one user's reply is never
+        shown to another. Callers store only replies from a cacheable backend, and
+        FALLBACK_REPLY is never stored. Starts from the canned replies; least recently used
+        learned entries go first once max_entries is reached.
+        """
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, str]" = OrderedDict(CANNED_REPLIES if canned is None else canned)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(message: str, signals: Optional[Signals] = None) -> Optional[str]:
+        """The cache key for message, or None if it must not be cached."""
+        words = re.findall(r"[a-z0-9]+", message.lower().replace("'", ""))
+        if not words or len(words) > 8 or PERSONAL_WORDS.intersection(words):
+            return None
+        signals = scan(message) if signals is None else signals
+        if signals.crisis or signals.disasters or signals.losses or signals.time_question:
+            return None
+        return " ".join(words)
+
+    def get(self, message: str, signals: Optional[Signals] = None) -> Optional[str]:
+        key = self.key(message, signals)
+        if key is None:
+            return None
+        with self._lock:
+            reply = self._entries.get(key)
+            if reply is not None:
+                self._entries.move_to_end(key)
+            return reply
+
+    def put(self, message: str, reply: str, signals: Optional[Signals] = None):
+        key = self.key(message, signals)
+        if key is None or not reply or reply == FALLBACK_REPLY:
+            return
+        with self._lock:
+            self._entries[key] = reply
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+reply_cache = ReplyCache()
+
+# --- PROMPT CONTEXT ---
+# Rough budget for the memory part of the system prompt, in tokens (about 4 characters each)
+PROMPT_TOKEN_BUDGET = int(os.environ.get("MENTAL_HEALTH_PROMPT_TOKENS", "500"))
+MAX_SUMMARY_CHARS = 600
+# history turns are stored shortened; the model only needs their gist
+MAX_TURN_CHARS = 200
+
+# words in a message that make a memory field worth showing the model
+FIELD_KEYWORDS = {
+    "parents": ("mom", "dad", "mother", "father", "parent"),
+    "siblings": ("brother", "sister", "sibling"),
+    "friends": ("friend",),
+    "pets": ("pet", "dog", "cat"),
+    "significant_others": ("partner", "wife", "husband", "girlfriend", "boyfriend"),
+    "losses": ("died", "passed", "lost", "loss", "miss", "grief", "funeral"),
+    "major_events": ("happened", "event", "remember"),
+    "recent_emotions": ("feel", "felt", "sad", "angry", "anxious", "scared", "afraid", "lonely"),
+    "coping_strategies": ("cope", "coping", "calm", "help", "sleep", "breathe"),
+    "crisis_info": ("crisis", "emergency", "safe"),
+    "disasters": ("earthquake", "fire", "tornado", "flood", "hurricane", "storm", "tsunami", "disaster"),
+}
+# too common to tie a message to a stored memory
+COMMON_WORDS = {"the", "and", "you", "was", "but", "for", "not", "are", "her", "his", "she", "him", "our",
+                "had", "has", "can", "how", "why", "who", "all", "any", "did", "get", "got", "one", "out",
+                "see", "too", "now", "that", "this", "with", "have", "what", "when", "they", "them", "there",
+                "about", "just", "like", "from", "been", "were", "would", "could", "really", "feel", "feeling"}
+# always sent when set: short facts that shape every reply
+PROFILE_FIELDS = ("user_name", "pronouns", "age", "location", "preferences")
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+def _mentions(value, words) -> bool:
+    stored = set(re.findall(r"[a-z']{3,}", json.dumps(value, ensure_ascii=False).lower()))
+    return any(w in stored for w in words)
+
+
+def build_context(mem: Dict, user_input: str, budget: Optional[int] = None) -> Dict:
+    """The parts of mem worth sending with user_input, within budget tokens.
+
+    Sections are added in priority order (rolling summary, profile, fields the
+    message is about, recent turns) and dropped or trimmed (oldest items first)
+    once the budget is spent, so the prompt size stays flat however long the
+    conversation gets.
+    """
+    budget = PROMPT_TOKEN_BUDGET if budget is None else budget
+    tokens = set(re.findall(r"[a-z']+", user_input.lower()))
+    words = [w for w in tokens if len(w) >= 3 and w not in COMMON_WORDS]
+    candidates = []
+    if mem.get("summary"):
+        candidates.append(("summary", mem["summary"]))
+    for key in PROFILE_FIELDS:
+        if mem.get(key) and mem[key] != MEMORY_TEMPLATE[key]:
+            candidates.append((key, mem[key]))
+    for key, keywords in FIELD_KEYWORDS.items():
+        value = mem.get(key)
+        # a field is relevant if the message names its topic or something stored in it
+        if value and (tokens.intersection(keywords) or _mentions(value, words)):
+            candidates.append((key, value))
+    if mem.get("conversation_history"):
+        candidates.append(("conversation_history", mem["conversation_history"][-4:]))
+
+    context = {}
+    used = 0
+    for key, value in candidates:
+        cost = estimate_tokens(json.dumps({key: value}, ensure_ascii=False))
+        # lists and name -> details maps can be cut down to their newest entries
+        while used + cost > budget and isinstance(value, (list, dict)) and key != "preferences" and value:
+            value = value[1:] if isinstance(value, list) else dict(list(value.items())[1:])
+            cost = estimate_tokens(json.dumps({key: value}, ensure_ascii=False))
+        if used + cost <= budget and value:
+            context[key] = value
+            used += cost
+    return context
+
+
+def merge_delta(mem: Dict, delta: Dict) -> Dict:
+    """Fold the model's memory changes into mem.
+
+    List fields get new items appended (existing ones are not repeated), dict
+    fields are updated key by key and other fields are replaced. Unknown keys are
+    ignored and the caps of cap_memory() apply afterwards.
+    """
+    for key, value in delta.items():
+        if key not in MEMORY_TEMPLATE or value is None:
+            continue
+        current = mem.get(key)
+        if isinstance(current, list):
+            for item in value if isinstance(value, list) else [value]:
+                if item not in current:
+                    current.append(item)
+        elif isinstance(current, dict) and isinstance(value, dict):
+            if key == "preferences":
+                # fixed sub-fields: same rules one level down
+                for k, v in value.items():
+                    if isinstance(current.get(k), list):
+                        current[k].extend(i for i in (v if isinstance(v, list) else [v]) if i not in current[k])
+                    elif k in current:
+                        current[k] = v
+            else:
+                current.update(value)
+        elif key == "summary" and isinstance(value, str):
+            mem[key] = value[:MAX_SUMMARY_CHARS]
+        elif not isinstance(current, (list, dict)):
+            mem[key] = value
+    return cap_memory(mem)
+
+
+def record_turn(mem: Dict, user_input: str, reply: str):
+    """Append a shortened exchange to the conversation history."""
+    mem["conversation_history"].append({"user": user_input[:MAX_TURN_CHARS], "assistant": reply[:MAX_TURN_CHARS]})
+    cap_memory(mem)
+
+
 # --- UPDATE MEMORY USING GPT ---
-def update_memory_with_gpt(user_input: str) -> str:
-    update_disasters(user_input)
-    update_losses_with_time(user_input)
+# in streamed replies the memory update follows the reply text after this line
+STREAM_MEMORY_MARKER = "@@MEMORY@@"
+FALLBACK_REPLY = "I'm here to listen. Can you tell me more about what's going on?"
 
-    # Crisis check
-    crisis_keywords = ["kill myself", "suicide", "end my life", "want to die", "hurt myself"]
-    if any(k in user_input.lower() for k in crisis_keywords):
-        return CRISIS_RESPONSE
 
-    memory_json = json.dumps(memory, ensure_ascii=False)
-    system_prompt = (
+def build_system_prompt(context: Dict, streaming: bool = False) -> str:
+    """The instructions plus context (from build_context()) for one message."""
+    context_json = json.dumps(context, ensure_ascii=False)
+    fields = ', '.join(k for k in MEMORY_TEMPLATE if k not in ('conversation_history', 'summary'))
+    if streaming:
+        output_format = (
+            "6. First write the reply as plain text. Then, on a new line, write "
+            f"{STREAM_MEMORY_MARKER} followed by valid JSON using double quotes only, in this format: "
+            "{\"memory_delta\": {...}, \"summary\": \"<summary>\"}\n"
+            "Do NOT write anything after the JSON."
+        )
+    else:
+        output_format = (
+            "6. Always return valid JSON using double quotes only, in this format: "
+            "{\"response\": \"<reply_text>\", \"memory_delta\": {...}, \"summary\": \"<summary>\"}\n"
+            "Do NOT return anything outside this JSON structure."
+        )
+    return (
         "You are a compassionate emotional support companion. You help users process grief, trauma, and emotions. "
         "You are not a therapist. If the user mentions self-harm, always return the CRISIS_RESPONSE message.\n\n"
-        f"Current memory (JSON format): {memory_json}\n"
+        f"What you remember that is relevant now (JSON): {context_json}\n"
         "Instructions for GPT:\n"
-        "1. Update the memory based on the user's input.\n"
-        "2. If the user asks about a loved one's name or details, look it up in memory.\n"
-        "3. Generate a compassionate, empathetic reply.\n"
-        "4. Suggest coping strategies if appropriate.\n"
-        "5. Always return valid JSON using double quotes only.\n"
-        "6. The JSON format must be: {\"memory\": <updated_memory_json>, \"response\": \"<reply_text>\"}\n"
-        "Do NOT return anything outside this JSON structure."
+        "1. If the user asks about a loved one's name or details, look it up in what you remember.\n"
+        "2. Generate a compassionate, empathetic reply.\n"
+        "3. Suggest coping strategies if appropriate.\n"
+        f"4. Report only NEW facts from this message in memory_delta, using these fields: {fields}. "
+        "List fields take a list of new items; leave out fields that did not change.\n"
+        "5. Give summary: the running summary of the conversation, updated, in at most two sentences.\n"
+        + output_format
     )
 
-    try:
-        gpt_text = get_chat_completion(system_prompt, user_input)
-        # Parse JSON safely
-        start = gpt_text.find('{')
-        end = gpt_text.rfind('}') + 1
-        if start == -1 or end == -1:
-            print("⚠️ GPT did not return valid JSON:\n", gpt_text)
-            return "I'm here to listen. Can you tell me more about what's going on?"
-        parsed = json.loads(gpt_text[start:end])
-        updated_memory = parsed.get("memory", memory)
+
+def apply_model_update(mem: Dict, parsed: Dict):
+    """Merge the memory_delta and summary of a parsed model reply into mem."""
+    # older prompts had the model echo the whole memory; merge that the same way
+    delta = parsed.get("memory_delta", parsed.get("memory"))
+    if isinstance(delta, dict):
+        merge_delta(mem, delta)
+    if isinstance(parsed.get("summary"), str):
+        merge_delta(mem, {"summary": parsed["summary"]})
+
+
+def _prepare_turn(user_input: str, mem: Dict) -> Signals:
+    """Scan a new message once and make the local memory updates; the rest of the turn reuses the signals."""
+    signals = scan(user_input)
+    update_disasters(user_input, mem, signals)
+    update_losses_with_time(user_input, mem, signals)
+    cap_memory(mem)
+    return signals
+
+
+def stream_memory_reply(user_input: str, mem: Optional[Dict] = None) -> Iterator[str]:
+    """update_memory_with_gpt() that yields the reply as it streams in.
+
+    The memory update the model writes after STREAM_MEMORY_MARKER is held back
+    and merged once the stream ends. A backend that fails before sending anything
+    is skipped for the next one.
+    """
+    mem = memory if mem is None else mem
+    signals = _prepare_turn(user_input, mem)
+    if signals.crisis:
+        yield CRISIS_RESPONSE
+        return
+    cached = reply_cache.get(user_input, signals)
+    if cached:
+        record_turn(mem, user_input, cached)
+        yield cached
+        return
+    context = build_context(mem, user_input)
+    system_prompt = build_system_prompt(context, streaming=True)
+    reply = []
+    pending = ""
+    update_text = None
+    # the backend whose stream finished, if any; only its reply may be cached
+    answered_by = None
+    for backend in backends:
+        try:
+            for piece in backend.stream(system_prompt, user_input, signals=signals):
+                if update_text is not None:
+                    update_text += piece
+                    continue
+                pending += piece
+                at = pending.find(STREAM_MEMORY_MARKER)
+                if at >= 0:
+                    text, update_text = pending[:at], pending[at + len(STREAM_MEMORY_MARKER):]
+                else:
+                    # hold back only a tail that could be the start of the marker
+                    keep = next((n for n in range(min(len(STREAM_MEMORY_MARKER) - 1, len(pending)), 0, -1)
+                                 if STREAM_MEMORY_MARKER.startswith(pending[-n:])), 0)
+                    text, pending = pending[:len(pending) - keep], pending[len(pending) - keep:]
+                if text:
+                    reply.append(text)
+                    yield text
+            if update_text is None and pending:
+                reply.append(pending)
+                yield pending
+            answered_by = backend
+            break
+        except Exception as e:
+            if reply or pending:
+                # cut off mid-reply: keep what the user has already seen
+                print(f"⚠️ Mental health AI stream interrupted ({type(e).__name__}): {e}")
+                break
+    if not reply:
+        reply.append(FALLBACK_REPLY)
+        yield FALLBACK_REPLY
+    reply_text = "".join(reply).strip()
+    if update_text:
+        start = update_text.find('{')
+        end = update_text.rfind('}') + 1
+        try:
+            parsed = json.loads(update_text[start:end])
+            if isinstance(parsed, dict):
+                apply_model_update(mem, parsed)
+        except ValueError:
+            print("⚠️ GPT did not return a valid memory update:\n", update_text)
+    if not context and getattr(answered_by, 'cacheable', False):
+        reply_cache.put(user_input, reply_text, signals)
+    record_turn(mem, user_input, reply_text)
+
+
+def update_memory_with_gpt(user_input: str, mem: Optional[Dict] = None) -> str:
+    """Reply to user_input and update mem (a session's memory; default: the CLI's).
+
+    Common openers come from reply_cache; otherwise the backends are tried in
+    order (by default OpenAI, then the offline responder).
+    """
+    mem = memory if mem is None else mem
+    signals = _prepare_turn(user_input, mem)
+    if signals.crisis:
+        return CRISIS_RESPONSE
+    cached = reply_cache.get(user_input, signals)
+    if cached:
+        record_turn(mem, user_input, cached)
+        return cached
+
+    context = build_context(mem, user_input)
+    system_prompt = build_system_prompt(context)
+
+    for backend in backends:
+        try:
+            gpt_text = backend.complete(system_prompt, user_input, signals=signals)
+            # Parse JSON safely
+            start = gpt_text.find('{')
+            end = gpt_text.rfind('}') + 1
+            if start == -1:
+                print("⚠️ GPT did not return valid JSON:\n", gpt_text)
+                continue
+            parsed = json.loads(gpt_text[start:end])
+        except Exception as e:
+            # Provide a more actionable error message for debugging, then try the next backend.
+            if not isinstance(e, ChatBackendUnavailable):
+                print(f"⚠️ Mental health AI error ({type(e).__name__}): {e}")
+            continue
         reply_text = parsed.get("response", "I'm here to listen. Can you tell me more?")
-        memory.update(updated_memory)
+        apply_model_update(mem, parsed)
+        if not context and getattr(backend, 'cacheable', False):
+            reply_cache.put(user_input, reply_text, signals)
+        record_turn(mem, user_input, reply_text)
         return reply_text
-    except Exception as e:
-        # Provide a more actionable error message for debugging while keeping a gentle fallback for users.
-        err_type = type(e).__name__
-        print(f"⚠️ Mental health AI error ({err_type}): {e}")
-        print("Hint: verify the 'openai' package is installed and that OPENAI_API_KEY is correctly set.")
-        return "I'm here to listen. Can you tell me more about what's going on?"
+    print("Hint: verify the 'openai' package is installed and that OPENAI_API_KEY is correctly set.")
+    return FALLBACK_REPLY
 
 # --- MAIN LOOP ---
 def main():
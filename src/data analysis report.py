@@ -1,5 +1,4 @@
 import json
-import re
 import urllib.parse
 import urllib.request
 from typing import Optional, Tuple, List, Dict
@@ -29,43 +28,6 @@ def geocode(number: Optional[str], street: str, city: str, country: str) -> Opti
         return None
 
 
-def _extract_location_from_details(details: str) -> Tuple[Optional[str], Optional[float], Optional[float]]:
-    if not details:
-        return None, None, None
-    addr = None
-    lat = None
-    lon = None
-    if "location_resolved:" in details:
-        try:
-            addr_part = details.split("location_resolved:", 1)[1]
-            addr = addr_part.split("|", 1)[0].strip()
-            if addr == "":
-                addr = None
-        except Exception:
-            addr = None
-    mlat = re.search(r"lat:\s*([-\d\.]+)", details)
-    mlon = re.search(r"lon:\s*([-\d\.]+)", details)
-    try:
-        if mlat:
-            lat = float(mlat.group(1))
-    except Exception:
-        lat = None
-    try:
-        if mlon:
-            lon = float(mlon.group(1))
-    except Exception:
-        lon = None
-    return addr, lat, lon
-
-
-def _extract_description_from_details(details: str) -> str:
-    if not details:
-        return ""
-    if "location_resolved:" in details:
-        return details.split("location_resolved:", 1)[0].rstrip(" |").strip()
-    return details.strip()
-
-
 def main():
     from storage import Storage
     from trucks import Truck
@@ -185,16 +147,15 @@ def main():
                             print("No reports available.")
                         else:
                             print("\nSaved disaster reports:")
-                            for i, r in enumerate(reports, start=1):
+                            for r in reports:
                                 name = r.get("name", "Unknown")
                                 dtype = r.get("disaster_type", "Unknown")
-                                details_raw = r.get("details", "") or ""
-                                description = _extract_description_from_details(details_raw)
-                                addr, lat, lon = _extract_location_from_details(details_raw)
+                                description = r.get("details", "") or ""
+                                addr, lat, lon = r.get("resolved_address"), r.get("lat"), r.get("lon")
                                 addr_display = addr or "Address unknown"
                                 lat_display = lat if lat is not None else "N/A"
                                 lon_display = lon if lon is not None else "N/A"
-                                print(f"{i}. Reporter: {name}")
+                                print(f"#{r.get('id')} Reporter: {name}")
                                 print(f"   Type   : {dtype}")
                                 print(f"   Details: {description}")
                                 print(f"   Address: {addr_display}")
@@ -206,16 +167,16 @@ def main():
                             print("No reports available to delete.")
                             continue
                         print("\nCurrent reports:")
-                        for i, r in enumerate(reports, start=1):
-                            print(f"{i}. {r.get('timestamp')} - {r.get('name')} - {r.get('disaster_type')}")
+                        for r in reports:
+                            print(f"#{r.get('id')} {r.get('timestamp')} - {r.get('name')} - {r.get('disaster_type')}")
                         try:
-                            index = int(input("\nEnter report number to delete (0 to cancel): ").strip())
-                            if index == 0:
+                            report_id = int(input("\nEnter report ID to delete (0 to cancel): ").strip())
+                            if report_id == 0:
                                 continue
-                            if storage.delete_report(index):
+                            if storage.delete_report(report_id):
                                 print("Report deleted successfully.")
                             else:
-                                print("Invalid report number.")
+                                print("No report with that ID.")
                         except ValueError:
                             print("Invalid input.")
                     elif choice == "3":
@@ -274,8 +235,7 @@ def main():
                 print("Report saved.")
             else:
                 lat, lon, display = coords
-                details_with_location = f"{details} | location_resolved: {display} | lat:{lat} lon:{lon}"
-                storage.add_report(user_name, disaster_type, details_with_location)
+                storage.add_report(user_name, disaster_type, details, lat=lat, lon=lon, resolved_address=display)
                 print("Report saved.")
 
         while True:
@@ -338,6 +298,9 @@ def main():
                 if help_stations.stations:
                     print("Known help stations (latitude, longitude):")
                     for sid, loc in help_stations.stations.items():
+                        if loc is None:
+                            print(f" - {sid}: no coordinates")
+                            continue
                         lat, lon = loc
                         print(f" - {sid}: latitude={lat}, longitude={lon}")
                 else:
@@ -352,7 +315,6 @@ if __name__ == "__main__":
     main()
 
 import json
-import re
 import urllib.parse
 import urllib.request
 from typing import Optional, Tuple, List, Dict
@@ -382,43 +344,6 @@ def geocode(number: Optional[str], street: str, city: str, country: str) -> Opti
         return None
 
 
-def _extract_location_from_details(details: str) -> Tuple[Optional[str], Optional[float], Optional[float]]:
-    if not details:
-        return None, None, None
-    addr = None
-    lat = None
-    lon = None
-    if "location_resolved:" in details:
-        try:
-            addr_part = details.split("location_resolved:", 1)[1]
-            addr = addr_part.split("|", 1)[0].strip()
-            if addr == "":
-                addr = None
-        except Exception:
-            addr = None
-    mlat = re.search(r"lat:\s*([-\d\.]+)", details)
-    mlon = re.search(r"lon:\s*([-\d\.]+)", details)
-    try:
-        if mlat:
-            lat = float(mlat.group(1))
-    except Exception:
-        lat = None
-    try:
-        if mlon:
-            lon = float(mlon.group(1))
-    except Exception:
-        lon = None
-    return addr, lat, lon
-
-
-def _extract_description_from_details(details: str) -> str:
-    if not details:
-        return ""
-    if "location_resolved:" in details:
-        return details.split("location_resolved:", 1)[0].rstrip(" |").strip()
-    return details.strip()
-
-
 def main():
     from storage import Storage
     from trucks import Truck
@@ -538,16 +463,15 @@ def main():
                             print("No reports available.")
                         else:
                             print("\nSaved disaster reports:")
-                            for i, r in enumerate(reports, start=1):
+                            for r in reports:
                                 name = r.get("name", "Unknown")
                                 dtype = r.get("disaster_type", "Unknown")
-                                details_raw = r.get("details", "") or ""
-                                description = _extract_description_from_details(details_raw)
-                                addr, lat, lon = _extract_location_from_details(details_raw)
+                                description = r.get("details", "") or ""
+                                addr, lat, lon = r.get("resolved_address"), r.get("lat"), r.get("lon")
                                 addr_display = addr or "Address unknown"
                                 lat_display = lat if lat is not None else "N/A"
                                 lon_display = lon if lon is not None else "N/A"
-                                print(f"{i}. Reporter: {name}")
+                                print(f"#{r.get('id')} Reporter: {name}")
                                 print(f"   Type   : {dtype}")
                                 print(f"   Details: {description}")
                                 print(f"   Address: {addr_display}")
@@ -559,16 +483,16 @@ def main():
                             print("No reports available to delete.")
                             continue
                         print("\nCurrent reports:")
-                        for i, r in enumerate(reports, start=1):
-                            print(f"{i}. {r.get('timestamp')} - {r.get('name')} - {r.get('disaster_type')}")
+                        for r in reports:
+                            print(f"#{r.get('id')} {r.get('timestamp')} - {r.get('name')} - {r.get('disaster_type')}")
                         try:
-                            index = int(input("\nEnter report number to delete (0 to cancel): ").strip())
-                            if index == 0:
+                            report_id = int(input("\nEnter report ID to delete (0 to cancel): ").strip())
+                            if report_id == 0:
                                 continue
-                            if storage.delete_report(index):
+                            if storage.delete_report(report_id):
                                 print("Report deleted successfully.")
                             else:
-                                print("Invalid report number.")
+                                print("No report with that ID.")
                         except ValueError:
                             print("Invalid input.")
                     elif choice == "3":
@@ -627,8 +551,7 @@ def main():
                 print("Report saved.")
             else:
                 lat, lon, display = coords
-                details_with_location = f"{details} | location_resolved: {display} | lat:{lat} lon:{lon}"
-                storage.add_report(user_name, disaster_type, details_with_location)
+                storage.add_report(user_name, disaster_type, details, lat=lat, lon=lon, resolved_address=display)
                 print("Report saved.")
 
         while True:
@@ -691,6 +614,9 @@ def main():
                 if help_stations.stations:
                     print("Known help stations (latitude, longitude):")
                     for sid, loc in help_stations.stations.items():
+                        if loc is None:
+                            print(f" - {sid}: no coordinates")
+                            continue
                         lat, lon = loc
                         print(f" - {sid}: latitude={lat}, longitude={lon}")
                 else:
@@ -0,0 +1,234 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+try:
+    from .utils import StripedLocks
+except ImportError:
+    from utils import StripedLocks
+
+
+class DispatchEngine:
+    def __init__(self, storage, trucks, help_stations, max_truck_distance: Optional[float] = None,
+                 speed: Optional[float] = 40.0, service_time: float = 900.0,
+                 default_trip_time: float = 3600.0, queue_requests: bool = True,
+                 max_tracked_requests: int = 10000):
+        """Turn aid requests into truck dispatches.
+
+        For a requester at `location` the engine reserves the supplies, claims the
+        closest available truck (Truck.claim_nearest, a grid-index lookup) and reports
+        the nearest help station (HelpStation.nearest_stations). Inventory is pooled
+        in storage rather than held per station, so "stations with stock" means the
+        pooled stock. Distances use the trucks' and stations' metric; trucks farther
+        than max_truck_distance are not sent.
+
+        Each dispatched truck is scheduled back after a round trip at `speed` distance
+        units per hour plus service_time seconds (default_trip_time when the distance
+        is unknown). With queue_requests, requests arriving while no truck is free keep
+        their reserved supplies and wait in FIFO order for the next returning truck; a
+        waiting request no free truck can reach does not hold up the ones behind it.
+        cancel_request() withdraws a waiting request and hands its supplies back.
+        Request ids and the waiting queue live in the fleet's log (Truck.new_request_id,
+        Truck.queue_request), so they survive restarts and are shared with other
+        processes using the same fleet file, as the reserved stock is in storage.
+
+        A request either reserves its stock and gets a truck (or a queue slot), or
+        hands everything back. Requests for the same item are serialised by per-item
+        locks; requests for different items only share the brief truck assignment.
+        """
+        self.storage = storage
+        self.trucks = trucks
+        self.help_stations = help_stations
+        self.max_truck_distance = max_truck_distance
+        self.speed = speed
+        self.service_time = service_time
+        self.default_trip_time = default_trip_time
+        self.queue_requests = queue_requests
+        self._max_tracked = max_tracked_requests
+        # request_id -> latest result known to this engine, oldest first
+        self._requests: "OrderedDict[int, Dict]" = OrderedDict()
+        self._dispatched = 0
+        self._lock = threading.RLock()
+        self._item_locks = StripedLocks()
+
+    def trip_time(self, distance: Optional[float]) -> float:
+        """Seconds until a truck sent `distance` away is expected back."""
+        if distance is None or not self.speed:
+            return self.default_trip_time
+        return self.service_time + 2 * distance / self.speed * 3600
+
+    def request_aid(self, item: str, quantity: int, location=None, requester: Optional[str] = None) -> Dict:
+        """Dispatch quantity of item to location ((x, y), (lat, lon) or None).
+
+        requester is recorded with the dispatch in the fleet's history log.
+
+        Returns a dict with success, message and request_id, plus truck,
+        truck_distance, eta, station and station_distance when a truck was sent, or
+        queued and queue_position when the request is waiting for one. Failures carry
+        reason ('invalid', 'no_stock' or 'no_truck') and reserve nothing.
+        """
+        if quantity <= 0:
+            return {'success': False, 'reason': 'invalid', 'message': 'Quantity must be positive.'}
+        self.poll()
+        with self._item_locks.hold([item]):
+            # take the stock first: a failed reservation must not tie up a truck
+            try:
+                self.storage.reserve_supplies({item: quantity})
+            except ValueError:
+                available = self.storage.check_inventory(item)
+                return {'success': False, 'reason': 'no_stock', 'message': f'Only {available} available.'}
+            try:
+                result = self._dispatch_or_queue(item, quantity, location, requester)
+            except BaseException:
+                self.storage.release_supplies({item: quantity})
+                raise
+            if result is None:
+                self.storage.release_supplies({item: quantity})
+                return {'success': False, 'reason': 'no_truck', 'message': 'No trucks available.'}
+            return result
+
+    def _dispatch_or_queue(self, item: str, quantity: int, location, requester) -> Optional[Dict]:
+        """Send a truck for already-reserved stock, or queue the request. None if neither is possible."""
+        with self._lock:
+            request = {'request_id': self.trucks.new_request_id(), 'item': item, 'quantity': quantity,
+                       'location': location, 'requester': requester}
+            # earlier waiting requests go first; whatever still waits after that has no truck in reach
+            self._assign_waiting()
+            if self._assign(request):
+                return request['result']
+            if not self.queue_requests:
+                return None
+            self.trucks.queue_request({k: request[k] for k in ('request_id', 'item', 'quantity', 'location',
+                                                                 'requester')})
+            request['result'] = self._queued_result(request, len(self.trucks.queued_requests()))
+            self._track(request)
+            return request['result']
+
+    @staticmethod
+    def _queued_result(request: Dict, position: int) -> Dict:
+        return {
+            'success': True,
+            'queued': True,
+            'request_id': request['request_id'],
+            'queue_position': position,
+            'message': f"All trucks are out; request queued at position {position}.",
+            'item': request['item'],
+            'quantity': request['quantity'],
+        }
+
+    def _assign(self, request: Dict, queued: bool = False) -> bool:
+        details = {'request_id': request['request_id'], 'supply': request['item'],
+                   'quantity': request['quantity'], 'requester': request.get('requester')}
+        claimed = self.trucks.claim_nearest(request['location'], self.max_truck_distance, details, queued=queued)
+        if claimed is None:
+            return False
+        truck, truck_distance = claimed
+        try:
+            self.trucks.schedule_return(truck, self.trip_time(truck_distance))
+            station = None
+            if request['location'] is not None:
+                nearest = self.help_stations.nearest_stations(request['location'], k=1)
+                station = nearest[0] if nearest else None
+        except BaseException:
+            # the dispatch did not go through: give the truck back
+            self.trucks.return_truck(truck)
+            raise
+        request['result'] = {
+            'success': True,
+            'queued': False,
+            'request_id': request['request_id'],
+            'message': f"{truck} dispatched with {request['quantity']} of {request['item']}.",
+            'truck': truck,
+            'truck_distance': truck_distance,
+            'eta': self.trucks.expected_return(truck),
+            'station': station[0] if station else None,
+            'station_distance': station[1] if station else None,
+            'item': request['item'],
+            'quantity': request['quantity'],
+        }
+        self._dispatched += 1
+        self._track(request)
+        return True
+
+    def _track(self, request: Dict):
+        self._requests[request['request_id']] = request['result']
+        self._requests.move_to_end(request['request_id'])
+        while len(self._requests) > self._max_tracked:
+            self._requests.popitem(last=False)
+
+    def poll(self) -> int:
+        """Free trucks that are due back and hand them to waiting requests. Returns how many were sent."""
+        with self._lock:
+            self.trucks.process_returns()
+            return self._assign_waiting()
+
+    def _assign_waiting(self) -> int:
+        # in queue order, but a request that cannot be reached (max_truck_distance)
+        # stays queued without blocking the ones behind it
+        sent = 0
+        for request in self.trucks.queued_requests():
+            if not self.trucks.stats()['available']:
+                break
+            if self._assign(request, queued=True):
+                sent += 1
+        return sent
+
+    def cancel_request(self, request_id: int) -> Optional[Dict]:
+        """Withdraw a queued request and release its reserved supplies.
+
+        Returns the request's final result, or None if it is not waiting (unknown,
+        already dispatched or already cancelled).
+        """
+        with self._lock:
+            self.poll()
+            request = self.trucks.unqueue_request(request_id, 'cancelled')
+            if request is None:
+                return None
+            self.storage.release_supplies({request['item']: request['quantity']})
+            request['result'] = {
+                'success': False,
+                'queued': False,
+                'reason': 'cancelled',
+                'request_id': request_id,
+                'message': 'Request cancelled; supplies returned to stock.',
+                'item': request['item'],
+                'quantity': request['quantity'],
+            }
+            self._track(request)
+            return request['result']
+
+    def request_status(self, request_id: int) -> Optional[Dict]:
+        """Latest result for a request (queued ones report their current position)."""
+        with self._lock:
+            self.poll()
+            for position, request in enumerate(self.trucks.queued_requests(), 1):
+                if request['request_id'] == request_id:
+                    return self._queued_result(request, position)
+            result = self._requests.get(request_id)
+            if result is None or result.get('queued'):
+                # queued before a restart or by another process, and sent or cancelled since
+                result = self._result_from_history(request_id) or result
+            return result
+
+    def _result_from_history(self, request_id: int) -> Optional[Dict]:
+        for event in self.trucks.history():
+            if event.get('request_id') != request_id:
+                continue
+            if event['event'] == 'dispatch':
+                return {'success': True, 'queued': False, 'request_id': request_id,
+                        'message': f"{event['truck']} dispatched with {event.get('quantity')} of {event.get('supply')}.",
+                        'truck': event['truck'], 'truck_distance': event.get('distance'),
+                        'item': event.get('supply'), 'quantity': event.get('quantity')}
+            if event['event'] == 'unqueue':
+                return {'success': False, 'queued': False, 'reason': event.get('reason', 'cancelled'),
+                        'request_id': request_id, 'message': 'Request cancelled; supplies returned to stock.'}
+        return None
+
+    def stats(self) -> Dict:
+        """Fleet stats plus queue_depth and the number of dispatches so far."""
+        with self._lock:
+            self.poll()
+            stats = self.trucks.stats()
+            stats['queue_depth'] = len(self.trucks.queued_requests())
+            stats['dispatched'] = self._dispatched
+            return stats
@@ -0,0 +1,126 @@
+import csv
+import unicodedata
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+def normalize_place(name: str) -> str:
+    """Lookup form of a place name: case-folded, accents stripped, whitespace collapsed."""
+    decomposed = unicodedata.normalize('NFKD', name or '')
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return ' '.join(stripped.casefold().replace('.', ' ').split())
+
+
+class Place:
+    __slots__ = ('name', 'lat', 'lon', 'country', 'population')
+
+    def __init__(self, name: str, lat: float, lon: float, country: str = '', population: int = 0):
+        self.name = name
+        self.lat = lat
+        self.lon = lon
+        self.country = country
+        self.population = population
+
+    @property
+    def display_name(self) -> str:
+        return f"{self.name}, {self.country}" if self.country else self.name
+
+
+class _Node:
+    __slots__ = ('children', 'places')
+
+    def __init__(self):
+        self.children: Dict[str, '_Node'] = {}
+        self.places: List[Place] = []
+
+
+class Gazetteer:
+    def __init__(self, places: Iterable[Tuple[Iterable[str], Place]] = ()):
+        """In-memory trie of place names for offline geocoding.
+
+        Each place is indexed under all its names (official, ASCII and alternates), so
+        an exact lookup costs one step per character and complete() walks only the
+        subtree below the typed prefix.
+        """
+        self._root = _Node()
+        self._size = 0
+        for names, place in places:
+            self.add(place, names)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, place: Place, names: Iterable[str] = ()):
+        keys = {normalize_place(n) for n in [place.name, *names]}
+        for key in keys:
+            if not key:
+                continue
+            node = self._root
+            for ch in key:
+                node = node.children.setdefault(ch, _Node())
+            node.places.append(place)
+        self._size += 1
+
+    def _find(self, key: str) -> Optional[_Node]:
+        node = self._root
+        for ch in key:
+            node = node.children.get(ch)
+            if node is None:
+                return None
+        return node
+
+    def lookup(self, name: str, country: Optional[str] = None) -> Optional[Place]:
+        """Best place with exactly this name: one in country if given, else the most populous."""
+        node = self._find(normalize_place(name))
+        if node is None or not node.places:
+            return None
+        places = node.places
+        if country:
+            wanted = normalize_place(country)
+            in_country = [p for p in places if normalize_place(p.country) == wanted]
+            places = in_country or places
+        return max(places, key=lambda p: p.population)
+
+    def complete(self, prefix: str, limit: int = 10) -> List[Place]:
+        """Places whose name starts with prefix, most populous first."""
+        node = self._find(normalize_place(prefix))
+        if node is None:
+            return []
+        found, stack = {}, [node]
+        while stack:
+            current = stack.pop()
+            for place in current.places:
+                found[id(place)] = place
+            stack.extend(current.children.values())
+        return sorted(found.values(), key=lambda p: -p.population)[:limit]
+
+    @classmethod
+    def from_file(cls, path: str) -> 'Gazetteer':
+        """Load a CSV (name, lat, lon[, country, population] header) or a GeoNames dump."""
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            rows = _read_csv(f) if path.lower().endswith('.csv') else _read_geonames(f)
+            return cls(rows)
+
+
+def _read_csv(f) -> Iterator[Tuple[List[str], Place]]:
+    for row in csv.DictReader(f):
+        try:
+            place = Place(row['name'].strip(), float(row.get('lat') or row['latitude']),
+                          float(row.get('lon') or row['longitude']), (row.get('country') or '').strip(),
+                          int(row.get('population') or 0))
+        except (KeyError, TypeError, ValueError):
+            continue
+        yield [], place
+
+
+def _read_geonames(f) -> Iterator[Tuple[List[str], Place]]:
+    # geonameid, name, asciiname, alternatenames, latitude, longitude, feature class,
+    # feature code, country code, cc2, admin1..4, population, ...
+    for line in f:
+        cols = line.rstrip('\n').split('\t')
+        if len(cols) < 15:
+            continue
+        try:
+            place = Place(cols[1], float(cols[4]), float(cols[5]), cols[8], int(cols[14] or 0))
+        except ValueError:
+            continue
+        yield [cols[2], *[a for a in cols[3].split(',') if a]], place
@@ -0,0 +1,139 @@
+import queue
+import sys
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    from .report_utils import GeocoderUnavailable, geocode, geocode_batch
+except ImportError:
+    from report_utils import GeocoderUnavailable, geocode, geocode_batch
+
+# (number, street, city, country) -> (lat, lon, display_name) or None; raises
+# GeocoderUnavailable when it cannot tell right now
+Geocoder = Callable[[Optional[str], str, str, str], Optional[Tuple[float, float, str]]]
+
+
+class GeocodeQueue:
+    def __init__(self, storage, workers: int = 2, geocoder: Optional[Geocoder] = None,
+                 retry_delay: float = 5.0, max_retry_delay: float = 300.0):
+        """Resolve report addresses in background threads.
+
+        Reports are filed with location_query and status 'pending'; the workers geocode
+        them and write the result back with storage.set_report_location(). The pending
+        state lives in storage, so start() picks up reports left over from a restart.
+        Geocoder calls go through report_utils' cache and Nominatim rate limit.
+        A report whose lookup failed because the geocoder was unavailable stays pending
+        and is queued again after retry_delay seconds, doubling up to max_retry_delay.
+        """
+        self._storage = storage
+        self._workers = workers
+        # None means report_utils.geocode(), which geocode_batch() can share queries for
+        self._geocoder = geocoder
+        self._retry_delay = retry_delay
+        self._max_retry_delay = max_retry_delay
+        self._queue: "queue.Queue[Optional[Tuple[int, Dict]]]" = queue.Queue()
+        self._threads: List[threading.Thread] = []
+        # report id -> failed attempts so far, and the timers that will re-queue them
+        self._attempts: Dict[int, int] = {}
+        self._retries: Dict[int, threading.Timer] = {}
+        self._lock = threading.Lock()
+
+    def start(self) -> int:
+        """Start the workers and queue any pending reports. Returns how many were resumed."""
+        if not self._threads:
+            for n in range(self._workers):
+                t = threading.Thread(target=self._run, name=f'geocode-{n + 1}', daemon=True)
+                t.start()
+                self._threads.append(t)
+        pending = self._storage.pending_location_reports()
+        for report in pending:
+            self.submit(report['id'], report.get('location_query') or {})
+        return len(pending)
+
+    def submit(self, report_id: int, location_query: Dict):
+        self._queue.put((report_id, location_query))
+
+    def submit_batch(self, jobs: List[Tuple[int, Dict]]) -> threading.Thread:
+        """Geocode many (report_id, location_query) pairs with geocode_batch() in one background thread."""
+        t = threading.Thread(target=self._run_batch, args=(list(jobs),), name='geocode-batch', daemon=True)
+        t.start()
+        return t
+
+    def _run_batch(self, jobs: List[Tuple[int, Dict]]):
+        addresses = [(q.get('number') or None, q.get('street', ''), q.get('city', ''), q.get('country', ''))
+                     for _, q in jobs]
+        done = set()
+        try:
+            for index, coords in geocode_batch(addresses, workers=self._workers, geocoder=self._geocoder,
+                                               strict=True):
+                lat, lon, display = coords or (None, None, None)
+                self._storage.set_report_location(jobs[index][0], lat, lon, display)
+                done.add(index)
+        except Exception as e:
+            print(f"geocode queue: batch failed: {e}", file=sys.stderr)
+        # rows the geocoder could not answer stay pending and go through the retry path
+        for index, (report_id, q) in enumerate(jobs):
+            if index not in done:
+                self._retry_later(report_id, q)
+
+    def join(self):
+        """Block until every queued report has been processed."""
+        self._queue.join()
+
+    def stop(self, timeout: Optional[float] = None):
+        with self._lock:
+            for timer in self._retries.values():
+                timer.cancel()
+            self._retries.clear()
+        for _ in self._threads:
+            self._queue.put(None)
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                self._resolve(*job)
+            except Exception as e:
+                print(f"geocode queue: report {job[0]} failed: {e}", file=sys.stderr)
+            finally:
+                self._queue.task_done()
+
+    def _resolve(self, report_id: int, q: Dict):
+        address = (q.get('number') or None, q.get('street', ''), q.get('city', ''), q.get('country', ''))
+        try:
+            coords = self._geocoder(*address) if self._geocoder else geocode(*address, strict=True)
+        except GeocoderUnavailable as e:
+            print(f"geocode queue: report {report_id} deferred: {e}", file=sys.stderr)
+            self._retry_later(report_id, q)
+            return
+        with self._lock:
+            self._attempts.pop(report_id, None)
+        if coords:
+            lat, lon, display = coords
+            self._storage.set_report_location(report_id, lat, lon, display)
+        else:
+            self._storage.set_report_location(report_id, None, None)
+
+    def _retry_later(self, report_id: int, q: Dict):
+        with self._lock:
+            if report_id in self._retries:
+                return
+            attempts = self._attempts.get(report_id, 0)
+            self._attempts[report_id] = attempts + 1
+            delay = min(self._max_retry_delay, self._retry_delay * 2 ** attempts)
+            timer = threading.Timer(delay, self._requeue, args=(report_id, q))
+            timer.daemon = True
+            self._retries[report_id] = timer
+        timer.start()
+
+    def _requeue(self, report_id: int, q: Dict):
+        with self._lock:
+            if self._retries.pop(report_id, None) is None:
+                # stop() cancelled it
+                return
+        self.submit(report_id, q)
@@ -1,98 +1,303 @@
 import json
 import os
-from typing import List, Optional
+import threading
+from contextlib import contextmanager
+from collections.abc import Mapping
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from .spatial import GridIndex, nearest_geodesic
+    from .utils import atomic_write_json, bump_version, file_lock, haversine_km, read_version
+except ImportError:
+    from spatial import GridIndex, nearest_geodesic
+    from utils import atomic_write_json, bump_version, file_lock, haversine_km, read_version
+
+METRICS = ('euclidean', 'haversine')
+
+
+class StationLocations(Mapping):
+    """Read-only name -> (x, y) or None view of a HelpStation's records, in insertion order."""
+
+    def __init__(self, records: Dict[str, Dict]):
+        self._records = records
+
+    def __getitem__(self, name: str):
+        return self._records[name]['location']
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __contains__(self, name) -> bool:
+        return name in self._records
+
+
+def _record(location=None, capacity=None, metadata=None) -> Dict:
+    return {'location': location, 'capacity': int(capacity) if capacity is not None else None,
+            'metadata': dict(metadata) if isinstance(metadata, dict) else {}}
 
 
 class HelpStation:
-    def __init__(self, persistence_file: str = 'data/stations.json'):
-        """Manage help stations with JSON persistence."""
-        self.stations: List[str] = []
-        # optional mapping of station name -> (x, y) coordinates
-        self._locations = {}
+    def __init__(self, persistence_file: str = 'data/stations.json', shared: bool = False,
+                 cell_size: float = 1.0, metric: str = 'euclidean'):
+        """Manage help stations with JSON persistence.
+
+        With shared=True the stations file may be used by several processes: changes
+        are made under an advisory file lock after reloading any outside edits.
+        Station coordinates are kept in a grid index of cell_size units for
+        nearest_stations(); pick a cell holding a handful of stations on average.
+        metric='haversine' treats coordinates as (lat, lon) degrees and measures
+        great-circle kilometres; the default 'euclidean' uses plain (x, y) distance.
+        """
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric '{metric}'")
+        self.metric = metric
+        # name -> {'location': (x, y) or None, 'capacity': int or None, 'metadata': dict}, insertion-ordered
+        self._records: Dict[str, Dict] = {}
+        self._index = GridIndex(cell_size)
+        # (names, coordinate array) snapshot for nearest_stations_bulk(); None when stale
+        self._array = None
         self._persistence_file = persistence_file
+        self._shared = shared
+        # change counter (kept in the lock file) at our last load/write; shared mode only
+        self._version = None
+        self._lock = threading.RLock()
         # Ensure directory exists
         dirpath = os.path.dirname(self._persistence_file)
         if dirpath:
             os.makedirs(dirpath, exist_ok=True)
         self._load()
 
+    @property
+    def stations(self) -> StationLocations:
+        """Station names (iteration order is insertion order) mapped to their coordinates or None."""
+        return StationLocations(self._records)
+
+    def __contains__(self, name) -> bool:
+        return name in self._records
+
     def _load(self):
+        self._records = {}
         try:
             if os.path.exists(self._persistence_file):
                 with open(self._persistence_file, 'r', encoding='utf-8') as f:
                     data = json.load(f)
-                    if isinstance(data, dict):
-                        if 'stations' in data:
-                            self.stations = [s for s in data['stations'] if isinstance(s, str)]
-                        if 'locations' in data and isinstance(data['locations'], dict):
-                            # load locations, ensure tuples
-                            for k, v in data['locations'].items():
-                                if isinstance(v, list) and len(v) == 2:
-                                    self._locations[k] = tuple(v)
+                if isinstance(data, dict):
+                    info = data.get('info') if isinstance(data.get('info'), dict) else {}
+                    for name in data.get('stations', []):
+                        if isinstance(name, str):
+                            extra = info.get(name) if isinstance(info.get(name), dict) else {}
+                            self._records[name] = _record(None, extra.get('capacity'), extra.get('metadata'))
+                    if isinstance(data.get('locations'), dict):
+                        # load locations, ensure tuples
+                        for k, v in data['locations'].items():
+                            if k in self._records and isinstance(v, list) and len(v) == 2:
+                                self._records[k]['location'] = tuple(v)
         except Exception:
-            self.stations = []
-            self._locations = {}
+            self._records = {}
+        self._reindex()
+
+    def _reindex(self):
+        self._index = GridIndex(self._index.cell_size)
+        for name, record in self._records.items():
+            if record['location'] is not None:
+                self._index.insert(name, *record['location'])
+        self._array = None
+
+    def _set_location(self, name: str, location) -> bool:
+        try:
+            x, y = float(location[0]), float(location[1])
+        except Exception:
+            # ignore bad location format
+            return False
+        self._records[name]['location'] = (x, y)
+        self._index.insert(name, x, y)
+        self._array = None
+        return True
 
     def _save(self):
+        # same layout as before records existed; capacity/metadata go in an optional 'info' section
         try:
-            payload = {'stations': self.stations, 'locations': {k: list(v) for k, v in self._locations.items()}}
-            with open(self._persistence_file, 'w', encoding='utf-8') as f:
-                json.dump(payload, f, indent=2)
+            payload = {
+                'stations': list(self._records),
+                'locations': {k: list(r['location']) for k, r in self._records.items() if r['location'] is not None},
+            }
+            info = {k: {'capacity': r['capacity'], 'metadata': r['metadata']}
+                    for k, r in self._records.items() if r['capacity'] is not None or r['metadata']}
+            if info:
+                payload['info'] = info
+            atomic_write_json(self._persistence_file, payload)
         except Exception:
             pass
 
-    def add_station(self, name: str, location=None) -> bool:
-        """Add a station by name. Location parameter is accepted for backward compatibility but ignored.
-        Returns True if added, False if name already exists."""
+    def _refresh(self):
+        """Reload from disk if another process changed the file (shared mode only)."""
+        if self._shared and read_version(self._persistence_file) != self._version:
+            with self._lock, file_lock(self._persistence_file) as lock:
+                self._load()
+                self._version = read_version(lock)
+
+    @contextmanager
+    def _transaction(self):
+        """Serialise a read-modify-write cycle across threads and, in shared mode, processes."""
+        with self._lock:
+            if not self._shared:
+                yield
+                return
+            with file_lock(self._persistence_file) as lock:
+                if read_version(lock) != self._version:
+                    self._load()
+                yield
+                self._version = bump_version(lock)
+
+    def add_station(self, name: str, location=None, capacity: Optional[int] = None,
+                    metadata: Optional[Dict] = None) -> bool:
+        """Add a station by name, optionally with (x, y) coordinates, a capacity and metadata.
+        Returns True if added, False if name already exists (its location is updated if given)."""
         if not name:
             return False
-        if name in self.stations:
-            # If station already exists but a location is provided, update it.
-            if location and isinstance(location, (list, tuple)) and len(location) == 2:
-                try:
-                    self._locations[name] = (float(location[0]), float(location[1]))
-                    self._save()
-                except Exception:
-                    pass
-            return False
+        with self._transaction():
+            if name in self._records:
+                # If station already exists but a location is provided, update it.
+                if location and isinstance(location, (list, tuple)) and len(location) == 2:
+                    if self._set_location(name, location):
+                        self._save()
+                return False
 
-        self.stations.append(name)
-        if location and isinstance(location, (list, tuple)) and len(location) == 2:
-            try:
-                self._locations[name] = (float(location[0]), float(location[1]))
-            except Exception:
-                # ignore bad location format
-                pass
-        self._save()
+            self._records[name] = _record(None, capacity, metadata)
+            if location and isinstance(location, (list, tuple)) and len(location) == 2:
+                self._set_location(name, location)
+            self._save()
         return True
+
+    def update_station(self, name: str, location=None, capacity: Optional[int] = None,
+                       metadata: Optional[Dict] = None) -> bool:
+        """Change the given fields of an existing station (metadata is merged). Returns False if not found."""
+        with self._transaction():
+            if name not in self._records:
+                return False
+            if location is not None and not self._set_location(name, location):
+                raise ValueError("Invalid location")
+            if capacity is not None:
+                self._records[name]['capacity'] = int(capacity)
+            if metadata:
+                self._records[name]['metadata'].update(metadata)
+            self._save()
         return True
 
     def delete_station(self, name: str) -> bool:
         """Delete a station by name. Returns True if deleted, False if not found."""
-        if name not in self.stations:
-            return False
-        self.stations.remove(name)
-        self._save()
+        with self._transaction():
+            if self._records.pop(name, None) is None:
+                return False
+            self._index.remove(name)
+            self._array = None
+            self._save()
         return True
 
     def get_station(self, name: str) -> Optional[str]:
         """Get a station by name."""
-        return name if name in self.stations else None
+        self._refresh()
+        return name if name in self._records else None
+
+    def station_info(self, name: str) -> Optional[Dict]:
+        """A copy of the station's record (name, location, capacity, metadata), or None."""
+        self._refresh()
+        record = self._records.get(name)
+        if record is None:
+            return None
+        return {'name': name, 'location': record['location'], 'capacity': record['capacity'],
+                'metadata': dict(record['metadata'])}
 
     def calculate_distance(self, point, station_name: str) -> float:
-        """Calculate Euclidean distance between a point (x,y) and a named station.
+        """Calculate the distance between a point and a named station (see metric).
         Raises ValueError if station not found or station has no coordinates."""
-        if station_name not in self.stations:
+        self._refresh()
+        record = self._records.get(station_name)
+        if record is None:
             raise ValueError("Station not found")
-        if station_name not in self._locations:
+        if record['location'] is None:
             raise ValueError("Station has no coordinates")
-        sx, sy = self._locations[station_name]
+        sx, sy = record['location']
         try:
             px, py = float(point[0]), float(point[1])
         except Exception:
             raise ValueError("Invalid point")
+        if self.metric == 'haversine':
+            return haversine_km(px, py, sx, sy)
         return ((sx - px) ** 2 + (sy - py) ** 2) ** 0.5
 
     def list_stations(self) -> List[str]:
         """Get a list of all station names."""
-        return list(self.stations)
\ No newline at end of file
+        self._refresh()
+        return list(self._records)
+
+    def nearest_stations(self, point, k: int = 1,
+                         max_distance: Optional[float] = None) -> List[Tuple[str, float]]:
+        """The k stations closest to point (x, y) as (name, distance) pairs, nearest first.
+
+        Only stations with coordinates are considered; max_distance drops farther ones.
+        Uses the grid index, so the cost does not grow with the total number of stations.
+        """
+        self._refresh()
+        try:
+            px, py = float(point[0]), float(point[1])
+        except Exception:
+            raise ValueError("Invalid point")
+        with self._lock:
+            if self.metric == 'haversine':
+                found = nearest_geodesic(self._index, px, py, k, max_distance)
+            else:
+                found = self._index.nearest(px, py, k, max_distance)
+        return sorted(((name, d) for d, name in found), key=lambda item: (item[1], item[0]))
+
+    def nearest_stations_bulk(self, points: Iterable, k: int = 1,
+                              max_distance: Optional[float] = None) -> List[List[Tuple[str, float]]]:
+        """nearest_stations() for many points at once.
+
+        With NumPy available the distances are computed in vectorized chunks; otherwise
+        each point goes through the grid index.
+        """
+        points = list(points)
+        if np is None or not points:
+            return [self.nearest_stations(p, k, max_distance) for p in points]
+        self._refresh()
+        with self._lock:
+            if self._array is None:
+                items = list(self._index.items())
+                names = [name for name, _ in items]
+                coords = np.array([xy for _, xy in items], dtype=float).reshape(-1, 2)
+                self._array = (names, coords)
+            names, coords = self._array
+        try:
+            queries = np.asarray(points, dtype=float).reshape(-1, 2)
+        except (TypeError, ValueError):
+            raise ValueError("Invalid point")
+        k = min(k, len(names))
+        if k <= 0:
+            return [[] for _ in points]
+        results = []
+        # bound the (chunk x stations) distance matrix to a few million cells
+        chunk = max(1, 4_000_000 // len(names))
+        for start in range(0, len(queries), chunk):
+            block = queries[start:start + chunk]
+            if self.metric == 'haversine':
+                dist = haversine_km(block[:, None, 0], block[:, None, 1], coords[None, :, 0], coords[None, :, 1])
+            else:
+                dist = np.hypot(block[:, None, 0] - coords[None, :, 0], block[:, None, 1] - coords[None, :, 1])
+            if k < len(names):
+                nearest = np.argpartition(dist, k - 1, axis=1)[:, :k]
+            else:
+                nearest = np.broadcast_to(np.arange(len(names)), (len(block), len(names)))
+            for row, cols in zip(dist, nearest):
+                found = [(names[c], float(row[c])) for c in cols
+                         if max_distance is None or row[c] <= max_distance]
+                results.append(sorted(found, key=lambda item: (item[1], item[0])))
+        return results
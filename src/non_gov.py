@@ -2,16 +2,21 @@ class NonGov:
     def __init__(self, location):
         self.location = location
 
-    def request_aid(self, storage, help_stations):
-        if not help_stations.is_nearby(self.location):
-            return self.dispatch_truck(storage)
-        else:
-            distance = help_stations.get_distance(self.location)
-            return f"You are {distance} km away from the nearest help station."
+    def request_aid(self, dispatcher, item, quantity=1, walk_distance=None):
+        """Ask the DispatchEngine for aid at this requester's location.
 
-    def dispatch_truck(self, storage):
-        if storage.check_availability():
-            storage.decrease_supply()
+        If a help station is within walk_distance the requester is pointed there instead.
+        """
+        if walk_distance is not None:
+            nearest = dispatcher.help_stations.nearest_stations(self.location, k=1, max_distance=walk_distance)
+            if nearest:
+                return f"You are {nearest[0][1]:.1f} km away from the nearest help station, {nearest[0][0]}."
+        return self.dispatch_truck(dispatcher, item, quantity)
+
+    def dispatch_truck(self, dispatcher, item, quantity=1):
+        result = dispatcher.request_aid(item, quantity, self.location)
+        if result['success']:
             return "A truck has been dispatched to your location."
-        else:
-            return "No supplies available for dispatch."
\ No newline at end of file
+        if result['reason'] == 'no_truck':
+            return "No trucks available for dispatch."
+        return "No supplies available for dispatch."
@@ -0,0 +1,127 @@
+"""Bulk import of field reports from CSV or JSON Lines.
+
+Usage: python src/report_import.py reports.csv [--format csv|jsonl] [--workers 4]
+
+Each row needs name, disaster_type and details; location comes from lat/lon or from
+the address parts number, street (or address), city and country.
+"""
+import argparse
+import csv
+import io
+import json
+import sys
+from typing import Dict, Iterable, List, Optional
+
+try:
+    from .report_utils import geocode_batch
+    from .storage import create_storage
+except ImportError:
+    from report_utils import geocode_batch
+    from storage import create_storage
+
+ADDRESS_FIELDS = ('number', 'street', 'city', 'country')
+
+
+def guess_format(filename: Optional[str], content_type: Optional[str] = None) -> str:
+    name = (filename or '').lower()
+    if name.endswith(('.jsonl', '.ndjson', '.json')) or 'json' in (content_type or ''):
+        return 'jsonl'
+    return 'csv'
+
+
+def _to_float(value) -> Optional[float]:
+    if value is None or value == '':
+        return None
+    return float(value)
+
+
+def parse_report_rows(text: str, fmt: str = 'csv') -> List[Dict]:
+    """Turn CSV or JSONL text into add_reports() rows.
+
+    Raises ValueError naming the offending line for malformed input.
+    """
+    if fmt == 'jsonl':
+        raw = []
+        for line_no, line in enumerate(text.splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                raw.append((line_no, json.loads(line)))
+            except ValueError:
+                raise ValueError(f"Line {line_no}: invalid JSON")
+    elif fmt == 'csv':
+        # line numbers count the header as line 1
+        raw = list(enumerate(csv.DictReader(io.StringIO(text)), start=2))
+    else:
+        raise ValueError(f"Unknown import format '{fmt}'")
+
+    rows = []
+    for line_no, record in raw:
+        if not isinstance(record, dict):
+            raise ValueError(f"Line {line_no}: expected an object")
+        record = {k.strip().lower(): v for k, v in record.items() if k}
+        name = str(record.get('name') or '').strip()
+        disaster_type = str(record.get('disaster_type') or '').strip()
+        if not name or not disaster_type:
+            raise ValueError(f"Line {line_no}: name and disaster_type are required")
+        try:
+            lat, lon = _to_float(record.get('lat')), _to_float(record.get('lon'))
+        except (TypeError, ValueError):
+            raise ValueError(f"Line {line_no}: lat/lon must be numbers")
+        if (lat is None) != (lon is None):
+            raise ValueError(f"Line {line_no}: lat and lon go together")
+        query = {f: str(record.get(f) or '').strip() for f in ADDRESS_FIELDS}
+        query['street'] = query['street'] or str(record.get('address') or '').strip()
+        rows.append({
+            'name': name,
+            'disaster_type': disaster_type,
+            'details': str(record.get('details') or ''),
+            'lat': lat,
+            'lon': lon,
+            'resolved_address': record.get('resolved_address') or None,
+            'location_query': query if lat is None else None,
+        })
+    return rows
+
+
+def geocode_rows(rows: List[Dict], workers: int = 4) -> int:
+    """Resolve pending rows in place with geocode_batch(). Returns how many were found."""
+    pending = [r for r in rows if r['lat'] is None and r['location_query']]
+    addresses = [tuple(r['location_query'][f] for f in ADDRESS_FIELDS) for r in pending]
+    found = 0
+    for index, coords in geocode_batch(addresses, workers=workers):
+        if coords:
+            row = pending[index]
+            row['lat'], row['lon'], row['resolved_address'] = coords
+            row['location_query'] = None
+            found += 1
+    return found
+
+
+def main(argv: Optional[Iterable[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Import disaster reports from CSV or JSONL.")
+    parser.add_argument('path')
+    parser.add_argument('--format', choices=('csv', 'jsonl'))
+    parser.add_argument('--workers', type=int, default=4, help="concurrent geocoding lookups")
+    parser.add_argument('--no-geocode', action='store_true',
+                        help="store addresses as pending; the web app geocodes them on start")
+    args = parser.parse_args(argv)
+
+    with open(args.path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    try:
+        rows = parse_report_rows(text, args.format or guess_format(args.path))
+    except ValueError as e:
+        print(f"{args.path}: {e}", file=sys.stderr)
+        return 1
+    if not args.no_geocode:
+        pending = sum(1 for r in rows if r['location_query'])
+        found = geocode_rows(rows, workers=args.workers)
+        print(f"Geocoded {found} of {pending} addresses.")
+    ids = create_storage().add_reports(rows)
+    print(f"Imported {len(ids)} reports.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
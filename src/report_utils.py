@@ -1,38 +1,349 @@
+import atexit
 import json
+import os
 import sys
-import urllib.parse
-import urllib.request
-from typing import Optional, Tuple
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from .gazetteer import Gazetteer
+    from .utils import atomic_write_json
+except ImportError:
+    from gazetteer import Gazetteer
+    from utils import atomic_write_json
 
 # Geocoder setup (OpenStreetMap Nominatim). Replace contact@example.com with a real contact per policy.
 USER_AGENT = "exampler-geocoder/1.0 (contact@example.com)"
 NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
 
+GEOCODE_CACHE_FILE = os.environ.get("GEOCODE_CACHE", "data/geocode_cache.json")
 
-def _perform_query(q: str) -> Optional[Tuple[float, float, str]]:
-    params = {"format": "json", "q": q, "limit": 1, "addressdetails": 0}
-    url = NOMINATIM_URL + "?" + urllib.parse.urlencode(params)
-    req = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
-    try:
-        with urllib.request.urlopen(req, timeout=10) as resp:
-            data = json.load(resp)
-            if not data:
-                return None
-            first = data[0]
-            return float(first["lat"]), float(first["lon"]), first.get("display_name", "")
-    except Exception as e:
-        # Print debug info to stderr to help diagnose failures (network, rate-limits, bad UA)
-        print(f"geocode: query failed for '{q}': {e}", file=sys.stderr)
-        return None
-
-
-def geocode(number: Optional[str], street: str, city: str, country: str) -> Optional[Tuple[float, float, str]]:
-    """Return (lat, lon, display_name) for the provided address parts or None if not found.
+_MISSING = object()
 
-    This function will try a few progressively simpler queries (full address -> without number -> city+country)
-    and prints debug information to stderr when queries fail. That helps explain why address lookups may not
-    resolve (network issues, rate limiting, or incomplete address parts).
+
+def normalize_query(q: str) -> str:
+    """Cache key for a free-form query: case-folded with whitespace and commas tidied."""
+    parts = (" ".join(p.split()) for p in q.casefold().split(","))
+    return ", ".join(p for p in parts if p)
+
+
+class GeocodeCache:
+    def __init__(self, persistence_file: Optional[str] = None, max_entries: int = 10000,
+                 ttl: float = 30 * 86400, negative_ttl: float = 86400,
+                 save_every: int = 100, save_interval: float = 30.0,
+                 clock: Callable[[], float] = time.time):
+        """LRU cache of geocode results, persisted to a JSON file.
+
+        Found results live for ttl seconds; queries Nominatim had no match for are
+        remembered for negative_ttl seconds so they are not retried on every report.
+        Entries are kept least-recently-used first and the oldest are evicted past
+        max_entries. hits/misses count lookups since start-up.
+
+        The file is rewritten after save_every new entries or once save_interval
+        seconds have passed since the last write, not on every put; flush() writes
+        out whatever is left (the module-level cache does so at exit).
+        """
+        self._persistence_file = persistence_file
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._negative_ttl = negative_ttl
+        self._clock = clock
+        self._save_every = save_every
+        self._save_interval = save_interval
+        # puts since the file was last written
+        self._unsaved = 0
+        self._saved_at = clock()
+        # normalized query -> (expires_at, (lat, lon, display_name) or None)
+        self._entries: "OrderedDict[str, Tuple[float, Optional[Tuple[float, float, str]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def _load(self):
+        if not self._persistence_file:
+            return
+        try:
+            if os.path.exists(self._persistence_file):
+                with open(self._persistence_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                now = self._clock()
+                for key, expires, result in data.get('entries', []):
+                    if expires > now:
+                        self._entries[key] = (expires, tuple(result) if result else None)
+        except Exception:
+            self._entries.clear()
+
+    def _save(self):
+        self._unsaved = 0
+        self._saved_at = self._clock()
+        if not self._persistence_file:
+            return
+        try:
+            dirpath = os.path.dirname(self._persistence_file)
+            if dirpath:
+                os.makedirs(dirpath, exist_ok=True)
+            entries = [[k, expires, list(r) if r else None] for k, (expires, r) in self._entries.items()]
+            atomic_write_json(self._persistence_file, {'entries': entries}, indent=None)
+        except Exception:
+            pass
+
+    def get(self, q: str):
+        """Return the cached result for q (which may be None for a known miss), or _MISSING."""
+        key = normalize_query(q)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= self._clock():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return _MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, q: str, result: Optional[Tuple[float, float, str]]):
+        ttl = self._ttl if result is not None else self._negative_ttl
+        with self._lock:
+            key = normalize_query(q)
+            self._entries[key] = (self._clock() + ttl, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+            self._unsaved += 1
+            if self._unsaved >= self._save_every or self._clock() - self._saved_at >= self._save_interval:
+                self._save()
+
+    def flush(self):
+        """Write out entries added since the last save, if there are any."""
+        with self._lock:
+            if self._unsaved:
+                self._save()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+            self._save()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, int]:
+        return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float = 1, clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        """Rate limiter: allows rate calls per second on average, bursts of up to capacity."""
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take one token, sleeping until one is available. Safe to call from many threads."""
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self._rate if self._tokens < 0 else 0
+        # callers queue up by reserving tokens ahead of time, then sleeping off the debt
+        if wait > 0:
+            self._sleep(wait)
+
+
+cache = GeocodeCache(GEOCODE_CACHE_FILE)
+atexit.register(cache.flush)
+# Nominatim's usage policy allows at most one request per second per application
+nominatim_bucket = TokenBucket(rate=1.0)
+
+
+class GeocoderUnavailable(Exception):
+    """A backend could not answer right now (network down, rate-limited, ...)."""
+
+
+# responses worth asking Nominatim again for
+RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+
+
+class NominatimBackend:
+    # network answers are worth keeping in the on-disk cache
+    cacheable = True
+
+    def __init__(self, url: str = NOMINATIM_URL, user_agent: str = USER_AGENT,
+                 bucket: Optional[TokenBucket] = None, connect_timeout: float = 3.05,
+                 read_timeout: float = 5.0, retries: int = 3, backoff_factor: float = 1.0,
+                 pool_size: int = 4, retry_after: float = 60, sleep: Callable[[float], None] = time.sleep):
+        """OpenStreetMap Nominatim over a pooled, keep-alive HTTP session.
+
+        429 and 5xx responses are retried up to retries times, waiting Retry-After or
+        backoff_factor * 2**n seconds, and every attempt takes its own token from the
+        rate limit. Timeouts and connection errors are not retried: the backend reports
+        itself unavailable for retry_after seconds instead of waiting out another
+        timeout on every query. A Retry-After longer than retry_after is not waited
+        out here; the backend is just unavailable until then.
+        """
+        self._url = url
+        self._bucket = bucket
+        self._timeout = (connect_timeout, read_timeout)
+        self._retries = retries
+        self._backoff_factor = backoff_factor
+        self._retry_after = retry_after
+        self._sleep = sleep
+        self._down_until = 0.0
+        # retries are driven by lookup() so each one goes through the rate limit
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = user_agent
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _retry_delay(self, resp: requests.Response, attempt: int) -> float:
+        try:
+            return max(0.0, float(resp.headers.get("Retry-After", "")))
+        except ValueError:
+            # missing, or an HTTP date; fall back to exponential backoff
+            return self._backoff_factor * 2 ** attempt
+
+    def _unavailable(self, reason: str, wait: Optional[float] = None) -> GeocoderUnavailable:
+        self._down_until = time.monotonic() + (self._retry_after if wait is None else wait)
+        return GeocoderUnavailable(reason)
+
+    def lookup(self, q: str) -> Optional[Tuple[float, float, str]]:
+        if time.monotonic() < self._down_until:
+            raise GeocoderUnavailable("nominatim unreachable, skipping")
+        params = {"format": "json", "q": q, "limit": 1, "addressdetails": 0}
+        for attempt in range(self._retries + 1):
+            (self._bucket or nominatim_bucket).acquire()
+            try:
+                resp = self.session.get(self._url, params=params, timeout=self._timeout)
+            except requests.RequestException as e:
+                raise self._unavailable(str(e))
+            if resp.status_code not in RETRY_STATUSES:
+                break
+            delay = self._retry_delay(resp, attempt)
+            if attempt == self._retries or delay > self._retry_after:
+                raise self._unavailable(f"nominatim answered {resp.status_code}", max(delay, self._retry_after))
+            self._sleep(delay)
+        try:
+            resp.raise_for_status()
+            data = resp.json()
+        except (requests.RequestException, ValueError) as e:
+            raise self._unavailable(str(e))
+        if not data:
+            return None
+        first = data[0]
+        return float(first["lat"]), float(first["lon"]), first.get("display_name", "")
+
+    def close(self):
+        self.session.close()
+
+
+class GazetteerBackend:
+    # local lookups are cheaper than the cache
+    cacheable = False
+
+    def __init__(self, gazetteer: Gazetteer):
+        """Offline lookups of "place[, region], country" queries against a local gazetteer."""
+        self.gazetteer = gazetteer
+
+    @classmethod
+    def from_file(cls, path: str) -> 'GazetteerBackend':
+        return cls(Gazetteer.from_file(path))
+
+    def lookup(self, q: str) -> Optional[Tuple[float, float, str]]:
+        parts = [p.strip() for p in q.split(",") if p.strip()]
+        if not parts:
+            return None
+        place = self.gazetteer.lookup(parts[0], parts[-1] if len(parts) > 1 else None)
+        return (place.lat, place.lon, place.display_name) if place else None
+
+
+class StaticBackend:
+    def __init__(self, answers: Optional[Dict[str, Tuple[float, float, str]]] = None, available: bool = True,
+                 cacheable: bool = True):
+        """Canned answers keyed by query, standing in for the HTTP backend in tests and demos.
+
+        queries records every lookup; set available=False to simulate an outage.
+        """
+        self.answers = {normalize_query(k): v for k, v in (answers or {}).items()}
+        self.available = available
+        self.cacheable = cacheable
+        self.queries: List[str] = []
+
+    def lookup(self, q: str) -> Optional[Tuple[float, float, str]]:
+        self.queries.append(q)
+        if not self.available:
+            raise GeocoderUnavailable("static backend offline")
+        return self.answers.get(normalize_query(q))
+
+
+def default_backends() -> List:
+    """Offline gazetteer first (when GAZETTEER_FILE points at one), then Nominatim.
+
+    GEOCODE_CONNECT_TIMEOUT / GEOCODE_READ_TIMEOUT (seconds) tune the HTTP timeouts.
     """
+    chain = []
+    path = os.environ.get("GAZETTEER_FILE")
+    if path:
+        try:
+            chain.append(GazetteerBackend.from_file(path))
+        except Exception as e:
+            print(f"geocode: could not load gazetteer '{path}': {e}", file=sys.stderr)
+    chain.append(NominatimBackend(connect_timeout=float(os.environ.get("GEOCODE_CONNECT_TIMEOUT", 3.05)),
+                                  read_timeout=float(os.environ.get("GEOCODE_READ_TIMEOUT", 5.0))))
+    return chain
+
+
+backends = default_backends()
+
+
+def set_backends(chain: List):
+    """Replace the geocoder backends, tried in order for every query."""
+    global backends
+    backends = list(chain)
+
+
+def _perform_query(q: str) -> Optional[Tuple[float, float, str]]:
+    """Answer q from the cache or the backends; raises GeocoderUnavailable if none could say."""
+    cached = cache.get(q)
+    if cached is not _MISSING:
+        return cached
+    unavailable = False
+    for backend in backends:
+        try:
+            result = backend.lookup(q)
+        except GeocoderUnavailable as e:
+            # Print debug info to stderr to help diagnose failures (network, rate-limits, bad UA)
+            print(f"geocode: query failed for '{q}': {e}", file=sys.stderr)
+            unavailable = True
+            continue
+        if result is not None:
+            if backend.cacheable:
+                cache.put(q, result)
+            return result
+    # a definite "no match" is cached; a miss caused by an unreachable backend is not
+    if unavailable:
+        raise GeocoderUnavailable(f"no backend could answer '{q}'")
+    cache.put(q, None)
+    return None
+
+
+def candidate_queries(number: Optional[str], street: str, city: str, country: str) -> List[str]:
+    """Queries to try for an address, most specific first (full address -> without number -> city+country)."""
     street_part = " ".join(p.strip() for p in (number or "", street or "") if p and p.strip())
     parts = [p for p in (street_part, city, country) if p and p.strip()]
 
@@ -57,16 +368,122 @@ def geocode(number: Optional[str], street: str, city: str, country: str) -> Opti
         if c and c not in seen:
             seen.add(c)
             queries.append(c)
+    return queries
+
 
+def _geocode_queries(queries: List[str], query: Callable[[str], Optional[Tuple[float, float, str]]],
+                     strict: bool = False):
+    unavailable = None
     for q in queries:
         # Attempt the query
-        result = _perform_query(q)
+        try:
+            result = query(q)
+        except GeocoderUnavailable as e:
+            # a simpler query may still be answered by a local backend
+            unavailable = e
+            continue
         if result is not None:
             return result
 
     # If nothing worked, print a concise debug line and return None
-    if queries:
+    if unavailable is not None:
+        print(f"geocode: backends unavailable for queries: {queries}", file=sys.stderr)
+        if strict:
+            raise unavailable
+    elif queries:
         print(f"geocode: no results for queries: {queries}", file=sys.stderr)
     else:
         print("geocode: no address parts provided", file=sys.stderr)
     return None
+
+
+def geocode(number: Optional[str], street: str, city: str, country: str,
+            strict: bool = False) -> Optional[Tuple[float, float, str]]:
+    """Return (lat, lon, display_name) for the provided address parts or None if not found.
+
+    This function will try a few progressively simpler queries (full address -> without number -> city+country)
+    and prints debug information to stderr when queries fail. That helps explain why address lookups may not
+    resolve (network issues, rate limiting, or incomplete address parts).
+    Each query goes through the configured backends (see set_backends()); answers, including
+    "no match", are served from the on-disk cache when known.
+    With strict=True, GeocoderUnavailable is raised instead of returning None when nothing was
+    found because a backend could not be reached, so callers can retry later.
+    """
+    return _geocode_queries(candidate_queries(number, street, city, country), _perform_query, strict)
+
+
+class _SharedQueries:
+    def __init__(self):
+        """Memo of query results for one batch; concurrent askers of the same query wait for the first."""
+        # a result, or the GeocoderUnavailable the first asker got
+        self._results: Dict[str, object] = {}
+        self._in_flight: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, q: str) -> Optional[Tuple[float, float, str]]:
+        key = normalize_query(q)
+        with self._lock:
+            known = key in self._results
+            done = self._in_flight.get(key)
+            if not known and done is None:
+                self._in_flight[key] = threading.Event()
+        if done is not None:
+            done.wait()
+        elif not known:
+            result = None
+            try:
+                result = _perform_query(q)
+            except GeocoderUnavailable as e:
+                result = e
+            finally:
+                with self._lock:
+                    self._results[key] = result
+                    self._in_flight.pop(key).set()
+        result = self._results.get(key)
+        if isinstance(result, GeocoderUnavailable):
+            raise result
+        return result
+
+
+Address = Tuple[Optional[str], str, str, str]
+
+
+def geocode_batch(addresses: Iterable[Address], workers: int = 4,
+                  geocoder: Optional[Callable[..., Optional[Tuple[float, float, str]]]] = None,
+                  strict: bool = False) -> Iterator[Tuple[int, Optional[Tuple[float, float, str]]]]:
+    """Geocode many (number, street, city, country) addresses, yielding (index, result) as each finishes.
+
+    Identical addresses are looked up once, and the fallback queries are shared across rows
+    (so "Hamilton, Canada" is asked at most once per batch). At most `workers` lookups run
+    at a time; Nominatim requests still go through the shared rate limit. Pass geocoder to
+    use a per-address function in place of geocode(). With strict=True, rows that could not
+    be looked up because a backend was unavailable are left out instead of yielded as None.
+    """
+    rows: "OrderedDict[Tuple[str, ...], List[int]]" = OrderedDict()
+    addresses_by_key: Dict[Tuple[str, ...], Address] = {}
+    for index, address in enumerate(addresses):
+        key = tuple(normalize_query(p or "") for p in address)
+        rows.setdefault(key, []).append(index)
+        addresses_by_key.setdefault(key, address)
+    if not rows:
+        return
+    if geocoder is None:
+        shared = _SharedQueries()
+
+        def geocoder(*parts):
+            return _geocode_queries(candidate_queries(*parts), shared, strict)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(geocoder, *addresses_by_key[key]): key for key in rows}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except GeocoderUnavailable as e:
+                if strict:
+                    continue
+                print(f"geocode: batch lookup failed: {e}", file=sys.stderr)
+                result = None
+            except Exception as e:
+                print(f"geocode: batch lookup failed: {e}", file=sys.stderr)
+                result = None
+            for index in rows[futures[future]]:
+                yield index, result
@@ -0,0 +1,161 @@
+import math
+from typing import Callable, Dict, Hashable, Iterator, List, Optional, Set, Tuple
+
+try:
+    from .utils import EARTH_RADIUS_KM, haversine_km
+except ImportError:
+    from utils import EARTH_RADIUS_KM, haversine_km
+
+
+class GridIndex:
+    """Uniform grid hash over 2-D points (e.g. lat/lon) for fast area and nearest-point lookups.
+
+    Points are bucketed into square cells of cell_size units, so a bounding-box
+    query only visits the cells that overlap the box instead of every point.
+    """
+
+    def __init__(self, cell_size: float = 0.5):
+        if cell_size <= 0:
+            raise ValueError("cell_size must be positive")
+        self.cell_size = float(cell_size)
+        self._cells: Dict[Tuple[int, int], Set[Hashable]] = {}
+        self._points: Dict[Hashable, Tuple[float, float]] = {}
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def __contains__(self, key) -> bool:
+        return key in self._points
+
+    def _cell(self, x: float, y: float) -> Tuple[int, int]:
+        return int(math.floor(x / self.cell_size)), int(math.floor(y / self.cell_size))
+
+    def get(self, key):
+        return self._points.get(key)
+
+    def items(self):
+        """(key, (x, y)) pairs for every point."""
+        return self._points.items()
+
+    def insert(self, key: Hashable, x: float, y: float):
+        """Add or move a point."""
+        if key in self._points:
+            self.remove(key)
+        x, y = float(x), float(y)
+        self._points[key] = (x, y)
+        self._cells.setdefault(self._cell(x, y), set()).add(key)
+
+    def remove(self, key: Hashable) -> bool:
+        point = self._points.pop(key, None)
+        if point is None:
+            return False
+        cell = self._cell(*point)
+        bucket = self._cells.get(cell)
+        if bucket is not None:
+            bucket.discard(key)
+            if not bucket:
+                del self._cells[cell]
+        return True
+
+    def query_bbox(self, min_x: float, min_y: float, max_x: float, max_y: float) -> Iterator[Hashable]:
+        """Yield the keys of all points inside the box (edges included)."""
+        cx0, cy0 = self._cell(min_x, min_y)
+        cx1, cy1 = self._cell(max_x, max_y)
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > len(self._cells):
+            # box spans more cells than are occupied: walk the occupied ones instead
+            cells = [c for c in self._cells if cx0 <= c[0] <= cx1 and cy0 <= c[1] <= cy1]
+        else:
+            cells = [(cx, cy) for cx in range(cx0, cx1 + 1) for cy in range(cy0, cy1 + 1)]
+        for cell in cells:
+            for key in self._cells.get(cell, ()):
+                x, y = self._points[key]
+                if min_x <= x <= max_x and min_y <= y <= max_y:
+                    yield key
+
+    def nearest(self, x: float, y: float, k: int = 1, max_distance: Optional[float] = None,
+                distance: Optional[Callable[[float, float], float]] = None,
+                lower_bound: Optional[Callable[[float], float]] = None) -> List[Tuple[float, Hashable]]:
+        """The k points closest to (x, y) as (distance, key) pairs, nearest first.
+
+        Searches rings of cells outwards from the query cell and stops as soon as no
+        unvisited cell can hold a closer point, so the cost depends on local density
+        rather than on the total number of points. Distances are Euclidean in
+        coordinate units unless distance(px, py) is given; lower_bound(d) must then
+        return the least possible distance to a point d coordinate units away along
+        either axis.
+        """
+        if k <= 0 or not self._points:
+            return []
+        if distance is None:
+            def distance(px, py):
+                return math.hypot(px - x, py - y)
+        if lower_bound is None:
+            def lower_bound(d):
+                return d
+        cx, cy = self._cell(x, y)
+        found: List[Tuple[float, Hashable]] = []
+        visited = 0
+        ring = 0
+        while visited < len(self._cells):
+            # every cell outside the rings searched so far is at least this far away
+            reach = lower_bound(max(0, ring - 1) * self.cell_size)
+            if max_distance is not None and reach > max_distance:
+                break
+            if len(found) >= k and found[k - 1][0] <= reach:
+                break
+            if (2 * ring + 1) ** 2 > 4 * len(self._cells):
+                # the rings have outgrown the occupied area: finish with a plain scan
+                found = [(distance(px, py), key) for key, (px, py) in self._points.items()]
+                found.sort(key=lambda item: item[0])
+                break
+            for cell in self._ring(cx, cy, ring):
+                bucket = self._cells.get(cell)
+                if not bucket:
+                    continue
+                visited += 1
+                for key in bucket:
+                    found.append((distance(*self._points[key]), key))
+            found.sort(key=lambda item: item[0])
+            ring += 1
+        if max_distance is not None:
+            found = [item for item in found if item[0] <= max_distance]
+        return found[:k]
+
+    @staticmethod
+    def _ring(cx: int, cy: int, r: int) -> Iterator[Tuple[int, int]]:
+        """Cells on the square ring at Chebyshev distance r from (cx, cy)."""
+        if r == 0:
+            yield cx, cy
+            return
+        for dx in range(-r, r + 1):
+            yield cx + dx, cy - r
+            yield cx + dx, cy + r
+        for dy in range(-r + 1, r):
+            yield cx - r, cy + dy
+            yield cx + r, cy + dy
+
+
+def nearest_geodesic(index: GridIndex, lat: float, lon: float, k: int = 1,
+                     max_distance: Optional[float] = None) -> List[Tuple[float, Hashable]]:
+    """GridIndex.nearest() for an index of (lat, lon) degrees, ranked by great-circle km.
+
+    One search runs from the point itself and one from its copy 360 degrees away,
+    which finds points across the antimeridian; each search is exact for the points
+    that are closest through its copy of the query.
+    """
+    cos_lat = math.cos(math.radians(lat))
+
+    def distance(plat, plon):
+        return haversine_km(lat, lon, plat, plon)
+
+    def lower_bound(degrees):
+        # nearest possible point with latitude `degrees` away, or with longitude
+        # `degrees` away (the distance to that meridian's great circle)
+        d = math.radians(min(degrees, 90.0))
+        return EARTH_RADIUS_KM * min(d, math.asin(min(1.0, cos_lat * math.sin(d))))
+
+    found = {}
+    for image in (lon, lon - 360.0 if lon > 0 else lon + 360.0):
+        for d, key in index.nearest(lat, image, k, max_distance, distance, lower_bound):
+            found[key] = d
+    return sorted(((d, key) for key, d in found.items()), key=lambda item: item[0])[:k]
@@ -0,0 +1,337 @@
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Iterable, Iterator, List, Dict, Optional, Tuple
+
+try:
+    from .storage import (LOCATION_NOT_FOUND, LOCATION_PENDING, LOCATION_RESOLVED, decode_cursor,
+                          encode_cursor, new_report, normalize_requester_name, report_timestamp,
+                          split_legacy_details)
+except ImportError:
+    from storage import (LOCATION_NOT_FOUND, LOCATION_PENDING, LOCATION_RESOLVED, decode_cursor,
+                         encode_cursor, new_report, normalize_requester_name, report_timestamp,
+                         split_legacy_details)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS supplies (
+    item TEXT PRIMARY KEY COLLATE NOCASE,
+    quantity INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS reports (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    disaster_type TEXT NOT NULL,
+    details TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    lat REAL,
+    lon REAL,
+    resolved_address TEXT,
+    location_status TEXT,
+    location_query TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_reports_timestamp ON reports (timestamp);
+CREATE INDEX IF NOT EXISTS idx_reports_disaster_type ON reports (disaster_type COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_reports_name ON reports (name COLLATE NOCASE);
+CREATE TABLE IF NOT EXISTS requesters (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL UNIQUE COLLATE NOCASE
+);
+"""
+
+REPORT_COLUMNS = ('id, name, disaster_type, details, timestamp, lat, lon, resolved_address, '
+                  'location_status, location_query')
+
+
+def _report_row(row: sqlite3.Row) -> Dict:
+    report = dict(row)
+    query = report.pop('location_query')
+    if query:
+        report['location_query'] = json.loads(query)
+    return report
+
+
+class SqliteStorage:
+    def __init__(self, database: str = 'data/storage.db', max_requesters: Optional[int] = None):
+        """Storage backed by a SQLite database.
+
+        Exposes the same API as storage.Storage. The database runs in WAL mode so
+        several threads or worker processes can share one file: readers never block
+        the writer, and each read-modify-write runs in its own IMMEDIATE transaction.
+        Pass ':memory:' for a throwaway database (used by tests).
+        max_requesters caps the requester registry, dropping the oldest names first.
+        """
+        self._database = database
+        self._max_requesters = max_requesters
+        if database != ':memory:':
+            dirpath = os.path.dirname(database)
+            if dirpath:
+                os.makedirs(dirpath, exist_ok=True)
+        # sqlite3 connections must not be shared across threads; keep one per thread.
+        # An in-memory database only exists on its own connection, so share that one.
+        self._local = threading.local()
+        self._shared_conn = None
+        # serialises writers within this process; other processes wait on SQLite's own lock
+        self._write_lock = threading.RLock()
+        if database == ':memory:':
+            self._shared_conn = self._connect()
+        conn = self._conn()
+        with conn:
+            conn.executescript(SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        """Bring databases created by older versions up to the current schema."""
+        with self._write() as conn:
+            columns = {row['name'] for row in conn.execute('PRAGMA table_info(reports)')}
+            if 'lat' not in columns:
+                conn.execute('ALTER TABLE reports ADD COLUMN lat REAL')
+                conn.execute('ALTER TABLE reports ADD COLUMN lon REAL')
+                conn.execute('ALTER TABLE reports ADD COLUMN resolved_address TEXT')
+                # one-time split of geocode results that used to be packed into details
+                rows = conn.execute("SELECT id, details FROM reports WHERE details LIKE '%location_resolved:%'")
+                for row in rows.fetchall():
+                    description, address, lat, lon = split_legacy_details(row['details'])
+                    conn.execute('UPDATE reports SET details = ?, resolved_address = ?, lat = ?, lon = ? '
+                                 'WHERE id = ?', (description, address, lat, lon, row['id']))
+            if 'location_status' not in columns:
+                conn.execute('ALTER TABLE reports ADD COLUMN location_status TEXT')
+                conn.execute('ALTER TABLE reports ADD COLUMN location_query TEXT')
+                conn.execute('UPDATE reports SET location_status = ? WHERE lat IS NOT NULL', (LOCATION_RESOLVED,))
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_reports_lat_lon ON reports (lat, lon)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_reports_location_status ON reports (location_status)')
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self._database, timeout=30, isolation_level=None,
+                               check_same_thread=self._database != ':memory:')
+        conn.row_factory = sqlite3.Row
+        if self._database != ':memory:':
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _conn(self) -> sqlite3.Connection:
+        if self._shared_conn is not None:
+            return self._shared_conn
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    @contextmanager
+    def _write(self) -> Iterator[sqlite3.Connection]:
+        """Run a write transaction (BEGIN IMMEDIATE ... COMMIT, ROLLBACK on error)."""
+        with self._write_lock:
+            conn = self._conn()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+        if self._shared_conn is not None:
+            self._shared_conn.close()
+            self._shared_conn = None
+
+    # Supplies API
+    def add_supplies(self, item: str, quantity: int):
+        with self._write() as conn:
+            conn.execute(
+                'INSERT INTO supplies (item, quantity) VALUES (?, ?) '
+                'ON CONFLICT(item) DO UPDATE SET quantity = quantity + excluded.quantity',
+                (item, int(quantity)))
+
+    def check_inventory(self, item: str) -> int:
+        row = self._conn().execute('SELECT quantity FROM supplies WHERE item = ?', (item,)).fetchone()
+        return int(row['quantity']) if row else 0
+
+    def remove_supplies(self, item: str, quantity: int) -> bool:
+        # Remove quantity and raise ValueError if attempting to remove more than available
+        with self._write() as conn:
+            row = conn.execute('SELECT quantity FROM supplies WHERE item = ?', (item,)).fetchone()
+            if row is None:
+                raise ValueError(f"Item '{item}' not found in storage")
+            if row['quantity'] < quantity:
+                raise ValueError(f"Not enough '{item}' in storage to remove {quantity}")
+            if row['quantity'] == quantity:
+                conn.execute('DELETE FROM supplies WHERE item = ?', (item,))
+            else:
+                conn.execute('UPDATE supplies SET quantity = quantity - ? WHERE item = ?', (int(quantity), item))
+        return True
+
+    def reserve_supplies(self, items: Dict[str, int]) -> bool:
+        """Remove several items in one transaction, all or nothing (ValueError if any is short)."""
+        with self._write() as conn:
+            for item, quantity in items.items():
+                row = conn.execute('SELECT quantity FROM supplies WHERE item = ?', (item,)).fetchone()
+                if row is None:
+                    raise ValueError(f"Item '{item}' not found in storage")
+                if row['quantity'] < quantity:
+                    raise ValueError(f"Not enough '{item}' in storage to remove {quantity}")
+                conn.execute('UPDATE supplies SET quantity = quantity - ? WHERE item = ?', (int(quantity), item))
+            conn.execute('DELETE FROM supplies WHERE quantity <= 0')
+        return True
+
+    def release_supplies(self, items: Dict[str, int]):
+        """Put back stock taken by reserve_supplies()."""
+        with self._write() as conn:
+            conn.executemany(
+                'INSERT INTO supplies (item, quantity) VALUES (?, ?) '
+                'ON CONFLICT(item) DO UPDATE SET quantity = quantity + excluded.quantity',
+                [(item, int(quantity)) for item, quantity in items.items()])
+
+    def get_supplies(self) -> Dict[str, int]:
+        """Get a copy of the current supplies inventory."""
+        rows = self._conn().execute('SELECT item, quantity FROM supplies ORDER BY rowid').fetchall()
+        return {r['item']: int(r['quantity']) for r in rows}
+
+    # Requester/report API
+    @property
+    def requesters(self) -> List[str]:
+        rows = self._conn().execute('SELECT name FROM requesters ORDER BY id').fetchall()
+        return [r['name'] for r in rows]
+
+    def has_requester(self, name: str) -> bool:
+        row = self._conn().execute('SELECT 1 FROM requesters WHERE name = ?',
+                                   (normalize_requester_name(name),)).fetchone()
+        return row is not None
+
+    def _register_requesters(self, conn: sqlite3.Connection, names: Iterable[str]) -> int:
+        before = conn.total_changes
+        conn.executemany('INSERT OR IGNORE INTO requesters (name) VALUES (?)',
+                         [(n,) for n in map(normalize_requester_name, names) if n])
+        added = conn.total_changes - before
+        if added and self._max_requesters is not None:
+            conn.execute('DELETE FROM requesters WHERE id NOT IN '
+                         '(SELECT id FROM requesters ORDER BY id DESC LIMIT ?)', (self._max_requesters,))
+        return added
+
+    def add_requester(self, name: str):
+        with self._write() as conn:
+            self._register_requesters(conn, [name])
+
+    def bulk_add_requesters(self, names: Iterable[str]) -> int:
+        """Register many requester names in one transaction. Returns how many were new."""
+        with self._write() as conn:
+            return self._register_requesters(conn, names)
+
+    def add_report(self, name: str, disaster_type: str, details: str,
+                   lat: Optional[float] = None, lon: Optional[float] = None,
+                   resolved_address: Optional[str] = None,
+                   location_query: Optional[Dict] = None) -> int:
+        """Store a report and return its id. See Storage.add_report()."""
+        return self.add_reports([{'name': name, 'disaster_type': disaster_type, 'details': details,
+                                  'lat': lat, 'lon': lon, 'resolved_address': resolved_address,
+                                  'location_query': location_query}])[0]
+
+    def add_reports(self, reports: Iterable[Dict]) -> List[int]:
+        """Store many reports in one transaction. Returns the new ids in input order."""
+        batch = [new_report(**r) for r in reports]
+        ids = []
+        with self._write() as conn:
+            # stamped under the write lock, so timestamps follow rowid order
+            timestamp = report_timestamp()
+            for r in batch:
+                r['timestamp'] = timestamp
+                query = r.get('location_query')
+                cur = conn.execute('INSERT INTO reports (name, disaster_type, details, timestamp, lat, lon, '
+                                   'resolved_address, location_status, location_query) '
+                                   'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                   (r['name'], r['disaster_type'], r['details'], r['timestamp'], r['lat'],
+                                    r['lon'], r['resolved_address'], r['location_status'],
+                                    json.dumps(query) if query else None))
+                ids.append(cur.lastrowid)
+            self._register_requesters(conn, [r['name'] for r in batch])
+        return ids
+
+    def get_reports(self) -> List[Dict]:
+        rows = self._conn().execute(
+            f'SELECT {REPORT_COLUMNS} FROM reports ORDER BY id').fetchall()
+        return [_report_row(r) for r in rows]
+
+    def get_report(self, report_id: int) -> Optional[Dict]:
+        row = self._conn().execute(f'SELECT {REPORT_COLUMNS} FROM reports WHERE id = ?',
+                                   (report_id,)).fetchone()
+        return _report_row(row) if row else None
+
+    def query_reports(self, disaster_type: Optional[str] = None, reporter: Optional[str] = None,
+                      since: Optional[str] = None, until: Optional[str] = None,
+                      bbox: Optional[Tuple[float, float, float, float]] = None,
+                      cursor: Optional[str] = None, limit: int = 50,
+                      newest_first: bool = False) -> Tuple[List[Dict], Optional[str]]:
+        """Return one page of matching reports and a cursor for the next page (None when done).
+
+        Same contract as Storage.query_reports(); the cursor is the last row id seen,
+        so paging is an indexed range scan regardless of how deep the page is, and a
+        bbox uses the (lat, lon) index.
+        """
+        where, params = [], []
+        if disaster_type:
+            where.append('disaster_type = ? COLLATE NOCASE')
+            params.append(disaster_type)
+        if reporter:
+            where.append('name = ? COLLATE NOCASE')
+            params.append(normalize_requester_name(reporter))
+        if since:
+            where.append('timestamp >= ?')
+            params.append(since)
+        if until:
+            where.append('timestamp < ?')
+            params.append(until)
+        if bbox:
+            min_lat, min_lon, max_lat, max_lon = bbox
+            where.append('lat BETWEEN ? AND ? AND lon BETWEEN ? AND ?')
+            params.extend([min_lat, max_lat, min_lon, max_lon])
+        if cursor:
+            where.append('id < ?' if newest_first else 'id > ?')
+            params.append(decode_cursor(cursor)['id'])
+        sql = f'SELECT {REPORT_COLUMNS} FROM reports'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY id DESC' if newest_first else ' ORDER BY id'
+        sql += ' LIMIT ?'
+        params.append(limit + 1)
+        page = [_report_row(r) for r in self._conn().execute(sql, params)]
+        if len(page) > limit:
+            page = page[:limit]
+            return page, encode_cursor({'id': page[-1]['id']})
+        return page, None
+
+    def reports_in_area(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> List[Dict]:
+        """All reports whose location falls inside the box, in filing order."""
+        rows = self._conn().execute(
+            f'SELECT {REPORT_COLUMNS} FROM reports WHERE lat BETWEEN ? AND ? AND lon BETWEEN ? AND ? '
+            'ORDER BY id', (min_lat, max_lat, min_lon, max_lon)).fetchall()
+        return [_report_row(r) for r in rows]
+
+    def set_report_location(self, report_id: int, lat: Optional[float], lon: Optional[float],
+                            resolved_address: Optional[str] = None) -> bool:
+        """Record the geocoding outcome for a report (lat=None means not found)."""
+        status = LOCATION_RESOLVED if lat is not None else LOCATION_NOT_FOUND
+        with self._write() as conn:
+            cur = conn.execute('UPDATE reports SET lat = ?, lon = ?, resolved_address = ?, location_status = ?, '
+                               'location_query = NULL WHERE id = ?',
+                               (lat, lon, resolved_address, status, report_id))
+        return cur.rowcount > 0
+
+    def pending_location_reports(self) -> List[Dict]:
+        """Reports still waiting for their address to be geocoded, oldest first."""
+        rows = self._conn().execute(f'SELECT {REPORT_COLUMNS} FROM reports WHERE location_status = ? '
+                                    'ORDER BY id', (LOCATION_PENDING,)).fetchall()
+        return [_report_row(r) for r in rows]
+
+    def delete_report(self, report_id: int) -> bool:
+        """Delete a report by its id. Returns True if successful."""
+        with self._write() as conn:
+            cur = conn.execute('DELETE FROM reports WHERE id = ?', (report_id,))
+        return cur.rowcount > 0
+
@@ -1,33 +1,241 @@
+import base64
 import json
 import os
-from typing import Optional, List, Dict
+import re
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Iterable, Optional, List, Dict, Tuple
 from datetime import datetime
 
+try:
+    from .spatial import GridIndex
+    from .utils import Journal, atomic_write_json, bump_version, env_flag, file_lock, read_version
+except ImportError:
+    from spatial import GridIndex
+    from utils import Journal, atomic_write_json, bump_version, env_flag, file_lock, read_version
+
+
+def _normalize_item(item: str) -> str:
+    return item.strip().lower()
+
+
+def normalize_requester_name(name: str) -> str:
+    """Tidy a requester name for display: trim and collapse internal whitespace."""
+    return ' '.join((name or '').split())
+
+
+# Older reports had the geocode result packed into details:
+# "<description> | location_resolved: <address> | lat:43.25 lon:-79.87"
+_LEGACY_LAT_RE = re.compile(r"lat:\s*([\-\d\.]+)")
+_LEGACY_LON_RE = re.compile(r"lon:\s*([\-\d\.]+)")
+
+
+def split_legacy_details(details: str) -> Tuple[str, Optional[str], Optional[float], Optional[float]]:
+    """Split packed legacy details into (description, resolved_address, lat, lon)."""
+    details = details or ''
+    if 'location_resolved:' not in details:
+        return details, None, None, None
+    description, rest = details.split('location_resolved:', 1)
+    address = rest.split('|', 1)[0].strip() or None
+    coords = []
+    for pattern in (_LEGACY_LAT_RE, _LEGACY_LON_RE):
+        match = pattern.search(rest)
+        try:
+            coords.append(float(match.group(1)) if match else None)
+        except ValueError:
+            coords.append(None)
+    return description.rstrip(' |').strip(), address, coords[0], coords[1]
+
+
+def migrate_report_location(report: Dict) -> bool:
+    """Give a report the structured lat/lon/resolved_address fields (in place).
+
+    Returns True if the report was changed.
+    """
+    if 'lat' in report and 'lon' in report and 'resolved_address' in report:
+        return False
+    description, address, lat, lon = split_legacy_details(report.get('details', ''))
+    report['details'] = description
+    report.setdefault('lat', lat)
+    report.setdefault('lon', lon)
+    report.setdefault('resolved_address', address)
+    return True
+
+
+# location_status values; reports filed without any address have no status
+LOCATION_PENDING = 'pending'
+LOCATION_RESOLVED = 'resolved'
+LOCATION_NOT_FOUND = 'not_found'
+
+
+def location_status(lat: Optional[float], location_query: Optional[Dict]) -> Optional[str]:
+    """Initial location_status of a new report."""
+    if lat is not None:
+        return LOCATION_RESOLVED
+    if location_query and any(location_query.values()):
+        return LOCATION_PENDING
+    return None
+
+
+def report_timestamp() -> str:
+    return datetime.utcnow().isoformat() + 'Z'
+
+
+def new_report(name: str, disaster_type: str, details: str, lat: Optional[float] = None,
+               lon: Optional[float] = None, resolved_address: Optional[str] = None,
+               location_query: Optional[Dict] = None) -> Dict:
+    """Build a report record (without its id) from add_report() arguments.
+
+    Storage backends restamp it with report_timestamp() when they allocate the id,
+    so timestamps follow id order even with concurrent writers.
+    """
+    report = {
+        'name': name,
+        'disaster_type': disaster_type,
+        'details': details,
+        'timestamp': report_timestamp(),
+        'lat': float(lat) if lat is not None else None,
+        'lon': float(lon) if lon is not None else None,
+        'resolved_address': resolved_address,
+        'location_status': location_status(lat, location_query),
+    }
+    if report['location_status'] == LOCATION_PENDING:
+        report['location_query'] = dict(location_query)
+    return report
+
+
+def report_coordinates(report: Dict) -> Optional[Tuple[float, float]]:
+    """(lat, lon) of a report, or None if it was filed without a resolved location."""
+    if report.get('lat') is None or report.get('lon') is None:
+        return None
+    return float(report['lat']), float(report['lon'])
+
+
+def report_matches(report: Dict, disaster_type: Optional[str] = None, reporter: Optional[str] = None,
+                   bbox: Optional[Tuple[float, float, float, float]] = None) -> bool:
+    """Check a report against the non-time filters of query_reports()."""
+    if disaster_type and (report.get('disaster_type') or '').casefold() != disaster_type.casefold():
+        return False
+    if reporter and normalize_requester_name(report.get('name', '')).casefold() != \
+            normalize_requester_name(reporter).casefold():
+        return False
+    if bbox:
+        coords = report_coordinates(report)
+        if coords is None:
+            return False
+        min_lat, min_lon, max_lat, max_lon = bbox
+        if not (min_lat <= coords[0] <= max_lat and min_lon <= coords[1] <= max_lon):
+            return False
+    return True
+
+
+def encode_cursor(position: Dict) -> str:
+    """Pack a pagination position into an opaque, URL-safe token."""
+    raw = json.dumps(position, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Dict:
+    """Inverse of encode_cursor(). Raises ValueError for a malformed token or a non-integer id."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        position = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(position, dict):
+        raise ValueError("Invalid cursor")
+    last_id = position.get('id')
+    if not isinstance(last_id, int) or isinstance(last_id, bool):
+        raise ValueError("Invalid cursor")
+    return position
+
+
+def _report_time(report: Dict) -> str:
+    return report.get('timestamp') or ''
+
+
+def _report_id(report: Dict) -> int:
+    return report['id']
+
 
 class Storage:
-    def __init__(self, persistence_file: Optional[str] = None):
+    def __init__(self, persistence_file: Optional[str] = None, journal: bool = False,
+                 compact_threshold: int = 1000, shared: bool = False,
+                 max_requesters: Optional[int] = None):
         """Storage with optional JSON persistence.
 
         If persistence_file is provided (e.g. 'data/storage.json'), the storage will
         load existing supplies/reports from that file (if present) and save after changes.
         If persistence_file is None, storage is in-memory only (used by tests).
+
+        With journal=True, mutations are appended as compact records to
+        '<persistence_file>.log' instead of rewriting the whole file. Once the log
+        holds compact_threshold records it is folded into a fresh snapshot.
+
+        With shared=True, several processes may use the same file: every mutation
+        runs under an advisory lock on '<persistence_file>.lock' and first reloads
+        the data if another process changed it since we last looked.
+
+        max_requesters caps the requester registry; once full, the oldest names
+        are rotated out as new ones arrive.
         """
         self.supplies: Dict[str, int] = {}
-        # Keep a list of reports submitted by non-government users
-        # Each report is a dict: {"name": str, "disaster_type": str, "details": str, "timestamp": str}
-        self.reports: List[Dict] = []
-        # Keep a list of known requester names
-        self.requesters: List[str] = []
+        # normalized item name -> key actually used in self.supplies
+        self._supply_keys: Dict[str, str] = {}
+        # Reports submitted by non-government users, in id (= filing) order. Each report is a
+        # dict: {"id": int, "name": str, "disaster_type": str, "details": str, "timestamp": str}.
+        # Deleted reports stay in the list as tombstones until enough accumulate to compact.
+        self._reports: List[Dict] = []
+        # report id -> report, for live (non-deleted) reports only
+        self._report_index: Dict[int, Dict] = {}
+        self._next_report_id = 1
+        self._tombstones = 0
+        # spatial index of report id -> (lat, lon) for reports with a resolved location
+        self._report_geo = GridIndex()
+        # set when loading rewrote legacy records, so the migrated form gets saved once
+        self._migrated = False
+        # Registry of known requester names: casefolded name -> display name, in
+        # insertion order (an ordered set with O(1) membership checks)
+        self._requesters: OrderedDict = OrderedDict()
+        self._max_requesters = max_requesters
 
         self._persistence_file = persistence_file
+        # sequence number of the last applied mutation (journal mode only)
+        self._seq = 0
+        self._journal: Optional[Journal] = None
+        self._compact_threshold = compact_threshold
+        self._shared = bool(shared and persistence_file)
+        # change counter (kept in the lock file) at our last load/write; shared mode only
+        self._version = None
+        self._lock = threading.RLock()
         if self._persistence_file:
             # Ensure directory exists
             dirpath = os.path.dirname(self._persistence_file)
             if dirpath:
                 os.makedirs(dirpath, exist_ok=True)
+            if journal:
+                self._journal = Journal(self._persistence_file + '.log')
             self._load()
+            if self._migrated:
+                with self._transaction():
+                    if self._journal:
+                        self._compact()
+                    else:
+                        self._save()
 
     def _load(self):
+        self.supplies = {}
+        self._supply_keys = {}
+        self._reports = []
+        self._report_index = {}
+        self._next_report_id = 1
+        self._tombstones = 0
+        self._report_geo = GridIndex()
+        self._migrated = False
+        self._requesters = OrderedDict()
+        self._seq = 0
         try:
             if os.path.exists(self._persistence_file):
                 with open(self._persistence_file, 'r', encoding='utf-8') as f:
@@ -37,100 +245,480 @@ class Storage:
                         # 1) flat mapping of item -> int (older format)
                         # 2) structured mapping: {"supplies": {...}, "reports": [...], "requesters": [...]}
                         if 'supplies' in data:
-                            self.supplies = {k: int(v) for k, v in data.get('supplies', {}).items()}
-                            self.reports = data.get('reports', []) or []
-                            self.requesters = data.get('requesters', []) or []
+                            self._load_supplies(data.get('supplies', {}))
+                            self._load_reports(data.get('reports', []) or [], int(data.get('next_report_id', 1)))
+                            self._register_requesters(data.get('requesters', []) or [])
+                            self._seq = int(data.get('seq', 0))
                         else:
                             # assume flat mapping
-                            self.supplies = {k: int(v) for k, v in data.items()}
+                            self._load_supplies(data)
         except Exception:
             # If loading fails, keep defaults but don't raise in app runtime
             self.supplies = {}
-            self.reports = []
-            self.requesters = []
+            self._supply_keys = {}
+            self._reports = []
+            self._report_index = {}
+            self._next_report_id = 1
+            self._report_geo = GridIndex()
+            self._requesters = OrderedDict()
+            self._seq = 0
+        if self._journal:
+            # Replay mutations made since the snapshot was written. Records already
+            # folded into the snapshot (seq <= snapshot seq) are skipped.
+            for record in self._journal.replay():
+                if int(record.get('seq', 0)) <= self._seq:
+                    continue
+                try:
+                    self._apply(record)
+                except Exception:
+                    continue
+                self._seq = int(record['seq'])
+
+    def _refresh(self):
+        """Reload from disk if another process changed the file (shared mode only)."""
+        if self._shared and read_version(self._persistence_file) != self._version:
+            with self._lock, file_lock(self._persistence_file) as lock:
+                self._load()
+                self._version = read_version(lock)
+
+    @contextmanager
+    def _transaction(self):
+        """Serialise a read-modify-write cycle across threads and, in shared mode, processes."""
+        with self._lock:
+            if not self._shared:
+                yield
+                return
+            with file_lock(self._persistence_file) as lock:
+                if read_version(lock) != self._version:
+                    self._load()
+                yield
+                self._version = bump_version(lock)
 
-    def _save(self):
+    def _load_supplies(self, raw: Dict):
+        """Load supplies and build the key index, merging entries that differ only by case
+        (e.g. legacy "Blankets" and "blankets") under the first spelling seen."""
+        for item, quantity in raw.items():
+            key = self._supply_keys.setdefault(_normalize_item(item), item)
+            self.supplies[key] = self.supplies.get(key, 0) + int(quantity)
+
+    def _load_reports(self, reports: List[Dict], next_report_id: int):
+        """Load reports and build the id index.
+
+        Files written before reports had ids are migrated by numbering the reports in
+        timestamp order, and locations packed into details are split out into the
+        lat/lon/resolved_address fields. query_reports() binary-searches on both id
+        and timestamp.
+        """
+        reports = [r for r in reports if isinstance(r, dict)]
+        for report in reports:
+            if migrate_report_location(report):
+                self._migrated = True
+        if any(not isinstance(r.get('id'), int) for r in reports):
+            reports.sort(key=_report_time)
+            for report_id, report in enumerate(reports, start=1):
+                report['id'] = report_id
+        elif any(a['id'] > b['id'] for a, b in zip(reports, reports[1:])):
+            reports.sort(key=lambda r: r['id'])
+        self._reports = reports
+        self._report_index = {r['id']: r for r in reports}
+        for report in reports:
+            self._index_location(report)
+        self._next_report_id = max([next_report_id] + [r['id'] + 1 for r in reports[-1:]])
+
+    def _index_location(self, report: Dict):
+        coords = report_coordinates(report)
+        if coords is not None:
+            self._report_geo.insert(report['id'], coords[0], coords[1])
+
+    def _live_reports(self) -> List[Dict]:
+        if not self._tombstones:
+            return list(self._reports)
+        return [r for r in self._reports if r['id'] in self._report_index]
+
+    def _compact_reports(self):
+        """Drop tombstoned reports from the list once they make up a sizeable share of it."""
+        if self._tombstones > max(32, len(self._reports) // 4):
+            self._reports = self._live_reports()
+            self._tombstones = 0
+
+    def _save(self) -> bool:
         if not self._persistence_file:
-            return
+            return False
         try:
             payload = {
                 'supplies': self.supplies,
-                'reports': self.reports,
+                'reports': self._live_reports(),
                 'requesters': self.requesters,
+                'next_report_id': self._next_report_id,
             }
-            with open(self._persistence_file, 'w', encoding='utf-8') as f:
-                json.dump(payload, f, indent=2)
+            if self._journal:
+                payload['seq'] = self._seq
+            atomic_write_json(self._persistence_file, payload)
+            return True
         except Exception:
             # On failure to persist, ignore (do not crash the app)
+            return False
+
+    def compact(self):
+        """Write a full snapshot and truncate the journal (no-op without a journal)."""
+        if not self._journal:
+            return
+        with self._transaction():
+            self._compact()
+
+    def _compact(self):
+        # only drop the log once its contents are safely in the snapshot
+        if not self._save():
+            return
+        try:
+            self._journal.truncate()
+        except Exception:
             pass
 
+    def _apply(self, record: Dict):
+        """Apply a mutation record to the in-memory state.
+
+        Used both for live mutations and for journal replay, so it must not persist.
+        """
+        op = record['op']
+        if op == 'add_supplies':
+            self._add_stock(record['item'], record['quantity'])
+        elif op == 'remove_supplies':
+            self._remove_stock(record['item'], record['quantity'])
+        elif op == 'reserve_supplies':
+            for item, quantity in record['items'].items():
+                self._remove_stock(item, quantity)
+        elif op == 'release_supplies':
+            for item, quantity in record['items'].items():
+                self._add_stock(item, quantity)
+        elif op == 'add_requester':
+            self._register_requesters([record['name']])
+        elif op == 'add_requesters':
+            self._register_requesters(record['names'])
+        elif op == 'add_report':
+            self._insert_report(record['report'])
+        elif op == 'add_reports':
+            for report in record['reports']:
+                self._insert_report(report)
+        elif op == 'set_location':
+            report = self._report_index[int(record['id'])]
+            report['lat'] = float(record['lat']) if record['lat'] is not None else None
+            report['lon'] = float(record['lon']) if record['lon'] is not None else None
+            report['resolved_address'] = record.get('resolved_address')
+            report['location_status'] = LOCATION_RESOLVED if report['lat'] is not None else LOCATION_NOT_FOUND
+            report.pop('location_query', None)
+            self._report_geo.remove(report['id'])
+            self._index_location(report)
+        elif op == 'delete_report':
+            # O(1) tombstone: the list entry is only dropped by a later compaction
+            del self._report_index[int(record['id'])]
+            self._report_geo.remove(int(record['id']))
+            self._tombstones += 1
+            self._compact_reports()
+        else:
+            raise ValueError(f"Unknown storage operation '{op}'")
+
+    def _add_stock(self, item: str, quantity: int):
+        key = self._supply_keys.setdefault(_normalize_item(item), item)
+        self.supplies[key] = self.supplies.get(key, 0) + int(quantity)
+
+    def _remove_stock(self, item: str, quantity: int):
+        key = self._get_actual_key(item)
+        self.supplies[key] -= int(quantity)
+        if self.supplies[key] <= 0:
+            del self.supplies[key]
+            del self._supply_keys[_normalize_item(key)]
+
+    def _insert_report(self, report: Dict):
+        migrate_report_location(report)
+        self._reports.append(report)
+        self._report_index[report['id']] = report
+        self._index_location(report)
+        self._next_report_id = max(self._next_report_id, report['id'] + 1)
+        self._register_requesters([report.get('name', '')])
+
+    def _commit(self, record: Dict):
+        """Apply a mutation and persist it (journal append or full snapshot)."""
+        self._apply(record)
+        if not self._journal:
+            self._save()
+            return
+        self._seq += 1
+        record['seq'] = self._seq
+        try:
+            self._journal.append(record)
+        except Exception:
+            # On failure to persist, ignore (do not crash the app)
+            return
+        if self._journal.records >= self._compact_threshold:
+            self._compact()
+
     def _get_actual_key(self, item: str) -> str:
         """Find the actual key in storage matching the item name case-insensitively."""
-        item_lower = item.lower()
-        for key in self.supplies.keys():
-            if key.lower() == item_lower:
-                return key
-        return item  # Return original if no match found
+        return self._supply_keys.get(_normalize_item(item), item)  # original if no match found
 
     # Supplies API
     def add_supplies(self, item: str, quantity: int):
-        actual_key = self._get_actual_key(item)
-        if actual_key in self.supplies:
-            self.supplies[actual_key] += quantity
-        else:
-            self.supplies[actual_key] = quantity
-        self._save()
+        with self._transaction():
+            actual_key = self._get_actual_key(item)
+            self._commit({'op': 'add_supplies', 'item': actual_key, 'quantity': quantity})
 
     def check_inventory(self, item: str) -> int:
         # Return quantity for a specific item; 0 if not present
+        self._refresh()
         actual_key = self._get_actual_key(item)
         return int(self.supplies.get(actual_key, 0))
 
     def remove_supplies(self, item: str, quantity: int) -> bool:
         # Remove quantity and raise ValueError if attempting to remove more than available
-        actual_key = self._get_actual_key(item)
-        if actual_key not in self.supplies:
-            raise ValueError(f"Item '{item}' not found in storage")
-        if self.supplies[actual_key] < quantity:
-            raise ValueError(f"Not enough '{item}' in storage to remove {quantity}")
-        self.supplies[actual_key] -= quantity
-        if self.supplies[actual_key] == 0:
-            del self.supplies[actual_key]
-        self._save()
+        with self._transaction():
+            actual_key = self._get_actual_key(item)
+            if actual_key not in self.supplies:
+                raise ValueError(f"Item '{item}' not found in storage")
+            if self.supplies[actual_key] < quantity:
+                raise ValueError(f"Not enough '{item}' in storage to remove {quantity}")
+            self._commit({'op': 'remove_supplies', 'item': actual_key, 'quantity': quantity})
         return True
 
+    def reserve_supplies(self, items: Dict[str, int]) -> bool:
+        """Remove several items at once, all or nothing.
+
+        Raises ValueError (and removes nothing) if any item is missing or short.
+        """
+        with self._transaction():
+            keys = {}
+            for item, quantity in items.items():
+                actual_key = self._get_actual_key(item)
+                if actual_key not in self.supplies:
+                    raise ValueError(f"Item '{item}' not found in storage")
+                if self.supplies[actual_key] < quantity + keys.get(actual_key, 0):
+                    raise ValueError(f"Not enough '{item}' in storage to remove {quantity}")
+                keys[actual_key] = keys.get(actual_key, 0) + int(quantity)
+            self._commit({'op': 'reserve_supplies', 'items': keys})
+        return True
+
+    def release_supplies(self, items: Dict[str, int]):
+        """Put back stock taken by reserve_supplies() (e.g. when the rest of a dispatch failed)."""
+        with self._transaction():
+            self._commit({'op': 'release_supplies',
+                          'items': {self._get_actual_key(item): int(q) for item, q in items.items()}})
+
     # Requester/report API
+    @property
+    def requesters(self) -> List[str]:
+        """Known requester names, oldest first."""
+        return list(self._requesters.values())
+
+    def has_requester(self, name: str) -> bool:
+        return normalize_requester_name(name).casefold() in self._requesters
+
+    def _register_requesters(self, names: Iterable[str]) -> List[str]:
+        """Add names to the registry (no persistence). Returns the names that were new."""
+        added = []
+        for name in names:
+            name = normalize_requester_name(name)
+            key = name.casefold()
+            if not key or key in self._requesters:
+                continue
+            self._requesters[key] = name
+            added.append(name)
+        if self._max_requesters is not None:
+            while len(self._requesters) > self._max_requesters:
+                self._requesters.popitem(last=False)
+        return added
+
     def add_requester(self, name: str):
-        name = name.strip()
+        name = normalize_requester_name(name)
         if not name:
             return
-        if name not in self.requesters:
-            self.requesters.append(name)
-            self._save()
+        with self._transaction():
+            if not self.has_requester(name):
+                self._commit({'op': 'add_requester', 'name': name})
+
+    def bulk_add_requesters(self, names: Iterable[str]) -> int:
+        """Register many requester names (e.g. from an intake sheet) with a single save.
+
+        Returns the number of names that were not already known.
+        """
+        with self._transaction():
+            new = OrderedDict()
+            for name in names:
+                name = normalize_requester_name(name)
+                key = name.casefold()
+                if key and key not in self._requesters:
+                    new.setdefault(key, name)
+            if new:
+                self._commit({'op': 'add_requesters', 'names': list(new.values())})
+        return len(new)
+
+    def add_report(self, name: str, disaster_type: str, details: str,
+                   lat: Optional[float] = None, lon: Optional[float] = None,
+                   resolved_address: Optional[str] = None,
+                   location_query: Optional[Dict] = None) -> int:
+        """Store a report and return its id. lat/lon/resolved_address come from geocoding.
+
+        Pass location_query (the address parts) instead of coordinates to file the
+        report as pending; set_report_location() fills the location in later.
+        """
+        report = new_report(name, disaster_type, details, lat, lon, resolved_address, location_query)
+        # the requester is recorded as part of the same mutation (single save)
+        with self._transaction():
+            report['id'] = self._next_report_id
+            report['timestamp'] = report_timestamp()
+            self._commit({'op': 'add_report', 'report': report})
+        return report['id']
 
-    def add_report(self, name: str, disaster_type: str, details: str):
-        report = {
-            'name': name,
-            'disaster_type': disaster_type,
-            'details': details,
-            'timestamp': datetime.utcnow().isoformat() + 'Z',
-        }
-        self.reports.append(report)
-        # also ensure requester is recorded
-        self.add_requester(name)
-        self._save()
+    def add_reports(self, reports: Iterable[Dict]) -> List[int]:
+        """Store many reports (dicts of add_report() arguments) with a single save.
+
+        Returns the new ids in input order.
+        """
+        batch = [new_report(**r) for r in reports]
+        if not batch:
+            return []
+        with self._transaction():
+            timestamp = report_timestamp()
+            for report_id, report in enumerate(batch, start=self._next_report_id):
+                report['id'] = report_id
+                report['timestamp'] = timestamp
+            self._commit({'op': 'add_reports', 'reports': batch})
+        return [r['id'] for r in batch]
+
+    @property
+    def reports(self) -> List[Dict]:
+        """Live reports in filing order (same as get_reports(), without reloading)."""
+        return self._live_reports()
 
     def get_reports(self) -> List[Dict]:
-        return list(self.reports)
+        self._refresh()
+        with self._lock:
+            return self._live_reports()
 
-    def delete_report(self, index: int) -> bool:
-        """Delete a report by its index (1-based). Returns True if successful."""
-        if 1 <= index <= len(self.reports):
-            del self.reports[index - 1]
-            self._save()
-            return True
+    def get_report(self, report_id: int) -> Optional[Dict]:
+        self._refresh()
+        return self._report_index.get(report_id)
+
+    def query_reports(self, disaster_type: Optional[str] = None, reporter: Optional[str] = None,
+                      since: Optional[str] = None, until: Optional[str] = None,
+                      bbox: Optional[Tuple[float, float, float, float]] = None,
+                      cursor: Optional[str] = None, limit: int = 50,
+                      newest_first: bool = False) -> Tuple[List[Dict], Optional[str]]:
+        """Return one page of matching reports and a cursor for the next page (None when done).
+
+        since/until are ISO-8601 timestamps (until is exclusive); bbox is
+        (min_lat, min_lon, max_lat, max_lon) and only matches reports with coordinates.
+        Reports are kept in id order (which is also timestamp order), so the time range
+        and the cursor position (the last id scanned) are found by binary search instead
+        of scanning from the start. A bbox query starts from the spatial index instead.
+        """
+        self._refresh()
+        if bbox:
+            return self._query_reports_in_area(bbox, disaster_type, reporter, since, until,
+                                               cursor, limit, newest_first)
+        with self._lock:
+            reports, live = self._reports, self._report_index
+            lo = bisect_left(reports, since, key=_report_time) if since else 0
+            hi = bisect_left(reports, until, key=_report_time) if until else len(reports)
+            if cursor:
+                last_id = decode_cursor(cursor)['id']
+                if newest_first:
+                    hi = min(hi, bisect_left(reports, last_id, key=_report_id))
+                else:
+                    lo = max(lo, bisect_right(reports, last_id, key=_report_id))
+            indices = range(hi - 1, lo - 1, -1) if newest_first else range(lo, hi)
+            page: List[Dict] = []
+            last = None
+            for i in indices:
+                last = i
+                report = reports[i]
+                if report['id'] in live and report_matches(report, disaster_type, reporter, bbox):
+                    page.append(report)
+                    if len(page) >= limit:
+                        break
+            if last is None or len(page) < limit or last == indices[-1]:
+                return page, None
+            return page, encode_cursor({'id': reports[last]['id']})
+
+    def _query_reports_in_area(self, bbox, disaster_type, reporter, since, until,
+                               cursor, limit, newest_first) -> Tuple[List[Dict], Optional[str]]:
+        min_lat, min_lon, max_lat, max_lon = bbox
+        last_id = decode_cursor(cursor)['id'] if cursor else None
+        with self._lock:
+            ids = sorted(self._report_geo.query_bbox(min_lat, min_lon, max_lat, max_lon),
+                         reverse=newest_first)
+            if last_id is not None:
+                ids = [i for i in ids if (i < last_id if newest_first else i > last_id)]
+            page: List[Dict] = []
+            for n, report_id in enumerate(ids):
+                report = self._report_index[report_id]
+                ts = _report_time(report)
+                if (since and ts < since) or (until and ts >= until):
+                    continue
+                if report_matches(report, disaster_type, reporter):
+                    page.append(report)
+                    if len(page) >= limit:
+                        more = n + 1 < len(ids)
+                        return page, encode_cursor({'id': report_id}) if more else None
+            return page, None
+
+    def reports_in_area(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> List[Dict]:
+        """All live reports whose location falls inside the box, in filing order."""
+        self._refresh()
+        with self._lock:
+            ids = sorted(self._report_geo.query_bbox(min_lat, min_lon, max_lat, max_lon))
+            return [self._report_index[i] for i in ids]
+
+    def set_report_location(self, report_id: int, lat: Optional[float], lon: Optional[float],
+                            resolved_address: Optional[str] = None) -> bool:
+        """Record the geocoding outcome for a report (lat=None means not found).
+
+        Returns False if the report no longer exists.
+        """
+        with self._transaction():
+            if report_id not in self._report_index:
+                return False
+            self._commit({'op': 'set_location', 'id': report_id, 'lat': lat, 'lon': lon,
+                          'resolved_address': resolved_address})
+        return True
+
+    def pending_location_reports(self) -> List[Dict]:
+        """Reports still waiting for their address to be geocoded, oldest first."""
+        self._refresh()
+        with self._lock:
+            return [r for r in self._live_reports() if r.get('location_status') == LOCATION_PENDING]
+
+    def delete_report(self, report_id: int) -> bool:
+        """Delete a report by its id. Returns True if successful."""
+        with self._transaction():
+            if report_id in self._report_index:
+                self._commit({'op': 'delete_report', 'id': report_id})
+                return True
         return False
 
     def get_supplies(self) -> Dict[str, int]:
         """Get a copy of the current supplies inventory."""
-        return dict(self.supplies)
\ No newline at end of file
+        self._refresh()
+        return dict(self.supplies)
+
+
+def create_storage(backend: Optional[str] = None, path: Optional[str] = None):
+    """Build the configured storage engine.
+
+    backend is 'json' (default) or 'sqlite'; when omitted it is read from the
+    STORAGE_BACKEND environment variable. path defaults to STORAGE_PATH, or to
+    'data/storage.json' / 'data/storage.db' depending on the backend.
+    STORAGE_JOURNAL=1 enables journaled persistence and STORAGE_SHARED=1 enables
+    multi-process coordination for the JSON backend.
+    """
+    backend = (backend or os.environ.get('STORAGE_BACKEND') or 'json').strip().lower()
+    path = path or os.environ.get('STORAGE_PATH')
+    if backend == 'sqlite':
+        try:
+            from .sqlite_storage import SqliteStorage
+        except ImportError:
+            from sqlite_storage import SqliteStorage
+        return SqliteStorage(path or 'data/storage.db')
+    if backend != 'json':
+        raise ValueError(f"Unknown storage backend '{backend}'")
+    return Storage(path or 'data/storage.json', journal=env_flag('STORAGE_JOURNAL'),
+                   shared=env_flag('STORAGE_SHARED'))
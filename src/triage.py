@@ -0,0 +1,143 @@
+"""One-pass detection of crisis language, disasters, losses and time questions.
+
+Usage: python src/triage.py [--messages 20000]   (runs the micro-benchmark)
+
+Every signal starts with a known word or phrase, so all of them are compiled into
+one regular expression of literals and each chat message or report is scanned
+once, with every signal coming out of the same pass. The patterns that only
+matter once something was found (the rest of a loss, its cause, who a time
+question is about) run only in that case.
+"""
+import argparse
+import re
+import sys
+import time
+from typing import Iterable, List, Optional, Tuple
+
+CRISIS_PHRASES = ("kill myself", "suicide", "end my life", "want to die", "hurt myself")
+
+DISASTER_ADVICE = {
+    "earthquake": "Drop, cover, and hold on. Stay away from windows and heavy objects.",
+    "fire": "Stay low to avoid smoke, exit immediately if safe, and call emergency services.",
+    "tornado": "Go to a safe room or basement. Avoid windows and stay sheltered.",
+    "flood": "Move to higher ground immediately and avoid walking or driving in floodwaters.",
+    "hurricane": "Follow evacuation orders and stay indoors away from windows.",
+    "storm": "Stay indoors and away from tall objects, trees, and metal structures.",
+    "tsunami": "Move to higher ground and follow evacuation routes."
+}
+
+LOSS_RELATIONS = ("dad", "mom", "father", "mother", "brother", "sister", "friend", "pet")
+LOSS_VERBS = ("died", "passed", "lost", "killed", "gone")
+TIME_PHRASES = ("what time", "when")
+
+
+def _alternatives(words: Iterable[str]) -> str:
+    # longest first, so a phrase wins over a word it starts with
+    return "|".join(re.escape(w) for w in sorted(words, key=len, reverse=True))
+
+
+# every signal starts with one of these literals; a flat alternation of literals is
+# the fastest thing the regex engine can scan for
+_KINDS = dict([(p, 'crisis') for p in CRISIS_PHRASES] + [(d, 'disaster') for d in DISASTER_ADVICE]
+              + [(p, 'time') for p in TIME_PHRASES] + [('my', 'loss'), ('our', 'loss')])
+_SCANNER = re.compile(_alternatives(_KINDS))
+# checked only where the scan hit "my"/"our"
+_LOSS = re.compile(rf"(?:my|our)\s+({_alternatives(LOSS_RELATIONS)})\s*(\w*)\s*(?:{_alternatives(LOSS_VERBS)})")
+_CAUSE = re.compile(r"(?:due to|in a|from a|because of)\s+([\w\s]+)")
+_TIME_SUBJECT = re.compile(r"(my|our)?\s*(mom|dad|father|mother|brother|sister|friend|pet|\w+)")
+
+
+class Signals:
+    """What scan() found in one message."""
+    __slots__ = ('crisis', 'disasters', 'losses', 'cause', 'time_question', 'time_subject')
+
+    def __init__(self):
+        self.crisis = False
+        # disaster types in order of first mention
+        self.disasters: List[str] = []
+        # (relation, name or '') for each "my/our <relation> [name] died/passed/..."
+        self.losses: List[Tuple[str, str]] = []
+        # what the loss was put down to ("due to ...", "in a ..."), if anything
+        self.cause: Optional[str] = None
+        self.time_question = False
+        # first word of a time question, usually who or what it is about
+        self.time_subject: Optional[str] = None
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def scan(text: str) -> Signals:
+    """Find every signal in text with a single pass of the combined pattern."""
+    signals = Signals()
+    lowered = text.lower()
+    for match in _SCANNER.finditer(lowered):
+        word = match.group()
+        kind = _KINDS[word]
+        if kind == 'loss':
+            loss = _LOSS.match(lowered, match.start())
+            if loss:
+                signals.losses.append(loss.groups())
+        elif kind == 'crisis':
+            signals.crisis = True
+        elif kind == 'disaster':
+            if word not in signals.disasters:
+                signals.disasters.append(word)
+        else:
+            signals.time_question = True
+    if signals.losses:
+        cause = _CAUSE.search(lowered)
+        signals.cause = cause.group(1) if cause else None
+    if signals.time_question:
+        subject = _TIME_SUBJECT.search(lowered)
+        signals.time_subject = subject.group(2) if subject else None
+    return signals
+
+
+def _separate_passes(text: str):
+    """The per-pass checks scan() replaces, kept as the benchmark baseline."""
+    lowered = text.lower()
+    crisis = any(k in lowered for k in CRISIS_PHRASES)
+    disasters = [d for d in dict(DISASTER_ADVICE) if d in lowered]
+    losses = re.findall(r"(my|our)\s+(dad|mom|father|mother|brother|sister|friend|pet)\s*(\w*)\s*"
+                        r"(died|passed|lost|killed|gone)", lowered)
+    cause = re.search(r"(?:due to|in a|from a|because of|in a)\s+([\w\s]+)", lowered)
+    time_question = "what time" in lowered or "when" in lowered
+    if time_question:
+        re.search(r"(my|our)?\s*(mom|dad|father|mother|brother|sister|friend|pet|\w+)", lowered)
+    return crisis, disasters, losses, cause, time_question
+
+
+SAMPLE_MESSAGES = (
+    "I can't stop thinking about the flood last night, the water came up so fast.",
+    "My dad died in a fire when I was young and the storms bring it all back.",
+    "We have been sleeping at the shelter since Tuesday and my kids are scared.",
+    "When will the trucks with water reach the north side of the river?",
+    "Roof collapsed on Main Street after the earthquake, two people trapped.",
+    "I just feel numb. Nothing seems real anymore and I don't know what to do.",
+)
+
+
+def benchmark(messages: int = 20000) -> dict:
+    """Messages per second for scan() and for the separate passes it replaces."""
+    texts = [SAMPLE_MESSAGES[i % len(SAMPLE_MESSAGES)] for i in range(messages)]
+    results = {}
+    for name, func in (('separate passes', _separate_passes), ('scan', scan)):
+        start = time.perf_counter()
+        for text in texts:
+            func(text)
+        results[name] = messages / (time.perf_counter() - start)
+    return results
+
+
+def main(argv: Optional[Iterable[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the one-pass message triage.")
+    parser.add_argument('--messages', type=int, default=20000)
+    args = parser.parse_args(argv)
+    for name, rate in benchmark(args.messages).items():
+        print(f"{name:>16}: {rate:,.0f} messages/s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
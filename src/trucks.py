@@ -1,24 +1,395 @@
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+try:
+    from .spatial import GridIndex, nearest_geodesic
+    from .utils import Journal, atomic_write_json, bump_version, file_lock, read_version
+except ImportError:
+    from spatial import GridIndex, nearest_geodesic
+    from utils import Journal, atomic_write_json, bump_version, file_lock, read_version
+
+
+def _point(location) -> Optional[Tuple[float, float]]:
+    return None if location is None else (float(location[0]), float(location[1]))
+
+
 class Truck:
-    def __init__(self):
+    def __init__(self, cell_size: float = 1.0, metric: str = 'euclidean',
+                 clock: Callable[[], float] = time.time, persistence_file: Optional[str] = None,
+                 snapshot_every: int = 500, shared: bool = False):
+        """Fleet of named trucks and their availability.
+
+        Trucks may have a location; available ones are kept in a grid index of
+        cell_size units so the nearest free truck is found without scanning the
+        fleet. metric is 'euclidean' for (x, y) or 'haversine' for (lat, lon) in km,
+        matching HelpStation.
+        Dispatched trucks can be given an expected return time (schedule_return);
+        those are kept in a heap and freed automatically once due.
+
+        With a persistence_file every change is appended to '<file>.log', an audit
+        trail of add/dispatch/schedule/return events that is never truncated (see
+        history()). Every snapshot_every events the fleet state is written to the file
+        itself together with the log offset it covers, so start-up only replays the
+        events recorded after the last snapshot.
+
+        With shared=True several processes may use the same file: every change is made
+        under a lock on '<file>.lock', after replaying the events other processes have
+        logged since, so sequence numbers stay unique and snapshots cover the whole log.
+
+        The fleet also keeps the aid requests waiting for a truck (queue_request) and
+        the last request id handed out (new_request_id) in the same log and snapshot,
+        so a restart loses neither the queue nor the id sequence.
+        """
         # Maintain a dict of truck_name -> availability (True means available)
         self.trucks = {}
+        self.metric = metric
+        self._locations = {}
+        # available trucks in the order they became free; those without a location;
+        # and the located ones by position
+        self._free = OrderedDict()
+        self._free_unlocated = OrderedDict()
+        self._index = GridIndex(cell_size)
+        self._clock = clock
+        # heap of (due, tiebreak, name); entries whose due no longer matches _return_due are stale
+        self._returns: List[Tuple[float, int, str]] = []
+        self._return_due: Dict[str, float] = {}
+        self._tiebreak = itertools.count()
+        # request_id -> waiting aid request, oldest first; and the highest id handed out
+        self._queued: "OrderedDict[int, Dict]" = OrderedDict()
+        self._last_request_id = 0
+        self._lock = threading.RLock()
+        self._persistence_file = persistence_file
+        self._snapshot_every = snapshot_every
+        self._journal: Optional[Journal] = None
+        self._seq = 0
+        self._since_snapshot = 0
+        self._shared = bool(shared and persistence_file)
+        # change counter (kept in the lock file) at our last load/write, and how far
+        # into the log we have read; shared mode only
+        self._version = None
+        self._log_offset = 0
+        # set while this instance holds the file lock (always under self._lock)
+        self._locked = False
+        if persistence_file:
+            dirpath = os.path.dirname(persistence_file)
+            if dirpath:
+                os.makedirs(dirpath, exist_ok=True)
+            self._journal = Journal(persistence_file + '.log')
+            if self._shared:
+                with file_lock(persistence_file) as lock:
+                    self._load()
+                    self._version = read_version(lock)
+            else:
+                self._load()
+
+    def _load(self):
+        offset = 0
+        try:
+            if os.path.exists(self._persistence_file):
+                with open(self._persistence_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                for truck in data.get('trucks', []):
+                    name = truck['name']
+                    location = _point(truck.get('location'))
+                    if location is not None:
+                        self._locations[name] = location
+                    self.trucks[name] = False
+                    if truck.get('return_due') is not None:
+                        self._schedule(name, float(truck['return_due']))
+                for name in data.get('free', []):
+                    self._set_available(name)
+                for request in data.get('queued', []):
+                    self._queued[int(request['request_id'])] = request
+                self._last_request_id = int(data.get('last_request_id', 0))
+                self._seq = int(data.get('seq', 0))
+                offset = int(data.get('log_offset', 0))
+        except Exception:
+            offset = 0
+        self._replay(offset)
+
+    def _replay(self, offset: int):
+        """Apply logged events past our sequence number, reading the log from offset."""
+        for event in self._journal.replay(offset):
+            if int(event.get('seq', 0)) <= self._seq:
+                continue
+            self._apply(event)
+            self._seq = int(event['seq'])
+            self._since_snapshot += 1
+        self._log_offset = self._journal.offset
+
+    def _refresh(self):
+        """Pick up events other processes logged (shared mode only)."""
+        if self._shared and not self._locked and read_version(self._persistence_file) != self._version:
+            with self._lock, file_lock(self._persistence_file) as lock:
+                self._replay(self._log_offset)
+                self._version = read_version(lock)
+
+    @contextmanager
+    def _transaction(self):
+        """Serialise a change across threads and, in shared mode, processes."""
+        with self._lock:
+            # the file lock is not re-entrant; nested calls run inside the outer one
+            if not self._shared or self._locked:
+                yield
+                return
+            with file_lock(self._persistence_file) as lock:
+                if read_version(lock) != self._version:
+                    self._replay(self._log_offset)
+                self._locked = True
+                try:
+                    yield
+                finally:
+                    self._locked = False
+                self._version = bump_version(lock)
+
+    def snapshot(self):
+        """Write the current fleet state and the log offset it covers."""
+        if not self._persistence_file:
+            return
+        with self._transaction():
+            self._write_snapshot()
+
+    def _write_snapshot(self):
+        with self._lock:
+            payload = {
+                'trucks': [{'name': name, 'location': self._locations.get(name),
+                            'return_due': self._return_due.get(name)} for name in self.trucks],
+                'free': list(self._free),
+                'queued': list(self._queued.values()),
+                'last_request_id': self._last_request_id,
+                'seq': self._seq,
+                'log_offset': self._journal.size(),
+            }
+            try:
+                atomic_write_json(self._persistence_file, payload)
+                self._since_snapshot = 0
+            except Exception:
+                pass
+
+    def _apply(self, event: Dict):
+        """Apply a fleet event to the in-memory state (live changes and log replay)."""
+        kind = event['event']
+        if kind == 'request':
+            self._last_request_id = max(self._last_request_id, int(event['request_id']))
+            return
+        if kind == 'queue':
+            request = event['request']
+            self._queued[int(request['request_id'])] = request
+            self._last_request_id = max(self._last_request_id, int(request['request_id']))
+            return
+        if kind == 'unqueue':
+            self._queued.pop(int(event['request_id']), None)
+            return
+        name = event['truck']
+        if kind in ('add', 'return'):
+            if event.get('location') is not None:
+                self._locations[name] = _point(event['location'])
+            self._set_available(name)
+        elif kind == 'dispatch':
+            self._set_busy(name)
+            # a truck sent for a waiting request takes it off the queue in the same event
+            if event.get('request_id') is not None:
+                self._queued.pop(int(event['request_id']), None)
+        elif kind == 'schedule':
+            self._schedule(name, float(event['due']))
+        else:
+            raise ValueError(f"Unknown fleet event '{kind}'")
+
+    def _commit(self, event: Dict):
+        self._apply(event)
+        if not self._journal:
+            return
+        self._seq += 1
+        event['seq'] = self._seq
+        event['timestamp'] = datetime.utcnow().isoformat() + 'Z'
+        try:
+            self._journal.append(event)
+        except Exception:
+            # On failure to persist, ignore (do not crash the app)
+            return
+        if self._shared:
+            # we hold the file lock, so nothing was appended after our event
+            self._log_offset = self._journal.size()
+        self._since_snapshot += 1
+        if self._since_snapshot >= self._snapshot_every:
+            self._write_snapshot()
+
+    def new_request_id(self) -> int:
+        """Hand out the next aid request id; the sequence survives restarts and is shared between processes."""
+        with self._transaction():
+            request_id = self._last_request_id + 1
+            self._commit({'event': 'request', 'request_id': request_id})
+            return request_id
 
-    def add_truck(self, truck_name):
+    def queue_request(self, request: Dict):
+        """Record an aid request (request_id, item, quantity, location, requester) as waiting for a truck."""
+        request = dict(request, location=_point(request.get('location')))
+        with self._transaction():
+            self._commit({'event': 'queue', 'request': request})
+
+    def unqueue_request(self, request_id: int, reason: str = 'cancelled') -> Optional[Dict]:
+        """Take a request off the waiting queue. Returns it, or None if it was not waiting."""
+        with self._transaction():
+            request = self._queued.get(request_id)
+            if request is None:
+                return None
+            self._commit({'event': 'unqueue', 'request_id': request_id, 'reason': reason})
+            return dict(request, location=_point(request.get('location')))
+
+    def queued_requests(self) -> List[Dict]:
+        """Requests waiting for a truck, oldest first."""
+        self._refresh()
+        with self._lock:
+            return [dict(r, location=_point(r.get('location'))) for r in self._queued.values()]
+
+    def history(self, truck_name: Optional[str] = None) -> Iterator[Dict]:
+        """Logged fleet events, oldest first (optionally only one truck's)."""
+        if not self._journal:
+            return
+        for event in self._journal.replay():
+            if truck_name is None or event.get('truck') == truck_name:
+                yield event
+
+    def add_truck(self, truck_name, location=None):
         # Add a new truck as available
+        with self._transaction():
+            self._commit({'event': 'add', 'truck': truck_name, 'location': _point(location)})
+
+    def _set_available(self, truck_name):
+        self._return_due.pop(truck_name, None)
         self.trucks[truck_name] = True
+        self._free[truck_name] = None
+        if truck_name in self._locations:
+            self._index.insert(truck_name, *self._locations[truck_name])
+            self._free_unlocated.pop(truck_name, None)
+        else:
+            self._free_unlocated[truck_name] = None
 
-    def dispatch_truck(self, truck_name):
-        # Dispatch a specific truck if it exists and is available
-        if truck_name not in self.trucks:
-            return False
-        if not self.trucks[truck_name]:
-            return False
+    def _set_busy(self, truck_name):
         self.trucks[truck_name] = False
-        return True
+        self._free.pop(truck_name, None)
+        self._free_unlocated.pop(truck_name, None)
+        self._index.remove(truck_name)
 
-    def return_truck(self, truck_name):
+    def _schedule(self, truck_name, due: float):
+        self._return_due[truck_name] = due
+        heapq.heappush(self._returns, (due, next(self._tiebreak), truck_name))
+
+    def dispatch_truck(self, truck_name, details: Optional[Dict] = None):
+        # Dispatch a specific truck if it exists and is available.
+        # details (supply, quantity, requester, ...) are recorded in the log.
+        with self._transaction():
+            if truck_name not in self.trucks:
+                return False
+            if not self.trucks[truck_name]:
+                return False
+            self._commit(dict(details or {}, event='dispatch', truck=truck_name))
+            return True
+
+    def return_truck(self, truck_name, location=None):
         # Mark a truck as available again; if it doesn't exist, add it as available
-        self.trucks[truck_name] = True
+        with self._transaction():
+            self._commit({'event': 'return', 'truck': truck_name, 'location': _point(location)})
 
     def is_truck_available(self, truck_name):
-        return self.trucks.get(truck_name, False)
\ No newline at end of file
+        self.process_returns()
+        return self.trucks.get(truck_name, False)
+
+    def schedule_return(self, truck_name, after: float):
+        """Expect a dispatched truck back in `after` seconds; it is freed automatically then."""
+        with self._transaction():
+            if self.trucks.get(truck_name, True):
+                return
+            self._commit({'event': 'schedule', 'truck': truck_name, 'due': self._clock() + after})
+
+    def expected_return(self, truck_name) -> Optional[float]:
+        """Clock time the truck is due back, or None if it is free or has no ETA."""
+        return self._return_due.get(truck_name)
+
+    def process_returns(self) -> List[str]:
+        """Free every truck whose return time has passed. Returns their names, earliest first."""
+        returned = []
+        self._refresh()
+        if not self._returns or self._returns[0][0] > self._clock():
+            return returned
+        with self._transaction():
+            now = self._clock()
+            while self._returns and self._returns[0][0] <= now:
+                due, _, name = heapq.heappop(self._returns)
+                if self._return_due.get(name) == due:
+                    self._commit({'event': 'return', 'truck': name, 'location': None, 'due': due})
+                    returned.append(name)
+        return returned
+
+    def next_return(self) -> Optional[float]:
+        """Clock time of the next scheduled return, if any."""
+        with self._lock:
+            while self._returns and self._return_due.get(self._returns[0][2]) != self._returns[0][0]:
+                heapq.heappop(self._returns)
+            return self._returns[0][0] if self._returns else None
+
+    def stats(self) -> Dict:
+        """Fleet size, free and busy counts, utilization (busy share) and the next return time."""
+        self.process_returns()
+        with self._lock:
+            total = len(self.trucks)
+            free = len(self._free)
+            return {
+                'trucks': total,
+                'available': free,
+                'busy': total - free,
+                'utilization': (total - free) / total if total else 0.0,
+                'next_return': self.next_return(),
+            }
+
+    def truck_location(self, truck_name) -> Optional[Tuple[float, float]]:
+        return self._locations.get(truck_name)
+
+    def nearest_available(self, point, k: int = 1,
+                          max_distance: Optional[float] = None) -> List[Tuple[str, float]]:
+        """The k closest available trucks with a location, as (name, distance) pairs."""
+        x, y = float(point[0]), float(point[1])
+        self.process_returns()
+        with self._lock:
+            if self.metric == 'haversine':
+                found = nearest_geodesic(self._index, x, y, k, max_distance)
+            else:
+                found = self._index.nearest(x, y, k, max_distance)
+        return [(name, d) for d, name in found]
+
+    def claim_nearest(self, point=None, max_distance: Optional[float] = None,
+                      details: Optional[Dict] = None, queued: bool = False) -> Optional[Tuple[str, Optional[float]]]:
+        """Atomically pick and dispatch the closest available truck.
+
+        Without a point, or when no located truck is free (within max_distance), the
+        longest-free truck without a known location is used instead. details are
+        logged with the dispatch. With queued=True the truck is for the waiting
+        request details['request_id'], and none is sent if that request has already
+        left the queue (e.g. another process served it). Returns (name, distance or
+        None), or None if no truck can go.
+        """
+        self.process_returns()
+        with self._transaction():
+            if queued and int(details['request_id']) not in self._queued:
+                return None
+            claimed = None
+            if point is not None:
+                nearest = self.nearest_available(point, 1, max_distance)
+                if nearest:
+                    claimed = nearest[0]
+            if claimed is None:
+                free = self._free if point is None else self._free_unlocated
+                if not free:
+                    return None
+                claimed = next(iter(free)), None
+            self._commit(dict(details or {}, event='dispatch', truck=claimed[0],
+                              destination=_point(point), distance=claimed[1]))
+            return claimed
@@ -1,13 +1,216 @@
-def calculate_distance(location1, location2):
-    # Placeholder for distance calculation logic
-    # This could use the Haversine formula or any other method to calculate distance
-    pass
+import json
+import math
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, Optional
 
-def is_near_help_station(user_location, help_stations):
-    # Placeholder for logic to determine if a user is near a help station
-    # This could involve checking distances against a threshold
-    pass
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Advisory file locking is optional: fcntl on POSIX, msvcrt on Windows, otherwise a no-op.
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+
+def env_flag(name: str) -> bool:
+    """True if the environment variable is set to 1/true/yes."""
+    return os.environ.get(name, '').strip().lower() in ('1', 'true', 'yes')
+
+
+@contextmanager
+def file_lock(path: str):
+    """Hold an exclusive advisory lock on '<path>.lock' for the duration of the block.
+
+    Coordinates read-modify-write cycles between processes sharing one data file.
+    Yields the open lock file, whose content is a change counter (see bump_version).
+    """
+    fd = os.open(path + '.lock', os.O_RDWR | os.O_CREAT, 0o644)
+    with os.fdopen(fd, 'r+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        elif msvcrt is not None:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield f
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            elif msvcrt is not None:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class StripedLocks:
+    """A fixed pool of locks shared out by key (e.g. supply item names).
+
+    hold(keys) takes the locks for all keys in pool order, so callers locking
+    several keys at once cannot deadlock each other, and work on keys that map to
+    different stripes runs in parallel.
+    """
+
+    def __init__(self, stripes: int = 64):
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    @contextmanager
+    def hold(self, keys: Iterable[str]):
+        stripes = sorted({hash(key.strip().lower()) % len(self._locks) for key in keys})
+        for stripe in stripes:
+            self._locks[stripe].acquire()
+        try:
+            yield
+        finally:
+            for stripe in reversed(stripes):
+                self._locks[stripe].release()
+
+
+def read_version(lock_file) -> int:
+    """Read the change counter from a lock file (an open file or the data file's path)."""
+    try:
+        if isinstance(lock_file, str):
+            with open(lock_file + '.lock', 'rb') as f:
+                data = f.read()
+        else:
+            lock_file.seek(0)
+            data = lock_file.read()
+        return int(data.strip() or 0)
+    except (OSError, ValueError):
+        return -1
+
+
+def bump_version(lock_file) -> int:
+    """Increment the change counter in a lock file held via file_lock()."""
+    version = max(read_version(lock_file), 0) + 1
+    lock_file.seek(0)
+    lock_file.truncate()
+    lock_file.write(str(version).encode('ascii'))
+    lock_file.flush()
+    return version
+
+
+def atomic_write_json(path: str, payload, indent: Optional[int] = 2):
+    """Write JSON to a temp file next to path, then rename it over path.
+
+    Readers see either the old or the new file, never a half-written one.
+    """
+    dirpath = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', suffix='.tmp', dir=dirpath)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, indent=indent)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp creates the file 0600; keep the permissions a plain open() would give
+        try:
+            mode = os.stat(path).st_mode & 0o777
+        except OSError:
+            mode = 0o644
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class Journal:
+    """Append-only JSON-lines log used for journaled persistence.
+
+    Each record is written as one compact JSON object per line. The owner decides
+    when to compact (write a snapshot elsewhere and truncate the log).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        # number of records currently in the log (refreshed by replay())
+        self.records = 0
+        self.offset = 0
+
+    def append(self, record: Dict):
+        line = json.dumps(record, separators=(',', ':'))
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+        self.records += 1
+
+    def replay(self, offset: int = 0) -> Iterator[Dict]:
+        """Yield every record in the log, starting at byte offset (0 = the beginning).
+
+        A torn final line (crash mid-write) is skipped. Afterwards self.offset is the
+        byte position just past the last complete line, to resume from next time.
+        """
+        self.records = 0
+        self.offset = offset
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            for raw in f:
+                if not raw.endswith(b'\n'):
+                    break
+                self.offset += len(raw)
+                line = raw.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line.decode('utf-8'))
+                except ValueError:
+                    continue
+                self.records += 1
+                yield record
+
+    def size(self) -> int:
+        """Current length of the log file in bytes."""
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def truncate(self):
+        with open(self.path, 'w', encoding='utf-8'):
+            pass
+        self.records = 0
+
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in kilometres between points given in degrees.
+
+    Takes plain floats, or NumPy arrays (any mix that broadcasts, e.g. one point
+    against every station) and then returns an array of distances.
+    """
+    if np is not None and any(isinstance(v, np.ndarray) for v in (lat1, lon1, lat2, lon2)):
+        lat1, lon1, lat2, lon2 = (np.radians(v) for v in (lat1, lon1, lat2, lon2))
+        a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+        return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+    lat1, lon1, lat2, lon2 = (math.radians(float(v)) for v in (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(1.0, a)))
+
+
+def calculate_distance(location1, location2) -> float:
+    """Distance in kilometres between two (lat, lon) points."""
+    return haversine_km(location1[0], location1[1], location2[0], location2[1])
+
+
+def is_near_help_station(user_location, help_stations, threshold_km: float = 5.0) -> bool:
+    """True if any (lat, lon) in help_stations (a list, or a name -> location dict) is within threshold_km."""
+    locations = help_stations.values() if isinstance(help_stations, dict) else help_stations
+    return any(calculate_distance(user_location, loc) <= threshold_km for loc in locations)
 
 def format_supply_list(supplies):
     # Formats the supply list for display
-    return "\n".join(f"{item}: {quantity}" for item, quantity in supplies.items())
\ No newline at end of file
+    return "\n".join(f"{item}: {quantity}" for item, quantity in supplies.items())
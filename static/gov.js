@@ -62,33 +62,59 @@ async function loadInventory() {
     `).join('');
 }
 
-// Load Reports
-async function loadReports() {
-    const response = await fetch('/api/reports');
-    const reports = await response.json();
-    
+// Load Reports (one page at a time; "Load more" fetches the next page)
+let reportsCursor = null;
+
+async function loadReports(append = false) {
+    const params = new URLSearchParams({limit: 50, order: 'desc'});
+    const type = document.getElementById('reportTypeFilter').value.trim();
+    const reporter = document.getElementById('reportReporterFilter').value.trim();
+    if (type) params.set('disaster_type', type);
+    if (reporter) params.set('reporter', reporter);
+    if (append && reportsCursor) params.set('cursor', reportsCursor);
+
+    const response = await fetch(`/api/reports?${params}`);
+    const page = await response.json();
+    const reports = page.reports || [];
+
     const container = document.getElementById('reportsList');
-    
-    if (reports.length === 0) {
-        container.innerHTML = '<p>No reports filed yet.</p>';
+    if (!append) container.innerHTML = '';
+
+    if (!append && reports.length === 0) {
+        container.innerHTML = '<p>No reports found.</p>';
         return;
     }
-    
-    container.innerHTML = reports.map((report, index) => `
+
+    container.querySelector('.load-more')?.remove();
+    container.insertAdjacentHTML('beforeend', reports.map(report => `
         <div class="report-card">
             <div>
-                <h4>📋 ${report.disaster_type.toUpperCase()}</h4>
+                <h4>📋 #${report.id} ${report.disaster_type.toUpperCase()}</h4>
                 <p><strong>Reporter:</strong> ${report.name}</p>
                 <p><strong>Time:</strong> ${report.timestamp}</p>
                 <p><strong>Details:</strong> ${report.details}</p>
+                ${report.resolved_address ? `<p><strong>Location:</strong> ${report.resolved_address}</p>` : ''}
+                ${report.lat != null ? `<p><strong>Lat/Lon:</strong> ${report.lat}, ${report.lon}</p>` : ''}
+                ${report.location_status === 'pending' ? `<p><strong>Location:</strong> pending</p>` : ''}
             </div>
             <div class="card-actions">
-                <button class="btn btn-danger btn-small" onclick="deleteReport(${index + 1})">Delete</button>
+                <button class="btn btn-danger btn-small" onclick="deleteReport(${report.id})">Delete</button>
             </div>
         </div>
-    `).join('');
+    `).join(''));
+
+    reportsCursor = page.next_cursor;
+    if (reportsCursor) {
+        container.insertAdjacentHTML('beforeend',
+            '<button class="btn btn-small load-more" onclick="loadReports(true)">Load more</button>');
+    }
 }
 
+document.getElementById('reportFilterForm').addEventListener('submit', (e) => {
+    e.preventDefault();
+    loadReports();
+});
+
 // Delete Report
 async function deleteReport(reportId) {
     if (!confirm('Are you sure you want to delete this report?')) return;
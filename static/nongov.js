@@ -128,11 +128,14 @@ async function loadMentalHealth() {
         return;
     }
     
+    container.innerHTML = '';
+    
+    // Without a key replies come from the offline responder; a key is an optional upgrade
     if (!status.configured) {
         container.innerHTML = `
             <div class="mental-config">
                 <h4>🔧 Configure Mental Health AI</h4>
-                <p>To use mental health support, please provide your OpenAI API key:</p>
+                <p>Replies come from the offline responder. For fuller conversations, provide your OpenAI API key:</p>
                 <form id="configForm" style="margin-top: 15px;">
                     <div class="form-group">
                         <label for="apiKey">OpenAI API Key:</label>
@@ -161,37 +164,70 @@ async function loadMentalHealth() {
                 alert(`❌ ${error.message}`);
             }
         });
-    } else {
-        container.innerHTML = `
-            <div class="chat-container" id="chatBox"></div>
-            <div class="chat-input-group">
-                <input type="text" id="messageInput" placeholder="Share how you're feeling...">
-                <button class="btn btn-primary" onclick="sendMentalMessage()">Send</button>
-            </div>
-        `;
+    }
+    
+    container.insertAdjacentHTML('beforeend', `
+        <div class="chat-container" id="chatBox"></div>
+        <div class="chat-input-group">
+            <input type="text" id="messageInput" placeholder="Share how you're feeling...">
+            <button class="btn btn-primary" onclick="sendMentalMessage()">Send</button>
+        </div>
+    `);
+    
+    window.sendMentalMessage = async function() {
+        const input = document.getElementById('messageInput');
+        const message = input.value.trim();
         
-        window.sendMentalMessage = async function() {
-            const input = document.getElementById('messageInput');
-            const message = input.value.trim();
-            
-            if (!message) return;
-            
-            const chatBox = document.getElementById('chatBox');
-            chatBox.innerHTML += `<div class="chat-message user">${message}</div>`;
-            input.value = '';
-            chatBox.scrollTop = chatBox.scrollHeight;
-            
-            const response = await fetch('/api/mental-health/message', {
-                method: 'POST',
-                headers: {'Content-Type': 'application/json'},
-                body: JSON.stringify({message})
-            });
-            
+        if (!message) return;
+        
+        const chatBox = document.getElementById('chatBox');
+        chatBox.innerHTML += `<div class="chat-message user">${message}</div>`;
+        input.value = '';
+        chatBox.scrollTop = chatBox.scrollHeight;
+        
+        const response = await fetch('/api/mental-health/message', {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({message, stream: true})
+        });
+        
+        const reply = document.createElement('div');
+        reply.className = 'chat-message bot';
+        chatBox.appendChild(reply);
+        
+        if (!response.ok || !response.body ||
+            !(response.headers.get('Content-Type') || '').startsWith('text/event-stream')) {
             const result = await response.json();
-            chatBox.innerHTML += `<div class="chat-message bot">${result.message}</div>`;
+            reply.textContent = result.message;
             chatBox.scrollTop = chatBox.scrollHeight;
-        };
-    }
+            return;
+        }
+        
+        // Server-Sent Events: show each piece of the reply as soon as it arrives
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        while (true) {
+            const {value, done} = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, {stream: true});
+            const events = buffer.split('\n\n');
+            buffer = events.pop();
+            for (const block of events) {
+                let event = 'message';
+                let data = '';
+                for (const line of block.split('\n')) {
+                    if (line.startsWith('event: ')) event = line.slice(7);
+                    else if (line.startsWith('data: ')) data += line.slice(6);
+                }
+                if (!data) continue;
+                const payload = JSON.parse(data);
+                if (event === 'delta') reply.textContent += payload.text;
+                else if (event === 'done') reply.textContent = payload.message;
+                chatBox.scrollTop = chatBox.scrollHeight;
+            }
+        }
+    };
 }
 
 // Load initial content
@@ -1,4 +1,11 @@
+import os
+import tempfile
+import threading
 import unittest
+from src.dispatch import DispatchEngine
+from src.help_stations import HelpStation
+from src.non_gov import NonGov
+from src.storage import Storage
 from src.trucks import Truck
 
 class TestTruckDispatch(unittest.TestCase):
@@ -21,5 +28,283 @@ class TestTruckDispatch(unittest.TestCase):
         self.truck.add_truck("Truck 4")
         self.assertTrue(self.truck.is_truck_available("Truck 4"))
 
+    def test_claim_nearest(self):
+        self.truck.add_truck("Far", (50, 50))
+        self.truck.add_truck("Near", (1, 1))
+        self.truck.add_truck("Anywhere")
+        self.assertEqual(self.truck.claim_nearest((0, 0))[0], "Near")
+        self.assertEqual(self.truck.claim_nearest((0, 0), max_distance=10), ("Anywhere", None))
+        self.assertIsNone(self.truck.claim_nearest((0, 0), max_distance=10))
+        self.truck.return_truck("Near", (49, 49))
+        self.assertEqual(self.truck.claim_nearest((50, 50))[0], "Far")
+        self.assertEqual(self.truck.claim_nearest()[0], "Near")
+        self.assertIsNone(self.truck.claim_nearest())
+
+class TestDispatchEngine(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.storage = Storage()
+        self.storage.add_supplies('water', 10)
+        self.trucks = Truck()
+        self.stations = HelpStation(os.path.join(self.tmpdir.name, 'stations.json'))
+        self.stations.add_station("Depot", (10, 0))
+        self.engine = DispatchEngine(self.storage, self.trucks, self.stations)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_sends_closest_truck_and_reserves_stock(self):
+        self.trucks.add_truck("T1", (0, 0))
+        self.trucks.add_truck("T2", (9, 1))
+        result = self.engine.request_aid('water', 4, (8, 0))
+        self.assertTrue(result['success'])
+        self.assertEqual((result['truck'], result['station'], result['station_distance']), ("T2", "Depot", 2.0))
+        self.assertEqual(self.storage.check_inventory('water'), 6)
+        self.assertFalse(self.trucks.is_truck_available("T2"))
+
+    def test_failures_reserve_nothing(self):
+        self.trucks.add_truck("T1", (0, 0))
+        self.assertEqual(self.engine.request_aid('water', 11, (0, 0))['reason'], 'no_stock')
+        self.assertTrue(self.trucks.is_truck_available("T1"))
+        self.trucks.dispatch_truck("T1")
+        self.engine.queue_requests = False
+        self.assertEqual(self.engine.request_aid('water', 5, (0, 0))['reason'], 'no_truck')
+        self.assertEqual(self.storage.check_inventory('water'), 10)
+
+    def test_requests_queue_until_a_truck_returns(self):
+        now = [1000.0]
+        self.trucks = Truck(clock=lambda: now[0])
+        self.trucks.add_truck("T1", (0, 0))
+        engine = DispatchEngine(self.storage, self.trucks, self.stations, speed=10, service_time=60)
+        first = engine.request_aid('water', 2, (5, 0))
+        self.assertEqual((first['truck'], first['eta']), ("T1", 1000.0 + 60 + 3600))
+        waiting = engine.request_aid('water', 3, (1, 0))
+        self.assertEqual((waiting['queued'], waiting['queue_position']), (True, 1))
+        self.assertEqual(self.storage.check_inventory('water'), 5)
+        self.assertEqual(engine.stats()['queue_depth'], 1)
+        self.assertEqual(engine.stats()['utilization'], 1.0)
+        now[0] += 3660
+        status = engine.request_status(waiting['request_id'])
+        self.assertEqual((status['queued'], status['truck']), (False, "T1"))
+        self.assertEqual(engine.stats()['queue_depth'], 0)
+        self.assertEqual(engine.stats()['dispatched'], 2)
+
+    def test_unreachable_request_does_not_block_the_queue(self):
+        now = [0.0]
+        self.trucks = Truck(clock=lambda: now[0])
+        self.trucks.add_truck("T1", (0, 0))
+        engine = DispatchEngine(self.storage, self.trucks, self.stations, max_truck_distance=5,
+                                default_trip_time=100, speed=None)
+        self.assertEqual(engine.request_aid('water', 1, (1, 0))['truck'], "T1")
+        far = engine.request_aid('water', 2, (50, 0))
+        near = engine.request_aid('water', 3, (2, 0))
+        self.assertEqual((far['queue_position'], near['queue_position']), (1, 2))
+        now[0] = 100
+        self.assertEqual(engine.poll(), 1)
+        self.assertEqual(engine.request_status(near['request_id'])['truck'], "T1")
+        self.assertEqual(engine.request_status(far['request_id'])['queue_position'], 1)
+        # the stranded request can be withdrawn, giving its stock back
+        self.assertEqual(self.storage.check_inventory('water'), 4)
+        cancelled = engine.cancel_request(far['request_id'])
+        self.assertEqual(cancelled['reason'], 'cancelled')
+        self.assertEqual(self.storage.check_inventory('water'), 6)
+        self.assertEqual(engine.request_status(far['request_id'])['reason'], 'cancelled')
+        self.assertIsNone(engine.cancel_request(far['request_id']))
+        self.assertIsNone(engine.cancel_request(near['request_id']))
+        self.assertEqual(engine.stats()['queue_depth'], 0)
+
+    def test_manual_return_cancels_scheduled_one(self):
+        now = [0.0]
+        trucks = Truck(clock=lambda: now[0])
+        trucks.add_truck("T1")
+        trucks.dispatch_truck("T1")
+        trucks.schedule_return("T1", 100)
+        trucks.return_truck("T1")
+        trucks.dispatch_truck("T1")
+        now[0] = 150
+        self.assertEqual(trucks.process_returns(), [])
+        self.assertFalse(trucks.is_truck_available("T1"))
+        self.assertIsNone(trucks.next_return())
+
+    def test_concurrent_requests_never_oversell(self):
+        for i in range(4):
+            self.trucks.add_truck(f"T{i}", (i, 0))
+        self.engine.queue_requests = False
+        results = []
+
+        def worker():
+            results.append(self.engine.request_aid('water', 3, (0, 0)))
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        sent = [r for r in results if r['success']]
+        self.assertEqual(len(sent), 3)
+        self.assertEqual(len({r['truck'] for r in sent}), 3)
+        self.assertEqual(self.storage.check_inventory('water'), 1)
+        self.assertEqual(self.trucks.stats()['available'], 1)
+
+    def test_failed_dispatch_rolls_back_stock_and_truck(self):
+        self.trucks.add_truck("T1", (0, 0))
+
+        def broken(*args, **kwargs):
+            raise RuntimeError("station lookup failed")
+
+        self.stations.nearest_stations = broken
+        with self.assertRaises(RuntimeError):
+            self.engine.request_aid('water', 4, (1, 0))
+        self.assertEqual(self.storage.check_inventory('water'), 10)
+        self.assertTrue(self.trucks.is_truck_available("T1"))
+
+    def test_non_gov_requester(self):
+        self.trucks.add_truck("T1", (0, 0))
+        self.assertIn("Depot", NonGov((9, 0)).request_aid(self.engine, 'water', walk_distance=2))
+        self.assertEqual(NonGov((0, 0)).request_aid(self.engine, 'water', walk_distance=2),
+                         "A truck has been dispatched to your location.")
+
+class TestFleetPersistence(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'fleet.json')
+        self.now = [1000.0]
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _fleet(self, **kwargs):
+        return Truck(persistence_file=self.path, clock=lambda: self.now[0], **kwargs)
+
+    def test_restart_keeps_busy_trucks_and_returns(self):
+        trucks = self._fleet()
+        trucks.add_truck("T1", (0, 0))
+        trucks.add_truck("T2", (5, 5))
+        self.assertEqual(trucks.claim_nearest((1, 0))[0], "T1")
+        trucks.schedule_return("T1", 60)
+        restarted = self._fleet()
+        self.assertEqual(restarted.trucks, {"T1": False, "T2": True})
+        self.assertEqual(restarted.expected_return("T1"), 1060.0)
+        self.assertEqual(restarted.truck_location("T2"), (5.0, 5.0))
+        self.now[0] = 1100.0
+        self.assertEqual(restarted.process_returns(), ["T1"])
+        self.assertTrue(self._fleet().is_truck_available("T1"))
+
+    def test_snapshot_then_tail_replay(self):
+        trucks = self._fleet(snapshot_every=3)
+        for name in ("T1", "T2", "T3"):
+            trucks.add_truck(name)
+        self.assertTrue(os.path.exists(self.path))
+        trucks.dispatch_truck("T2")
+        restarted = self._fleet(snapshot_every=3)
+        self.assertEqual(restarted.trucks, {"T1": True, "T2": False, "T3": True})
+        self.assertEqual(restarted.claim_nearest(), ("T1", None))
+        self.assertEqual(len(list(restarted.history())), 5)
+
+    def test_shared_fleet_file(self):
+        first = self._fleet(shared=True, snapshot_every=4)
+        second = self._fleet(shared=True, snapshot_every=4)
+        first.add_truck("T1")
+        second.add_truck("T2")
+        # each instance sees the other's changes before making its own
+        self.assertEqual(second.claim_nearest(), ("T1", None))
+        self.assertFalse(first.is_truck_available("T1"))
+        self.assertFalse(first.dispatch_truck("T1"))
+        self.assertTrue(first.dispatch_truck("T2"))
+        first.schedule_return("T2", 60)
+        self.now[0] = 1100.0
+        self.assertEqual(second.process_returns(), ["T2"])
+        self.assertEqual(first.process_returns(), [])
+        self.assertTrue(first.is_truck_available("T2"))
+
+        def add(fleet, prefix):
+            for n in range(20):
+                fleet.add_truck(f"{prefix}{n}")
+
+        threads = [threading.Thread(target=add, args=(fleet, prefix)) for fleet, prefix in ((first, 'A'), (second, 'B'))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        seqs = [e['seq'] for e in first.history()]
+        self.assertEqual(seqs, list(range(1, len(seqs) + 1)))
+        restarted = self._fleet(snapshot_every=4)
+        self.assertEqual(len(restarted.trucks), 42)
+        for fleet in (first, second):
+            self.assertEqual(fleet.stats()['trucks'], 42)
+            self.assertEqual(restarted.trucks, fleet.trucks)
+        # request ids and the waiting queue are shared as well
+        ids = [first.new_request_id(), second.new_request_id(), first.new_request_id()]
+        self.assertEqual(ids, [1, 2, 3])
+        first.queue_request({'request_id': 2, 'item': 'water', 'quantity': 1})
+        self.assertEqual([r['request_id'] for r in second.queued_requests()], [2])
+        self.assertIsNotNone(second.unqueue_request(2))
+        self.assertIsNone(first.unqueue_request(2))
+
+    def test_engine_restart_keeps_queued_requests_and_their_stock(self):
+        path = os.path.join(self.tmpdir.name, 'storage.json')
+        stations = HelpStation(os.path.join(self.tmpdir.name, 'stations.json'))
+        storage = Storage(path)
+        storage.add_supplies('water', 10)
+        trucks = self._fleet()
+        trucks.add_truck("T1", (0, 0))
+        engine = DispatchEngine(storage, trucks, stations, speed=None, default_trip_time=60)
+        sent = engine.request_aid('water', 3, (1, 0))
+        waiting = engine.request_aid('water', 4, (2, 0))
+        self.assertTrue(waiting['queued'])
+
+        storage, trucks = Storage(path), self._fleet()
+        engine = DispatchEngine(storage, trucks, stations, speed=None, default_trip_time=60)
+        self.assertEqual(storage.check_inventory('water'), 3)
+        self.assertEqual(engine.stats()['queue_depth'], 1)
+        self.assertEqual(engine.request_status(waiting['request_id'])['queue_position'], 1)
+        self.assertEqual(engine.request_status(sent['request_id'])['truck'], "T1")
+        # ids carry on from before the restart
+        later = engine.request_aid('water', 1, (3, 0))
+        self.assertEqual(later['request_id'], waiting['request_id'] + 1)
+        self.now[0] += 60
+        self.assertEqual(engine.request_status(waiting['request_id'])['truck'], "T1")
+        self.assertEqual(engine.request_status(later['request_id'])['queue_position'], 1)
+        self.assertEqual(engine.cancel_request(later['request_id'])['reason'], 'cancelled')
+
+        engine = DispatchEngine(Storage(path), self._fleet(), stations)
+        self.assertEqual(engine.storage.check_inventory('water'), 3)
+        self.assertEqual(engine.stats()['queue_depth'], 0)
+        self.assertEqual(engine.request_status(later['request_id'])['reason'], 'cancelled')
+        dispatches = [e['request_id'] for e in engine.trucks.history() if e['event'] == 'dispatch']
+        self.assertEqual(dispatches, [sent['request_id'], waiting['request_id']])
+
+    def test_waiting_requests_and_ids_survive_restarts(self):
+        trucks = self._fleet(snapshot_every=3)
+        trucks.add_truck("T1", (0, 0))
+        first, second = trucks.new_request_id(), trucks.new_request_id()
+        trucks.queue_request({'request_id': first, 'item': 'water', 'quantity': 4, 'location': (1, 2)})
+        trucks.queue_request({'request_id': second, 'item': 'food', 'quantity': 1, 'location': None})
+        restarted = self._fleet(snapshot_every=3)
+        self.assertEqual([(r['request_id'], r['location']) for r in restarted.queued_requests()],
+                         [(first, (1.0, 2.0)), (second, None)])
+        self.assertEqual(restarted.new_request_id(), second + 1)
+        # sending a truck for a waiting request takes it off the queue
+        self.assertEqual(restarted.claim_nearest((1, 2), details={'request_id': first}, queued=True)[0], "T1")
+        self.assertIsNone(restarted.claim_nearest(details={'request_id': first}, queued=True))
+        self.assertEqual(restarted.unqueue_request(second)['item'], 'food')
+        self.assertIsNone(restarted.unqueue_request(second))
+        again = self._fleet()
+        self.assertEqual(again.queued_requests(), [])
+        self.assertEqual(again.new_request_id(), second + 2)
+
+    def test_history_records_dispatch_details(self):
+        storage = Storage()
+        storage.add_supplies('water', 5)
+        stations = HelpStation(os.path.join(self.tmpdir.name, 'stations.json'))
+        trucks = self._fleet()
+        trucks.add_truck("T1", (0, 0))
+        engine = DispatchEngine(storage, trucks, stations)
+        result = engine.request_aid('water', 2, (3, 4), requester="Alice")
+        dispatch = [e for e in trucks.history("T1") if e['event'] == 'dispatch'][0]
+        self.assertEqual((dispatch['supply'], dispatch['quantity'], dispatch['requester']), ('water', 2, "Alice"))
+        self.assertEqual((dispatch['request_id'], dispatch['distance']), (result['request_id'], 5.0))
+        self.assertEqual([e['event'] for e in trucks.history()], ['add', 'request', 'dispatch', 'schedule'])
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
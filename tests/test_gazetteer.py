@@ -0,0 +1,41 @@
+import os
+import tempfile
+import unittest
+from src.gazetteer import Gazetteer
+
+GEONAMES_LINES = [
+    "5969785\tHamilton\tHamilton\tHamilton ON,Hamiltona\t43.25011\t-79.84963\tP\tPPLA2\tCA\t\t08\t\t\t\t519949\t\t\t\t",
+    "2647570\tHamilton\tHamilton\t\t55.76667\t-4.03333\tP\tPPL\tGB\t\t\t\t\t\t48220\t\t\t\t",
+    "6077243\tMontréal\tMontreal\t\t45.50884\t-73.58781\tP\tPPLA2\tCA\t\t\t\t\t\t1600000\t\t\t\t",
+]
+
+class TestGazetteer(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _write(self, name, text):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        return path
+
+    def test_geonames_dump(self):
+        gazetteer = Gazetteer.from_file(self._write('cities.txt', '\n'.join(GEONAMES_LINES) + '\n'))
+        self.assertEqual(len(gazetteer), 3)
+        self.assertEqual(gazetteer.lookup('hamilton').country, 'CA')
+        self.assertEqual(gazetteer.lookup('Hamilton', 'gb').lat, 55.76667)
+        self.assertEqual(gazetteer.lookup('  MONTREAL ').name, 'Montréal')
+        self.assertEqual(gazetteer.lookup('Hamiltona').country, 'CA')
+        self.assertIsNone(gazetteer.lookup('Hamil'))
+        self.assertEqual([p.country for p in gazetteer.complete('ham')], ['CA', 'GB'])
+
+    def test_csv(self):
+        path = self._write('places.csv', 'name,lat,lon,country\nShelter Town,1.5,2.5,Canada\nbad,x,y,\n')
+        place = Gazetteer.from_file(path).lookup('shelter town', 'Canada')
+        self.assertEqual((place.lat, place.lon, place.display_name), (1.5, 2.5, 'Shelter Town, Canada'))
+
+if __name__ == '__main__':
+    unittest.main()
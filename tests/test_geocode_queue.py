@@ -0,0 +1,107 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from src.geocode_queue import GeocodeQueue
+from src.report_utils import GeocoderUnavailable, TokenBucket
+from src.storage import Storage
+
+class TestGeocodeQueue(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'storage.json')
+        self.storage = Storage(self.path)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _geocoder(self, number, street, city, country):
+        return (43.25, -79.87, f'{street}, {city}') if city == 'Hamilton' else None
+
+    def test_resolves_pending_reports_in_background(self):
+        queue = GeocodeQueue(self.storage, geocoder=self._geocoder)
+        queue.start()
+        found = self.storage.add_report('Ana', 'flood', 'x', location_query={'street': 'Main St', 'city': 'Hamilton'})
+        missing = self.storage.add_report('Ana', 'fire', 'y', location_query={'city': 'Atlantis'})
+        queue.submit(found, {'street': 'Main St', 'city': 'Hamilton'})
+        queue.submit(missing, {'city': 'Atlantis'})
+        queue.join()
+        queue.stop()
+        self.assertEqual(self.storage.get_report(found)['resolved_address'], 'Main St, Hamilton')
+        self.assertEqual(self.storage.get_report(missing)['location_status'], 'not_found')
+
+    def test_start_resumes_reports_left_pending(self):
+        report_id = self.storage.add_report('Ana', 'flood', 'x', location_query={'city': 'Hamilton'})
+        queue = GeocodeQueue(Storage(self.path), geocoder=self._geocoder)
+        self.assertEqual(queue.start(), 1)
+        queue.join()
+        queue.stop()
+        self.assertEqual(Storage(self.path).get_report(report_id)['lat'], 43.25)
+
+    def _wait_for(self, report_id, status):
+        deadline = time.monotonic() + 5
+        while self.storage.get_report(report_id)['location_status'] != status and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return self.storage.get_report(report_id)['location_status']
+
+    def test_outage_leaves_report_pending_and_retries(self):
+        calls = []
+        failed = threading.Event()
+        recovered = threading.Event()
+
+        def flaky(number, street, city, country):
+            calls.append(time.monotonic())
+            if not recovered.is_set():
+                failed.set()
+                raise GeocoderUnavailable('nominatim unreachable')
+            return self._geocoder(number, street, city, country)
+
+        queue = GeocodeQueue(self.storage, geocoder=flaky, retry_delay=0.02, max_retry_delay=0.05)
+        queue.start()
+        report_id = self.storage.add_report('Ana', 'flood', 'x', location_query={'city': 'Hamilton'})
+        queue.submit(report_id, {'city': 'Hamilton'})
+        self.assertTrue(failed.wait(5))
+        queue.join()
+        self.assertEqual(self.storage.get_report(report_id)['location_status'], 'pending')
+        recovered.set()
+        self.assertEqual(self._wait_for(report_id, 'resolved'), 'resolved')
+        queue.stop()
+        self.assertEqual(self.storage.get_report(report_id)['lat'], 43.25)
+        self.assertGreaterEqual(len(calls), 2)
+
+    def test_batch_retries_rows_the_geocoder_could_not_answer(self):
+        down = [True]
+
+        def flaky(number, street, city, country):
+            if city == 'Atlantis' and down[0]:
+                down[0] = False
+                raise GeocoderUnavailable('offline')
+            return self._geocoder(number, street, city, country)
+
+        queue = GeocodeQueue(self.storage, geocoder=flaky, retry_delay=0.02)
+        queue.start()
+        found = self.storage.add_report('Ana', 'flood', 'x', location_query={'city': 'Hamilton'})
+        missing = self.storage.add_report('Ana', 'fire', 'y', location_query={'city': 'Atlantis'})
+        queue.submit_batch([(found, {'city': 'Hamilton'}), (missing, {'city': 'Atlantis'})]).join()
+        self.assertEqual(self.storage.get_report(found)['location_status'], 'resolved')
+        self.assertEqual(self.storage.get_report(missing)['location_status'], 'pending')
+        self.assertEqual(self._wait_for(missing, 'not_found'), 'not_found')
+        queue.stop()
+
+class TestTokenBucket(unittest.TestCase):
+    def test_waits_once_the_burst_is_spent(self):
+        now, slept = [0.0], []
+        bucket = TokenBucket(rate=1.0, capacity=2, clock=lambda: now[0], sleep=slept.append)
+        bucket.acquire()
+        bucket.acquire()
+        self.assertEqual(slept, [])
+        bucket.acquire()
+        bucket.acquire()
+        self.assertEqual(slept, [1.0, 2.0])
+        now[0] = 10.0
+        bucket.acquire()
+        self.assertEqual(slept, [1.0, 2.0])
+
+if __name__ == '__main__':
+    unittest.main()
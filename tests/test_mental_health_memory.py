@@ -0,0 +1,296 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import mental_health_ai
+from mental_health_ai import (MAX_HISTORY_ITEMS, MAX_LIST_ITEMS, MemoryStore, build_context, cap_memory,
+                              estimate_tokens, merge_delta)
+
+
+class TestMemoryStore(unittest.TestCase):
+    def setUp(self):
+        self.now = [0.0]
+
+    def _store(self, **kwargs):
+        return MemoryStore(clock=lambda: self.now[0], **kwargs)
+
+    def test_sessions_are_isolated(self):
+        store = self._store()
+        mental_health_ai.update_disasters("there was a flood here", store.get('a'))
+        self.assertEqual([d['type'] for d in store.get('a')['disasters']], ['flood'])
+        self.assertEqual(store.get('b')['disasters'], [])
+        self.assertEqual(mental_health_ai.memory['disasters'], [])
+
+    def test_least_recently_used_and_idle_sessions_are_evicted(self):
+        store = self._store(max_sessions=2, idle_timeout=60)
+        store.get('a')
+        store.get('b')
+        store.get('a')
+        store.get('c')
+        self.assertEqual(list(store._sessions), ['a', 'c'])
+        self.now[0] = 100
+        store.get('d')
+        self.assertEqual(len(store), 1)
+
+    def test_evicted_sessions_spill_to_disk(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = self._store(max_sessions=1, spill_dir=tmp)
+            store.get('a')['user_name'] = 'Ana'
+            store.get('b')
+            self.assertEqual(len(os.listdir(tmp)), 1)
+            self.assertEqual(store.get('a')['user_name'], 'Ana')
+            store.discard('a')
+            store.discard('b')
+            self.assertEqual(os.listdir(tmp), [])
+
+    def test_cap_memory_bounds_lists_and_drops_unknown_keys(self):
+        memory = mental_health_ai.new_memory()
+        memory.update({'losses': list(range(100)), 'conversation_history': list(range(100)),
+                       'friends': {str(i): i for i in range(100)}, 'injected': 'x' * 1000,
+                       'preferences': {'favorites': list(range(100))}})
+        cap_memory(memory)
+        self.assertEqual(memory['losses'], list(range(100 - MAX_LIST_ITEMS, 100)))
+        self.assertEqual(len(memory['conversation_history']), MAX_HISTORY_ITEMS)
+        self.assertNotIn('injected', memory)
+        self.assertEqual(memory['preferences']['tone'], None)
+        self.assertEqual(len(memory['preferences']['favorites']), MAX_LIST_ITEMS)
+        self.assertLessEqual(len(memory['friends']), mental_health_ai.MAX_DICT_ITEMS)
+
+
+class _ScriptedBackend:
+    """Answers every message with the same parsed reply; available=False simulates an outage."""
+    cacheable = True
+
+    def __init__(self, reply, delta=None, available=True):
+        self.reply = reply
+        self.delta = delta
+        self.available = available
+        self.prompts = []
+
+    def complete(self, system_prompt, user_input, signals=None):
+        if not self.available:
+            raise mental_health_ai.ChatBackendUnavailable("down")
+        self.prompts.append(system_prompt)
+        reply = dict(self.reply)
+        if self.delta:
+            reply['memory_delta'] = self.delta(user_input)
+        return json.dumps(reply)
+
+    def stream(self, system_prompt, user_input, signals=None):
+        if not self.available:
+            raise mental_health_ai.ChatBackendUnavailable("down")
+        yield self.reply['response']
+
+
+class TestPromptContext(unittest.TestCase):
+    def setUp(self):
+        self.memory = mental_health_ai.new_memory()
+        self.memory.update({'user_name': 'Ana', 'summary': 'Ana lost her home in a flood.',
+                            'pets': {'Rex': 'dog, missing since the flood'},
+                            'recent_emotions': ['sad', 'anxious']})
+
+    def test_only_relevant_fields_are_sent(self):
+        context = build_context(self.memory, "Have you seen Rex anywhere?")
+        self.assertEqual(set(context), {'summary', 'user_name', 'pets'})
+        self.assertIn('recent_emotions', build_context(self.memory, "I feel so anxious today"))
+
+    def test_context_stays_within_budget(self):
+        self.memory['losses'] = [{'person': f'Friend{i}', 'cause': 'flood ' * 20} for i in range(20)]
+        context = build_context(self.memory, "I keep thinking about everyone we lost", budget=200)
+        self.assertLessEqual(estimate_tokens(json.dumps(context)) - len(context), 200)
+        self.assertEqual(context['losses'][-1]['person'], 'Friend19')
+
+    def test_merge_delta(self):
+        merge_delta(self.memory, {'recent_emotions': ['sad', 'tired'], 'pets': {'Milo': 'cat'},
+                                  'age': 34, 'preferences': {'tone': 'gentle', 'favorites': ['tea']},
+                                  'unknown': 1})
+        self.assertEqual(self.memory['recent_emotions'], ['sad', 'anxious', 'tired'])
+        self.assertEqual(set(self.memory['pets']), {'Rex', 'Milo'})
+        self.assertEqual((self.memory['age'], self.memory['preferences']['tone']), (34, 'gentle'))
+        self.assertEqual(self.memory['preferences']['favorites'], ['tea'])
+        self.assertNotIn('unknown', self.memory)
+
+    def test_prompt_size_stays_flat(self):
+        backend = _ScriptedBackend({'response': 'I hear you.', 'summary': 'Ana is coping with the flood.'},
+                                   delta=lambda user_input: {'major_events': [user_input]})
+        prompts = backend.prompts
+        mental_health_ai.set_backends([backend])
+        try:
+            for turn in range(60):
+                reply = mental_health_ai.update_memory_with_gpt(f"Turn {turn}: the flood happened again", self.memory)
+        finally:
+            mental_health_ai.set_backends(mental_health_ai.default_backends())
+        self.assertEqual(reply, 'I hear you.')
+        self.assertEqual(self.memory['summary'], 'Ana is coping with the flood.')
+        self.assertEqual(len(self.memory['conversation_history']), MAX_HISTORY_ITEMS)
+        self.assertLess(len(prompts[-1]), len(prompts[0]) + 4 * mental_health_ai.PROMPT_TOKEN_BUDGET)
+        self.assertLessEqual(len(prompts[-1]) - len(prompts[30]), 40)
+
+
+class _FakeCompletions(BaseHTTPRequestHandler):
+    """OpenAI-compatible /chat/completions that streams `pieces`, pausing after the first until `resume` is set."""
+    protocol_version = 'HTTP/1.1'
+    pieces = []
+    resume = threading.Event()
+    requests = []
+
+    def do_POST(self):
+        self.requests.append(json.loads(self.rfile.read(int(self.headers['Content-Length']))))
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        for n, piece in enumerate(self.pieces):
+            chunk = {'id': 'c1', 'object': 'chat.completion.chunk', 'created': 0, 'model': 'gpt-4o-mini',
+                     'choices': [{'index': 0, 'delta': {'content': piece}, 'finish_reason': None}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+            if n == 0:
+                self.resume.wait(5)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def log_message(self, *args):
+        pass
+
+
+@unittest.skipUnless(mental_health_ai.NEW_SDK, "openai SDK not installed")
+class TestStreamingReply(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _FakeCompletions)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.saved = mental_health_ai.client, mental_health_ai.base_url
+        mental_health_ai.base_url = f'http://127.0.0.1:{self.server.server_port}/v1'
+        mental_health_ai._init_client_from_key('test-key')
+        _FakeCompletions.resume.clear()
+        _FakeCompletions.requests.clear()
+
+    def tearDown(self):
+        _FakeCompletions.resume.set()
+        mental_health_ai.client, mental_health_ai.base_url = self.saved
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_reply_streams_before_the_memory_update(self):
+        _FakeCompletions.pieces = ["I'm so sorry ", "about Rex.", "\n@@MEM", 'ORY@@ {"memory_delta": ',
+                                   '{"pets": {"Rex": "dog"}}, "summary": "Ana misses Rex."}']
+        memory = mental_health_ai.new_memory()
+        stream = mental_health_ai.stream_memory_reply("I miss my dog Rex", memory)
+        # the first piece arrives while the server is still holding back the rest
+        self.assertEqual(next(stream), "I'm so sorry ")
+        _FakeCompletions.resume.set()
+        rest = ''.join(stream)
+        self.assertEqual(rest.strip(), "about Rex.")
+        self.assertNotIn('@@', rest)
+        self.assertEqual(memory['pets'], {'Rex': 'dog'})
+        self.assertEqual(memory['summary'], 'Ana misses Rex.')
+        self.assertEqual(memory['conversation_history'][-1]['assistant'], "I'm so sorry about Rex.")
+        self.assertTrue(_FakeCompletions.requests[0]['stream'])
+
+    def test_reply_without_memory_update(self):
+        _FakeCompletions.resume.set()
+        _FakeCompletions.pieces = ["Take ", "a slow breath."]
+        memory = mental_health_ai.new_memory()
+        reply = ''.join(mental_health_ai.stream_memory_reply("I just need to talk", memory))
+        self.assertEqual(reply, "Take a slow breath.")
+        self.assertEqual(memory['summary'], '')
+
+
+class TestBackends(unittest.TestCase):
+    def tearDown(self):
+        mental_health_ai.set_backends(mental_health_ai.default_backends())
+
+    def test_falls_back_to_offline_responder(self):
+        down = _ScriptedBackend({'response': 'online'}, available=False)
+        mental_health_ai.set_backends([down, mental_health_ai.RuleBasedBackend()])
+        memory = mental_health_ai.new_memory()
+        reply = mental_health_ai.update_memory_with_gpt("My dad died in the earthquake and I feel so scared", memory)
+        self.assertIn("I'm so sorry about your dad", reply)
+        self.assertIn("Drop, cover, and hold on", reply)
+        self.assertIn("scared", reply)
+        self.assertEqual(memory['losses'][0]['person'], 'Dad')
+        streamed = ''.join(mental_health_ai.stream_memory_reply("Nothing has felt right lately", memory))
+        self.assertEqual(streamed, mental_health_ai.FALLBACK_REPLY)
+
+    def test_openai_backend_backs_off_after_a_failure(self):
+        now = [0.0]
+        backend = mental_health_ai.OpenAIBackend(retry_after=60, clock=lambda: now[0])
+        saved = mental_health_ai.client
+        mental_health_ai.client = object()
+        try:
+            with self.assertRaises(mental_health_ai.ChatBackendUnavailable):
+                backend.complete("system", "hi")
+            calls = []
+            original = mental_health_ai.get_chat_completion
+            mental_health_ai.get_chat_completion = lambda *args: calls.append(args) or '{"response": "ok"}'
+            try:
+                with self.assertRaises(mental_health_ai.ChatBackendUnavailable):
+                    backend.complete("system", "hi")
+                self.assertEqual(calls, [])
+                now[0] = 61
+                self.assertEqual(backend.complete("system", "hi"), '{"response": "ok"}')
+            finally:
+                mental_health_ai.get_chat_completion = original
+        finally:
+            mental_health_ai.client = saved
+
+    def test_openers_are_answered_from_the_cache(self):
+        backend = _ScriptedBackend({'response': 'Here is how this works.'})
+        mental_health_ai.set_backends([backend])
+        cache = mental_health_ai.ReplyCache(max_entries=20)
+        saved = mental_health_ai.reply_cache
+        mental_health_ai.reply_cache = cache
+        try:
+            self.assertEqual(mental_health_ai.update_memory_with_gpt("Hello!", mental_health_ai.new_memory()),
+                             mental_health_ai.CANNED_REPLIES['hello'])
+            mental_health_ai.update_memory_with_gpt("How does this work?", mental_health_ai.new_memory())
+            mental_health_ai.update_memory_with_gpt("how does this work", mental_health_ai.new_memory())
+            self.assertEqual(len(backend.prompts), 1)
+            # personal messages are never cached
+            for _ in range(2):
+                mental_health_ai.update_memory_with_gpt("How do I sleep?", mental_health_ai.new_memory())
+            self.assertEqual(len(backend.prompts), 3)
+        finally:
+            mental_health_ai.reply_cache = saved
+
+    def test_replies_given_during_an_outage_are_not_cached(self):
+        online = _ScriptedBackend({'response': 'Here is how this works.'}, available=False)
+        mental_health_ai.set_backends([online, mental_health_ai.RuleBasedBackend()])
+        saved = mental_health_ai.reply_cache
+        mental_health_ai.reply_cache = mental_health_ai.ReplyCache()
+        try:
+            for ask in (mental_health_ai.update_memory_with_gpt,
+                        lambda message, mem: ''.join(mental_health_ai.stream_memory_reply(message, mem))):
+                online.available = False
+                # FALLBACK_REPLY, then a templated offline answer
+                self.assertEqual(ask("How does this work?", mental_health_ai.new_memory()),
+                                 mental_health_ai.FALLBACK_REPLY)
+                self.assertIn("feel scared", ask("Is it normal to be scared?", mental_health_ai.new_memory()))
+                online.available = True
+                self.assertEqual(ask("How does this work?", mental_health_ai.new_memory()), 'Here is how this works.')
+                self.assertEqual(ask("Is it normal to be scared?", mental_health_ai.new_memory()),
+                                 'Here is how this works.')
+                mental_health_ai.reply_cache = mental_health_ai.ReplyCache()
+        finally:
+            mental_health_ai.reply_cache = saved
+
+    def test_each_message_is_scanned_once(self):
+        mental_health_ai.set_backends([_ScriptedBackend({'response': 'ok'}, available=False),
+                                       mental_health_ai.RuleBasedBackend()])
+        saved = mental_health_ai.reply_cache
+        mental_health_ai.reply_cache = mental_health_ai.ReplyCache()
+        try:
+            with mock.patch('mental_health_ai.scan', wraps=mental_health_ai.scan) as scan:
+                mental_health_ai.update_memory_with_gpt("Is the flood over?", mental_health_ai.new_memory())
+                self.assertEqual(scan.call_count, 1)
+                ''.join(mental_health_ai.stream_memory_reply("What now?", mental_health_ai.new_memory()))
+                self.assertEqual(scan.call_count, 2)
+        finally:
+            mental_health_ai.reply_cache = saved
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,10 @@
+import json
+import os
+import random
+import tempfile
 import unittest
 from src.help_stations import HelpStation
+from src.utils import calculate_distance, haversine_km
 
 class TestHelpStationProximity(unittest.TestCase):
     def setUp(self):
@@ -19,5 +24,114 @@ class TestHelpStationProximity(unittest.TestCase):
         with self.assertRaises(ValueError):
             self.help_station.calculate_distance((0, 0), "Station C")
 
+class TestHelpStationNearest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.stations = HelpStation(os.path.join(self.tmpdir.name, 'stations.json'), cell_size=5)
+        for i in range(20):
+            for j in range(20):
+                self.stations.add_station(f"S{i}-{j}", (i * 3, j * 3))
+        self.stations.add_station("No Coordinates")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_nearest_stations(self):
+        name, distance = self.stations.nearest_stations((3.5, 3.2))[0]
+        self.assertEqual(name, "S1-1")
+        self.assertAlmostEqual(distance, 0.5385164807)
+        self.assertEqual([n for n, _ in self.stations.nearest_stations((100, 90), k=2)], ["S19-19", "S19-18"])
+        self.assertEqual(self.stations.nearest_stations((100, 100), max_distance=5), [])
+        self.stations.delete_station("S1-1")
+        self.assertNotEqual(self.stations.nearest_stations((3.5, 3.2))[0][0], "S1-1")
+
+    def test_bulk_matches_single_queries(self):
+        points = [(0.1, 0.3), (10.2, 31.7), (-5, 70), (56.6, 57.1)]
+        self.assertEqual(self.stations.nearest_stations_bulk(points, k=3, max_distance=8),
+                         [self.stations.nearest_stations(p, k=3, max_distance=8) for p in points])
+
+    def test_index_is_rebuilt_on_load(self):
+        reloaded = HelpStation(os.path.join(self.tmpdir.name, 'stations.json'))
+        self.assertEqual(reloaded.nearest_stations((30, 30))[0], ("S10-10", 0.0))
+
+class TestHelpStationHaversine(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.stations = HelpStation(os.path.join(self.tmpdir.name, 'stations.json'), metric='haversine')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_known_distance(self):
+        # London -> Paris
+        self.assertAlmostEqual(calculate_distance((51.5074, -0.1278), (48.8566, 2.3522)), 343.6, delta=0.5)
+        self.stations.add_station("Paris", (48.8566, 2.3522))
+        self.assertAlmostEqual(self.stations.calculate_distance((51.5074, -0.1278), "Paris"), 343.6, delta=0.5)
+
+    def test_nearest_across_the_antimeridian(self):
+        self.stations.add_station("Fiji", (-17.7, 178.1))
+        self.stations.add_station("Samoa", (-13.8, -171.8))
+        self.stations.add_station("Auckland", (-36.8, 174.8))
+        self.assertEqual([n for n, _ in self.stations.nearest_stations((-14.0, -179.9), k=2)], ["Fiji", "Samoa"])
+
+    def test_nearest_matches_brute_force(self):
+        rng = random.Random(3)
+        points = {f"S{i}": (rng.uniform(-80, 80), rng.uniform(-180, 180)) for i in range(300)}
+        for name, loc in points.items():
+            self.stations.add_station(name, loc)
+        queries = [(rng.uniform(-85, 85), rng.uniform(-180, 180)) for _ in range(30)]
+        bulk = self.stations.nearest_stations_bulk(queries, k=3)
+        for query, from_bulk in zip(queries, bulk):
+            expected = sorted(haversine_km(query[0], query[1], lat, lon) for lat, lon in points.values())[:3]
+            found = self.stations.nearest_stations(query, k=3)
+            self.assertEqual([round(d, 6) for _, d in found], [round(d, 6) for d in expected])
+            self.assertEqual([round(d, 6) for _, d in from_bulk], [round(d, 6) for d in expected])
+
+class TestHelpStationRecords(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'stations.json')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_file_format_is_unchanged(self):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({'stations': ['A', 'B'], 'locations': {'B': [1.0, 2.0]}}, f)
+        stations = HelpStation(self.path)
+        self.assertEqual(dict(stations.stations), {'A': None, 'B': (1.0, 2.0)})
+        stations.add_station('C', (3, 4))
+        self.assertTrue(stations.delete_station('A'))
+        with open(self.path, encoding='utf-8') as f:
+            self.assertEqual(json.load(f), {'stations': ['B', 'C'], 'locations': {'B': [1.0, 2.0], 'C': [3.0, 4.0]}})
+
+    def test_capacity_and_metadata_round_trip(self):
+        stations = HelpStation(self.path)
+        stations.add_station('Shelter', (1, 1), capacity=120, metadata={'phone': '555-0100'})
+        self.assertTrue(stations.update_station('Shelter', capacity=80, metadata={'open': '24h'}))
+        self.assertFalse(stations.update_station('Missing', capacity=1))
+        self.assertEqual(HelpStation(self.path).station_info('Shelter'),
+                         {'name': 'Shelter', 'location': (1.0, 1.0), 'capacity': 80,
+                          'metadata': {'phone': '555-0100', 'open': '24h'}})
+        self.assertIn('Shelter', stations)
+        self.assertIsNone(stations.station_info('Missing'))
+
+class TestHelpStationShared(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'stations.json')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_instances_see_each_others_changes(self):
+        first = HelpStation(self.path, shared=True)
+        second = HelpStation(self.path, shared=True)
+        first.add_station("North", (1, 1))
+        second.add_station("South", (2, 2))
+        self.assertEqual(first.list_stations(), ["North", "South"])
+        self.assertTrue(first.delete_station("South"))
+        self.assertEqual(second.list_stations(), ["North"])
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
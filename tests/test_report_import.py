@@ -0,0 +1,33 @@
+import unittest
+from src.report_import import parse_report_rows
+from src.sqlite_storage import SqliteStorage
+
+CSV_TEXT = """name,disaster_type,details,address,city,country,lat,lon
+Ana,flood,basement,12 Main St,Hamilton,Canada,,
+Ben,fire,smoke,,,,43.2,-79.9
+Cy,storm,roof,,,,,
+"""
+
+class TestReportImport(unittest.TestCase):
+    def test_parse_csv(self):
+        rows = parse_report_rows(CSV_TEXT, 'csv')
+        self.assertEqual(rows[0]['location_query'],
+                         {'number': '', 'street': '12 Main St', 'city': 'Hamilton', 'country': 'Canada'})
+        self.assertEqual((rows[1]['lat'], rows[1]['lon'], rows[1]['location_query']), (43.2, -79.9, None))
+
+    def test_parse_jsonl_errors_name_the_line(self):
+        with self.assertRaisesRegex(ValueError, 'Line 2'):
+            parse_report_rows('{"name": "Ana", "disaster_type": "flood"}\n{"name": "Ben"}\n', 'jsonl')
+        with self.assertRaisesRegex(ValueError, 'Line 1'):
+            parse_report_rows('not json', 'jsonl')
+
+    def test_rows_import_in_one_transaction(self):
+        storage = SqliteStorage(':memory:')
+        ids = storage.add_reports(parse_report_rows(CSV_TEXT, 'csv'))
+        self.assertEqual(ids, [1, 2, 3])
+        self.assertEqual([r['location_status'] for r in storage.get_reports()], ['pending', 'resolved', None])
+        self.assertEqual(storage.requesters, ['Ana', 'Ben', 'Cy'])
+        storage.close()
+
+if __name__ == '__main__':
+    unittest.main()
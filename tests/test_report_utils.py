@@ -0,0 +1,208 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from src import report_utils
+from src.gazetteer import Gazetteer, Place
+from src.report_utils import (GazetteerBackend, GeocodeCache, GeocoderUnavailable, NominatimBackend,
+                              StaticBackend)
+
+class TestGeocodeCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'geocode_cache.json')
+        self.now = 1000.0
+        self.cache = GeocodeCache(self.path, max_entries=2, ttl=100, negative_ttl=10, clock=lambda: self.now)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_hits_misses_and_normalized_keys(self):
+        self.assertIs(self.cache.get('Hamilton, Canada'), report_utils._MISSING)
+        self.cache.put('Hamilton, Canada', (43.25, -79.87, 'Hamilton'))
+        self.assertEqual(self.cache.get('  hamilton ,canada'), (43.25, -79.87, 'Hamilton'))
+        self.assertEqual(self.cache.stats(), {'entries': 1, 'hits': 1, 'misses': 1})
+
+    def test_negative_results_expire_sooner(self):
+        self.cache.put('Nowhere', None)
+        self.cache.put('Hamilton', (43.25, -79.87, 'Hamilton'))
+        self.assertIsNone(self.cache.get('nowhere'))
+        self.now += 50
+        self.assertIs(self.cache.get('nowhere'), report_utils._MISSING)
+        self.assertIsNotNone(self.cache.get('hamilton'))
+
+    def test_lru_eviction_and_persistence(self):
+        self.cache.put('a', (1.0, 1.0, 'A'))
+        self.cache.put('b', (2.0, 2.0, 'B'))
+        self.cache.get('a')
+        self.cache.put('c', (3.0, 3.0, 'C'))
+        self.cache.flush()
+        reloaded = GeocodeCache(self.path, clock=lambda: self.now)
+        self.assertIs(reloaded.get('b'), report_utils._MISSING)
+        self.assertEqual(reloaded.get('a'), (1.0, 1.0, 'A'))
+        self.assertEqual(reloaded.get('c'), (3.0, 3.0, 'C'))
+
+    def test_puts_are_batched_until_flush(self):
+        cache = GeocodeCache(self.path, save_every=3, save_interval=60, clock=lambda: self.now)
+        with mock.patch('src.report_utils.atomic_write_json', wraps=report_utils.atomic_write_json) as write:
+            cache.put('a', (1.0, 1.0, 'A'))
+            cache.put('b', (2.0, 2.0, 'B'))
+            self.assertEqual(write.call_count, 0)
+            self.assertFalse(os.path.exists(self.path))
+            cache.put('c', (3.0, 3.0, 'C'))
+            self.assertEqual(write.call_count, 1)
+            cache.put('d', None)
+            self.now += 60
+            cache.put('e', None)
+            self.assertEqual(write.call_count, 2)
+            cache.flush()
+            cache.flush()
+            self.assertEqual(write.call_count, 2)
+            cache.put('f', None)
+            cache.flush()
+            self.assertEqual(write.call_count, 3)
+        self.assertIsNone(GeocodeCache(self.path, clock=lambda: self.now).get('f'))
+
+    def test_geocode_uses_cache(self):
+        original = report_utils.cache
+        report_utils.cache = self.cache
+        try:
+            self.cache.put('1 Main St, Hamilton, Canada', None)
+            self.cache.put('Main St, Hamilton, Canada', (43.25, -79.87, 'Main St'))
+            self.assertEqual(report_utils.geocode('1', 'Main St', 'Hamilton', 'Canada'), (43.25, -79.87, 'Main St'))
+        finally:
+            report_utils.cache = original
+
+class TestGeocodeBackends(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache = GeocodeCache(os.path.join(self.tmpdir.name, 'cache.json'))
+        self.original = report_utils.cache, report_utils.backends
+        report_utils.cache = self.cache
+        gazetteer = Gazetteer()
+        gazetteer.add(Place('Hamilton', 43.25, -79.85, 'CA', 500000))
+        self.network = StaticBackend({'12 Main St, Hamilton, Canada': (43.26, -79.86, '12 Main St')})
+        report_utils.set_backends([GazetteerBackend(gazetteer), self.network])
+
+    def tearDown(self):
+        report_utils.cache, report_utils.backends = self.original
+        self.tmpdir.cleanup()
+
+    def test_network_answers_precise_queries(self):
+        self.assertEqual(report_utils.geocode('12', 'Main St', 'Hamilton', 'Canada'), (43.26, -79.86, '12 Main St'))
+        self.assertEqual(len(self.cache), 1)
+
+    def test_gazetteer_answers_when_offline(self):
+        self.network.available = False
+        self.assertEqual(report_utils.geocode('12', 'Main St', 'Hamilton', 'Canada'), (43.25, -79.85, 'Hamilton, CA'))
+        # neither the outage nor the local answer is written to the cache
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(self.network.queries, ['12 Main St, Hamilton, Canada', 'Main St, Hamilton, Canada'])
+
+    def test_strict_geocode_reports_an_outage(self):
+        self.network.available = False
+        # Atlantis is not in the gazetteer, so only the network could have answered
+        self.assertIsNone(report_utils.geocode(None, 'Main St', 'Atlantis', 'Nowhere'))
+        with self.assertRaises(GeocoderUnavailable):
+            report_utils.geocode(None, 'Main St', 'Atlantis', 'Nowhere', strict=True)
+        results = dict(report_utils.geocode_batch([(None, '', 'Atlantis', 'Nowhere'), ('12', 'Main St', 'Hamilton', 'Canada')],
+                                                  strict=True))
+        self.assertEqual(results, {1: (43.25, -79.85, 'Hamilton, CA')})
+        self.network.available = True
+        self.assertIsNone(report_utils.geocode(None, 'Main St', 'Atlantis', 'Nowhere', strict=True))
+
+    def test_geocode_batch_shares_queries(self):
+        self.network.available = True
+        addresses = [('12', 'Main St', 'Hamilton', 'Canada'), (None, 'Elm St', 'Hamilton', 'Canada'),
+                     ('12', 'main st', 'HAMILTON', 'canada'), (None, '', '', '')]
+        results = dict(report_utils.geocode_batch(addresses, workers=3))
+        self.assertEqual(sorted(results), [0, 1, 2, 3])
+        self.assertEqual(results[0], (43.26, -79.86, '12 Main St'))
+        self.assertEqual(results[2], results[0])
+        self.assertEqual(results[1], (43.25, -79.85, 'Hamilton, CA'))
+        self.assertIsNone(results[3])
+        # the duplicate row was not looked up again
+        self.assertEqual(self.network.queries, ['12 Main St, Hamilton, Canada', 'Elm St, Hamilton, Canada'])
+
+class _FakeNominatim(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    statuses = []
+    clients = set()
+    retry_after = None
+
+    def do_GET(self):
+        self.clients.add(self.client_address)
+        status = self.statuses.pop(0) if self.statuses else 200
+        body = json.dumps([{'lat': '43.25', 'lon': '-79.87', 'display_name': 'Hamilton'}]).encode()
+        self.send_response(status)
+        if status == 429 and self.retry_after is not None:
+            self.send_header('Retry-After', self.retry_after)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class TestNominatimBackend(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _FakeNominatim)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        _FakeNominatim.clients.clear()
+        _FakeNominatim.retry_after = None
+        self.url = f'http://127.0.0.1:{self.server.server_port}/search'
+        self.bucket = mock.Mock()
+        self.slept = []
+        self.backend = NominatimBackend(self.url, bucket=self.bucket, backoff_factor=0.5, retries=2,
+                                        sleep=self.slept.append)
+
+    def tearDown(self):
+        self.backend.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_retries_and_reuses_the_connection(self):
+        _FakeNominatim.statuses = [503, 429]
+        self.assertEqual(self.backend.lookup('Hamilton'), (43.25, -79.87, 'Hamilton'))
+        self.backend.lookup('Toronto')
+        self.assertEqual(len(_FakeNominatim.clients), 1)
+        # backoff starts above zero, and every attempt went through the rate limit
+        self.assertEqual(self.slept, [0.5, 1.0])
+        self.assertEqual(self.bucket.acquire.call_count, 4)
+
+    def test_honours_retry_after(self):
+        _FakeNominatim.statuses = [429]
+        _FakeNominatim.retry_after = '2'
+        self.backend.lookup('Hamilton')
+        self.assertEqual(self.slept, [2.0])
+        # a wait longer than retry_after is not slept through
+        _FakeNominatim.statuses = [429]
+        _FakeNominatim.retry_after = '3600'
+        with self.assertRaises(GeocoderUnavailable):
+            self.backend.lookup('Toronto')
+        self.assertEqual(self.slept, [2.0])
+
+    def test_timeouts_are_not_retried(self):
+        backend = NominatimBackend(self.url, bucket=self.bucket, sleep=self.slept.append)
+        with mock.patch.object(backend.session, 'get', side_effect=report_utils.requests.ReadTimeout('slow')) as get:
+            with self.assertRaises(GeocoderUnavailable):
+                backend.lookup('Hamilton')
+        backend.close()
+        self.assertEqual(get.call_count, 1)
+        self.assertEqual(self.slept, [])
+
+    def test_gives_up_after_retries(self):
+        _FakeNominatim.statuses = [500, 500, 500]
+        with self.assertRaises(GeocoderUnavailable):
+            self.backend.lookup('Hamilton')
+        # unavailable for a while, without touching the network
+        with self.assertRaises(GeocoderUnavailable):
+            self.backend.lookup('Hamilton')
+        self.assertEqual(_FakeNominatim.statuses, [])
+
+if __name__ == '__main__':
+    unittest.main()
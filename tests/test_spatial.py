@@ -0,0 +1,40 @@
+import random
+import unittest
+from src.spatial import GridIndex
+
+class TestGridIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = GridIndex(cell_size=1.0)
+        self.index.insert('a', 0.5, 0.5)
+        self.index.insert('b', 2.5, 2.5)
+        self.index.insert('c', -3.0, 4.0)
+
+    def test_query_bbox(self):
+        self.assertEqual(set(self.index.query_bbox(0, 0, 3, 3)), {'a', 'b'})
+        self.assertEqual(set(self.index.query_bbox(-180, -90, 180, 90)), {'a', 'b', 'c'})
+        self.assertEqual(list(self.index.query_bbox(10, 10, 11, 11)), [])
+
+    def test_move_and_remove(self):
+        self.index.insert('a', 2.6, 2.6)
+        self.assertEqual(set(self.index.query_bbox(2, 2, 3, 3)), {'a', 'b'})
+        self.assertTrue(self.index.remove('b'))
+        self.assertFalse(self.index.remove('b'))
+        self.assertEqual(list(self.index.query_bbox(2, 2, 3, 3)), ['a'])
+        self.assertEqual(len(self.index), 2)
+
+    def test_nearest_matches_brute_force(self):
+        rng = random.Random(7)
+        index = GridIndex(cell_size=2.0)
+        points = {i: (rng.uniform(-50, 50), rng.uniform(-50, 50)) for i in range(500)}
+        for key, (x, y) in points.items():
+            index.insert(key, x, y)
+        for _ in range(50):
+            qx, qy = rng.uniform(-80, 80), rng.uniform(-80, 80)
+            expected = sorted(((x - qx) ** 2 + (y - qy) ** 2) ** 0.5 for x, y in points.values())
+            self.assertEqual([round(d, 9) for d, _ in index.nearest(qx, qy, k=5)],
+                             [round(d, 9) for d in expected[:5]])
+            limited = index.nearest(qx, qy, k=5, max_distance=10)
+            self.assertEqual(len(limited), len([d for d in expected[:5] if d <= 10]))
+
+if __name__ == '__main__':
+    unittest.main()
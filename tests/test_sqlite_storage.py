@@ -0,0 +1,142 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+from src.sqlite_storage import SqliteStorage
+from src.storage import Storage, create_storage
+
+class TestSqliteStorage(unittest.TestCase):
+    def setUp(self):
+        self.storage = SqliteStorage(':memory:')
+
+    def tearDown(self):
+        self.storage.close()
+
+    def test_add_and_check_supplies_case_insensitive(self):
+        self.storage.add_supplies('Blankets', 5)
+        self.storage.add_supplies('blankets', 3)
+        self.assertEqual(self.storage.check_inventory('BLANKETS'), 8)
+        self.assertEqual(self.storage.get_supplies(), {'Blankets': 8})
+
+    def test_remove_supplies(self):
+        self.storage.add_supplies('water', 10)
+        self.storage.remove_supplies('water', 10)
+        self.assertEqual(self.storage.get_supplies(), {})
+        with self.assertRaises(ValueError):
+            self.storage.remove_supplies('water', 1)
+
+    def test_reserve_supplies_is_all_or_nothing(self):
+        self.storage.add_supplies('water', 5)
+        self.storage.add_supplies('food', 2)
+        with self.assertRaises(ValueError):
+            self.storage.reserve_supplies({'water': 3, 'food': 4})
+        self.assertEqual(self.storage.get_supplies(), {'water': 5, 'food': 2})
+        self.storage.reserve_supplies({'water': 3, 'food': 2})
+        self.assertEqual(self.storage.get_supplies(), {'water': 2})
+        self.storage.release_supplies({'FOOD': 2})
+        self.assertEqual(self.storage.check_inventory('food'), 2)
+
+    def test_reports_and_requesters(self):
+        self.storage.add_report('Ana', 'flood', 'river overflow')
+        self.storage.add_report('Ana', 'fire', 'smoke')
+        self.assertEqual([r['disaster_type'] for r in self.storage.get_reports()], ['flood', 'fire'])
+        self.assertEqual(self.storage.requesters, ['Ana'])
+        self.assertTrue(self.storage.delete_report(1))
+        self.assertFalse(self.storage.delete_report(5))
+        self.assertEqual([r['disaster_type'] for r in self.storage.get_reports()], ['fire'])
+
+    def test_pending_locations(self):
+        query = {'street': 'Main St', 'city': 'Hamilton'}
+        first = self.storage.add_report('Ana', 'flood', 'x', location_query=query)
+        second = self.storage.add_report('Ana', 'fire', 'y', location_query=query)
+        self.assertTrue(self.storage.set_report_location(first, 43.25, -79.87, 'Hamilton'))
+        self.assertTrue(self.storage.set_report_location(second, None, None))
+        self.assertFalse(self.storage.set_report_location(99, None, None))
+        self.assertEqual(self.storage.pending_location_reports(), [])
+        self.assertEqual(self.storage.get_report(first)['location_status'], 'resolved')
+        self.assertEqual(self.storage.get_report(second)['location_status'], 'not_found')
+
+    def test_bulk_add_requesters(self):
+        self.assertEqual(self.storage.bulk_add_requesters(['Ana', ' ana ', 'Ben']), 2)
+        self.storage.add_requester('BEN')
+        self.assertEqual(self.storage.requesters, ['Ana', 'Ben'])
+
+    def test_requester_cap(self):
+        storage = SqliteStorage(':memory:', max_requesters=2)
+        storage.bulk_add_requesters(['a', 'b', 'c'])
+        self.assertEqual(storage.requesters, ['b', 'c'])
+        storage.close()
+
+    def test_query_reports_pages_and_filters(self):
+        for i in range(5):
+            self.storage.add_report('Ana' if i < 3 else 'Ben', 'flood' if i % 2 else 'fire', f'r{i}', lat=i, lon=i)
+        seen, cursor = [], None
+        while True:
+            page, cursor = self.storage.query_reports(cursor=cursor, limit=2, newest_first=True)
+            seen.extend(r['details'][:2] for r in page)
+            if cursor is None:
+                break
+        self.assertEqual(seen, ['r4', 'r3', 'r2', 'r1', 'r0'])
+        page, _ = self.storage.query_reports(reporter='ben', disaster_type='FLOOD')
+        self.assertEqual([r['details'][:2] for r in page], ['r3'])
+        page, cursor = self.storage.query_reports(bbox=(1, 1, 3, 3), limit=2)
+        self.assertEqual([r['details'][:2] for r in page], ['r1', 'r2'])
+        page, cursor = self.storage.query_reports(bbox=(1, 1, 3, 3), limit=2, cursor=cursor)
+        self.assertEqual(([r['details'][:2] for r in page], cursor), (['r3'], None))
+
+class TestSqliteStorageFile(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'storage.db')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_concurrent_removals_never_oversell(self):
+        storage = SqliteStorage(self.path)
+        storage.add_supplies('food', 50)
+        failures = []
+
+        def worker():
+            other = SqliteStorage(self.path)
+            for _ in range(10):
+                try:
+                    other.remove_supplies('food', 1)
+                except ValueError:
+                    failures.append(1)
+            other.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(storage.check_inventory('food'), 0)
+        self.assertEqual(len(failures), 30)
+        storage.close()
+
+    def test_legacy_database_is_migrated(self):
+        conn = sqlite3.connect(self.path)
+        conn.executescript("""
+            CREATE TABLE reports (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL,
+                                  disaster_type TEXT NOT NULL, details TEXT NOT NULL, timestamp TEXT NOT NULL);
+            INSERT INTO reports (name, disaster_type, details, timestamp)
+            VALUES ('a', 'flood', 'rising | location_resolved: Hamilton | lat:43.25 lon:-79.87', '2025-01-01');
+        """)
+        conn.commit()
+        conn.close()
+        storage = SqliteStorage(self.path)
+        report = storage.get_report(1)
+        self.assertEqual((report['details'], report['resolved_address']), ('rising', 'Hamilton'))
+        self.assertEqual([r['id'] for r in storage.reports_in_area(43, -80, 44, -79)], [1])
+        storage.close()
+
+    def test_create_storage_selects_backend(self):
+        self.assertIsInstance(create_storage('sqlite', self.path), SqliteStorage)
+        self.assertIsInstance(create_storage('json', os.path.join(self.tmpdir.name, 's.json')), Storage)
+        with self.assertRaises(ValueError):
+            create_storage('mongo', self.path)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,12 @@
+import os
+import json
+import tempfile
 import unittest
-from src.storage import Storage
+import multiprocessing
+import threading
+import time
+from unittest import mock
+from src.storage import Storage, encode_cursor
 
 class TestStorage(unittest.TestCase):
     def setUp(self):
@@ -27,5 +34,279 @@ class TestStorage(unittest.TestCase):
         with self.assertRaises(ValueError):
             self.storage.remove_supplies('bandages', 20)
 
+    def test_reserve_supplies_is_all_or_nothing(self):
+        self.storage.add_supplies('water', 5)
+        self.storage.add_supplies('food', 2)
+        with self.assertRaises(ValueError):
+            self.storage.reserve_supplies({'water': 3, 'food': 4})
+        self.assertEqual(self.storage.get_supplies(), {'water': 5, 'food': 2})
+        self.storage.reserve_supplies({'Water': 3, 'food': 2})
+        self.assertEqual(self.storage.get_supplies(), {'water': 2})
+        self.storage.release_supplies({'food': 2})
+        self.assertEqual(self.storage.check_inventory('food'), 2)
+
+    def test_lookup_is_case_insensitive(self):
+        self.storage.add_supplies('Blankets', 5)
+        self.storage.add_supplies('blankets', 2)
+        self.assertEqual(self.storage.check_inventory('BLANKETS'), 7)
+        self.storage.remove_supplies('blankets', 7)
+        self.assertEqual(self.storage.get_supplies(), {})
+        self.storage.add_supplies('blankets', 1)
+        self.assertEqual(self.storage.get_supplies(), {'blankets': 1})
+
+    def test_load_merges_mixed_case_entries(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'storage.json')
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump({'supplies': {'Blankets': 7, 'blankets': 3, 'food': 1}}, f)
+            storage = Storage(path)
+            self.assertEqual(storage.get_supplies(), {'Blankets': 10, 'food': 1})
+            self.assertEqual(storage.check_inventory('blankets'), 10)
+
+    def test_requesters_are_normalized_and_unique(self):
+        self.storage.add_requester('  Ana   Silva ')
+        self.storage.add_requester('ana silva')
+        self.storage.add_report('Ben', 'fire', 'smoke')
+        self.assertEqual(self.storage.requesters, ['Ana Silva', 'Ben'])
+        self.assertTrue(self.storage.has_requester('ANA SILVA'))
+
+    def test_bulk_add_requesters_saves_once(self):
+        saves = []
+        self.storage._save = lambda: saves.append(1) or True
+        added = self.storage.bulk_add_requesters(['Ana', 'ben', 'Ben', '', 'Cleo'])
+        self.assertEqual(added, 3)
+        self.assertEqual(self.storage.requesters, ['Ana', 'ben', 'Cleo'])
+        self.assertEqual(len(saves), 1)
+
+    def test_requester_cap_rotates_out_oldest(self):
+        storage = Storage(max_requesters=2)
+        storage.bulk_add_requesters(['a', 'b', 'c'])
+        storage.add_requester('d')
+        self.assertEqual(storage.requesters, ['c', 'd'])
+
+    def test_report_ids_are_stable_across_deletes(self):
+        first = self.storage.add_report('Ana', 'flood', 'a')
+        second = self.storage.add_report('Ana', 'fire', 'b')
+        self.assertTrue(self.storage.delete_report(first))
+        self.assertFalse(self.storage.delete_report(first))
+        third = self.storage.add_report('Ben', 'storm', 'c')
+        self.assertEqual((first, second, third), (1, 2, 3))
+        self.assertEqual([r['id'] for r in self.storage.get_reports()], [2, 3])
+        self.assertEqual(self.storage.get_report(3)['disaster_type'], 'storm')
+        self.assertIsNone(self.storage.get_report(1))
+
+    def test_tombstones_are_compacted(self):
+        ids = [self.storage.add_report('Ana', 'flood', str(i)) for i in range(100)]
+        for report_id in ids[:60]:
+            self.storage.delete_report(report_id)
+        self.assertLess(len(self.storage._reports), 100)
+        self.assertEqual([r['id'] for r in self.storage.get_reports()], ids[60:])
+
+    def test_legacy_reports_get_ids_on_load(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'storage.json')
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump({'supplies': {}, 'reports': [
+                    {'name': 'b', 'disaster_type': 'fire', 'details': '', 'timestamp': '2025-02-01T00:00:00Z'},
+                    {'name': 'a', 'disaster_type': 'flood', 'details': '', 'timestamp': '2025-01-01T00:00:00Z'},
+                ]}, f)
+            storage = Storage(path)
+            self.assertEqual([(r['id'], r['name']) for r in storage.get_reports()], [(1, 'a'), (2, 'b')])
+            storage.delete_report(2)
+            self.assertEqual(Storage(path).add_report('c', 'storm', ''), 3)
+
+    def test_packed_locations_are_migrated_once(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'storage.json')
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump({'supplies': {}, 'reports': [
+                    {'id': 1, 'name': 'a', 'disaster_type': 'flood', 'timestamp': '2025-01-01T00:00:00Z',
+                     'details': 'water rising | location_resolved: Hamilton, Canada | lat:43.25 lon:-79.87'},
+                    {'id': 2, 'name': 'b', 'disaster_type': 'fire', 'timestamp': '2025-01-02T00:00:00Z',
+                     'details': 'no address given'},
+                ]}, f)
+            Storage(path)
+            with open(path, encoding='utf-8') as f:
+                saved = json.load(f)['reports']
+            self.assertEqual(saved[0]['details'], 'water rising')
+            self.assertEqual(saved[0]['resolved_address'], 'Hamilton, Canada')
+            self.assertEqual((saved[0]['lat'], saved[0]['lon']), (43.25, -79.87))
+            self.assertIsNone(saved[1]['lat'])
+
+    def test_timestamps_follow_id_order_under_concurrency(self):
+        ticks = iter(range(100))
+        with mock.patch('src.storage.report_timestamp', lambda: f"2025-01-01T00:00:{next(ticks):02d}Z"):
+            # a writer that built its report before another one took the lock must not end up
+            # with a later id but an earlier timestamp
+            with self.storage._lock:
+                writer = threading.Thread(target=self.storage.add_report, args=('Ana', 'flood', 'late'))
+                writer.start()
+                time.sleep(0.05)
+                self.storage.add_report('Ben', 'fire', 'early')
+            writer.join()
+        reports = sorted(self.storage.get_reports(), key=lambda r: r['id'])
+        self.assertEqual([r['details'] for r in reports], ['early', 'late'])
+        self.assertLess(reports[0]['timestamp'], reports[1]['timestamp'])
+
+    def test_reports_in_area(self):
+        inside = self.storage.add_report('a', 'flood', 'x', lat=43.2, lon=-79.9, resolved_address='Hamilton')
+        self.storage.add_report('b', 'flood', 'y', lat=49.3, lon=-123.1)
+        self.storage.add_report('c', 'flood', 'no location')
+        removed = self.storage.add_report('d', 'fire', 'z', lat=43.3, lon=-79.8)
+        self.storage.delete_report(removed)
+        found = self.storage.reports_in_area(42, -81, 44, -79)
+        self.assertEqual([r['id'] for r in found], [inside])
+
+
+class TestStorageQueryReports(unittest.TestCase):
+    def setUp(self):
+        self.storage = Storage()
+        for i in range(7):
+            dtype = 'flood' if i % 2 == 0 else 'fire'
+            self.storage.add_report(f'user{i % 3}', dtype, f'report {i}', lat=i, lon=-i, resolved_address='X')
+        for i, report in enumerate(self.storage.reports):
+            report['timestamp'] = f'2025-01-01T00:00:0{i}Z'
+        # give two reports the same timestamp to exercise cursor tie-breaking
+        self.storage.reports[3]['timestamp'] = self.storage.reports[2]['timestamp']
+
+    def _collect(self, **filters):
+        seen, cursor = [], None
+        while True:
+            page, cursor = self.storage.query_reports(cursor=cursor, limit=2, **filters)
+            seen.extend(r['details'] for r in page)
+            if cursor is None:
+                return seen
+
+    def test_pages_cover_every_report_once(self):
+        self.assertEqual(self._collect(), [f'report {i}' for i in range(7)])
+        self.assertEqual(self._collect(newest_first=True), [f'report {i}' for i in reversed(range(7))])
+
+    def test_filters(self):
+        self.assertEqual(self._collect(disaster_type='FIRE'), ['report 1', 'report 3', 'report 5'])
+        self.assertEqual(self._collect(reporter='user0'), ['report 0', 'report 3', 'report 6'])
+        self.assertEqual(self._collect(bbox=(1.5, -4.5, 4.5, 0)), ['report 2', 'report 3', 'report 4'])
+        since = self.storage.reports[4]['timestamp']
+        until = self.storage.reports[6]['timestamp']
+        self.assertEqual(self._collect(since=since, until=until), ['report 4', 'report 5'])
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(ValueError):
+            self.storage.query_reports(cursor='not-a-cursor')
+        # well-formed JSON, but the id is not a number
+        for position in ({'id': [1]}, {'id': '3'}, {'id': True}, {}):
+            with self.assertRaises(ValueError):
+                self.storage.query_reports(cursor=encode_cursor(position))
+            with self.assertRaises(ValueError):
+                self.storage.query_reports(cursor=encode_cursor(position), bbox=(0, 0, 1, 1))
+
+class TestStorageJournal(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'storage.json')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_mutations_replayed_from_log(self):
+        storage = Storage(self.path, journal=True)
+        storage.add_supplies('water', 10)
+        storage.remove_supplies('water', 4)
+        storage.reserve_supplies({'water': 2})
+        storage.release_supplies({'water': 1})
+        storage.add_report('Ana', 'flood', 'basement flooded')
+        storage.delete_report(storage.add_report('Ana', 'fire', 'typo'))
+        # nothing has been snapshotted yet; state lives in the log
+        self.assertFalse(os.path.exists(self.path))
+
+        reloaded = Storage(self.path, journal=True)
+        self.assertEqual(reloaded.check_inventory('water'), 5)
+        self.assertEqual(len(reloaded.get_reports()), 1)
+        self.assertEqual(reloaded.requesters, ['Ana'])
+
+    def test_pending_locations_survive_restart(self):
+        storage = Storage(self.path, journal=True)
+        query = {'street': 'Main St', 'city': 'Hamilton', 'country': 'Canada'}
+        first = storage.add_report('Ana', 'flood', 'x', location_query=query)
+        second = storage.add_report('Ana', 'fire', 'y', location_query=query)
+        storage.add_report('Ana', 'fire', 'no address', location_query={'street': '', 'city': ''})
+        storage.set_report_location(first, 43.25, -79.87, 'Main St, Hamilton')
+
+        reloaded = Storage(self.path, journal=True)
+        self.assertEqual([(r['id'], r['location_query']) for r in reloaded.pending_location_reports()],
+                         [(second, query)])
+        resolved = reloaded.get_report(first)
+        self.assertEqual((resolved['location_status'], resolved['lat']), ('resolved', 43.25))
+        self.assertNotIn('location_query', resolved)
+        self.assertEqual([r['id'] for r in reloaded.reports_in_area(43, -80, 44, -79)], [first])
+
+    def test_add_reports_is_one_log_record(self):
+        storage = Storage(self.path, journal=True)
+        ids = storage.add_reports([{'name': 'Ana', 'disaster_type': 'flood', 'details': 'x'},
+                                   {'name': 'Ben', 'disaster_type': 'fire', 'details': 'y', 'lat': 1, 'lon': 2}])
+        with open(self.path + '.log', encoding='utf-8') as f:
+            self.assertEqual(len(f.readlines()), 1)
+        reloaded = Storage(self.path, journal=True)
+        self.assertEqual([r['id'] for r in reloaded.get_reports()], ids)
+        self.assertEqual(reloaded.requesters, ['Ana', 'Ben'])
+
+    def test_compaction_writes_snapshot_and_truncates_log(self):
+        storage = Storage(self.path, journal=True, compact_threshold=3)
+        for _ in range(3):
+            storage.add_supplies('food', 5)
+        with open(self.path, encoding='utf-8') as f:
+            self.assertEqual(json.load(f)['supplies'], {'food': 15})
+        self.assertEqual(os.path.getsize(self.path + '.log'), 0)
+
+        storage.add_supplies('food', 1)
+        self.assertEqual(Storage(self.path, journal=True).check_inventory('food'), 16)
+
+    def test_records_already_in_snapshot_are_not_reapplied(self):
+        storage = Storage(self.path, journal=True)
+        storage.add_supplies('blankets', 2)
+        # simulate a crash between writing the snapshot and truncating the log
+        storage._save()
+        self.assertEqual(Storage(self.path, journal=True).check_inventory('blankets'), 2)
+
+def _remove_one_at_a_time(path, journal, count):
+    storage = Storage(path, journal=journal, shared=True)
+    for _ in range(count):
+        storage.remove_supplies('water', 1)
+        storage.add_report('worker', 'flood', 'x')
+
+class TestStorageShared(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'storage.json')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _run_workers(self, journal):
+        Storage(self.path, journal=journal, shared=True).add_supplies('water', 40)
+        procs = [multiprocessing.Process(target=_remove_one_at_a_time, args=(self.path, journal, 10))
+                 for _ in range(4)]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+            self.assertEqual(p.exitcode, 0)
+        reloaded = Storage(self.path, journal=journal)
+        self.assertEqual(reloaded.check_inventory('water'), 0)
+        self.assertEqual(len(reloaded.get_reports()), 40)
+
+    def test_processes_do_not_lose_updates(self):
+        self._run_workers(journal=False)
+
+    def test_processes_do_not_lose_updates_journaled(self):
+        self._run_workers(journal=True)
+
+    def test_reads_pick_up_changes_from_other_instances(self):
+        first = Storage(self.path, shared=True)
+        second = Storage(self.path, shared=True)
+        first.add_supplies('food', 3)
+        self.assertEqual(second.check_inventory('food'), 3)
+        second.remove_supplies('food', 1)
+        self.assertEqual(first.get_supplies(), {'food': 2})
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
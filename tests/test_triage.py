@@ -0,0 +1,31 @@
+import unittest
+from src.triage import benchmark, scan
+
+
+class TestTriage(unittest.TestCase):
+    def test_all_signals_in_one_pass(self):
+        signals = scan("My dad Joe passed away due to the flood. When did the fire start? I want to die")
+        self.assertTrue(signals.crisis)
+        self.assertEqual(signals.disasters, ['flood', 'fire'])
+        self.assertEqual(signals.losses, [('dad', 'joe')])
+        self.assertEqual(signals.cause, 'the flood')
+        self.assertTrue(signals.time_question)
+        self.assertEqual(signals.time_subject, 'dad')
+
+    def test_quiet_message(self):
+        signals = scan("We need blankets and water at the shelter, I blame myself for waiting.")
+        self.assertEqual(signals.as_dict(), {'crisis': False, 'disasters': [], 'losses': [], 'cause': None,
+                                             'time_question': False, 'time_subject': None})
+
+    def test_losses_without_names_and_repeated_disasters(self):
+        signals = scan("Our pet died in a storm, then another storm hit. my sister Ana lost")
+        self.assertEqual(signals.losses, [('pet', ''), ('sister', 'ana')])
+        self.assertEqual(signals.disasters, ['storm'])
+        self.assertEqual(signals.cause, 'storm')
+
+    def test_benchmark_runs(self):
+        self.assertEqual(set(benchmark(12)), {'separate passes', 'scan'})
+
+
+if __name__ == '__main__':
+    unittest.main()